@@ -5,7 +5,24 @@ from bot.dataclasses import Session, CompleteSession
 # Global constants
 START_CODE = "#START"
 STOP_CODE = "#STOP"
+TASK_CODE = "#TASK:"
+PAGE_CODE = "#PAGE:"
 ISWORKING = "Who is working ?"
 SUMMARY = "Summary"
 TIMELINE = "See timeline"
 LOAD_TASKS = "Upload tasks"
+PREVIOUS_PAGE = "« Previous"
+NEXT_PAGE = "Next »"
+TASKS_PER_PAGE = 10
+TASKS_COLUMNS = 1
+REPORTS = {
+    "Time per task": "tasks",
+    "Time per week": "week",
+    "Time per month": "month",
+    "Estimates vs actual": "workload",
+}
+TIMELINE_WINDOWS = {
+    "Last 7 days": 7,
+    "Last 30 days": 30,
+    "All time": None,
+}
@@ -2,33 +2,36 @@
 
 import os
 import logging
-from dotenv import load_dotenv
+import threading
 
+from telegram.utils.request import Request
 from telegram.ext import (
     Updater,
+    ChatMemberHandler,
     CommandHandler,
     MessageHandler,
     Filters,
     CallbackQueryHandler,
 )
 
+from bot.concurrency import ChatOrderedExecutor
+from bot.config import get_webhook_options, load_environment
 from bot.handlers import BotHandler
+from bot.handlers.show_data import warm_up
 from bot.logging import init_logger
+from bot.outbound import GLOBAL_RATE, OutboundQueue, QueuedBot
 
-if __name__ == "__main__":
-    init_logger(logging.INFO, __package__)
 
-    dotenv_path = ".env"
-    if os.path.isfile(dotenv_path):
-        load_dotenv(dotenv_path)
+def build_handlers(bot: BotHandler) -> tuple:
+    """Build the telegram handlers of all the bot interactions.
 
-    key = os.environ.get("BOT_KEY")
+    Args:
+        bot (BotHandler): The global Bot handling users interactions.
 
-    updater = Updater(key)
-    dispatcher = updater.dispatcher
-    bot = BotHandler(db_path="timerbot.db")
-
-    handlers = (
+    Returns:
+        tuple: Handlers to add to the dispatcher, in priority order.
+    """
+    return (
         CommandHandler("start", bot.start),
         CommandHandler("stop", bot.stop),
         CommandHandler("tasks", bot.load_task),
@@ -39,11 +42,73 @@ if __name__ == "__main__":
         ),
         MessageHandler(Filters.document.file_extension("yaml"), bot.yamlHandler),
         CallbackQueryHandler(bot.queryHandler),
+        ChatMemberHandler(bot.my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER),
         MessageHandler(Filters.command, bot.unknown),
     )
 
-    for handler in handlers:
+
+def start_updater(updater: Updater, key: str):
+    """Start fetching updates by polling or through a webhook.
+
+    The webhook mode is enabled by setting BOT_MODE to "webhook" and configured
+    by the WEBHOOK_* environment variables.
+
+    Args:
+        updater (Updater): Updater to start.
+        key (str): Token of the bot, used as default secret webhook path.
+
+    Raises:
+        ValueError: If the webhook mode is enabled without WEBHOOK_URL.
+    """
+    options = get_webhook_options(key)
+    if options is None:
+        updater.start_polling()
+    else:
+        updater.start_webhook(**options)
+
+
+if __name__ == "__main__":
+    init_logger(logging.INFO, __package__)
+
+    key = load_environment()
+    durable_writes = os.environ.get("DURABLE_WRITES", "0") == "1"
+    concurrent_workers = int(os.environ.get("CONCURRENT_WORKERS", "0"))
+
+    workers = int(os.environ.get("BOT_WORKERS", "4"))
+    outbound_workers = int(os.environ.get("OUTBOUND_WORKERS", "4"))
+    outbound = OutboundQueue(
+        global_rate=float(os.environ.get("OUTBOUND_GLOBAL_RATE", GLOBAL_RATE)),
+        workers=outbound_workers,
+    )
+    # Every thread sending requests needs its own pooled connection.
+    request = Request(con_pool_size=workers + concurrent_workers + outbound_workers + 4)
+    updater = Updater(
+        bot=QueuedBot(key, queue=outbound, request=request), workers=workers
+    )
+    dispatcher = updater.dispatcher
+    bot = BotHandler(
+        db_path="timerbot.db",
+        durable_writes=durable_writes,
+        timeline_cdn=os.environ.get("TIMELINE_CDN", "0") == "1",
+    )
+
+    executor = None
+    if concurrent_workers > 0:
+        executor = ChatOrderedExecutor(concurrent_workers)
+
+    for handler in build_handlers(bot):
+        if executor is not None:
+            handler.callback = executor.wrap(handler.callback)
         dispatcher.add_handler(handler)
 
-    updater.start_polling()
-    updater.idle()
+    try:
+        start_updater(updater, key)
+        # Load the analytics stack while commands are already being served.
+        threading.Thread(target=warm_up, name="WarmUp", daemon=True).start()
+        updater.idle()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        outbound.close()
+        # Flush sessions still queued for writing before exiting.
+        bot.close()
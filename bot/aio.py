@@ -0,0 +1,197 @@
+""" Asyncio entry point of the bot, running on python-telegram-bot 20 or later. """
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from bot.config import get_webhook_options, load_environment
+from bot.handlers import BotHandler
+from bot.logging import get_logger, init_logger
+from bot.steps import get_steps_function, run_steps_async
+
+LOGGER = get_logger(__name__)
+
+
+class ChatLocks:
+    """Asyncio locks by chat, keeping the updates of a chat in order.
+
+    Locks are created on demand and dropped once no update of their chat is
+    pending.
+    """
+
+    def __init__(self) -> None:
+        self._locks: Dict[Hashable, Tuple[asyncio.Lock, int]] = {}
+
+    async def run(self, key: Hashable, coroutine_fn: Callable[[], Awaitable]) -> Any:
+        """Run a coroutine after those previously started with the same key.
+
+        Args:
+            key (Hashable): Ordering key, usually the chat id.
+            coroutine_fn (Callable[[], Awaitable]): Function creating the coroutine.
+
+        Returns:
+            Any: Result of the coroutine.
+        """
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                return await coroutine_fn()
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+
+class AsyncRunner:
+    """Run handler steps on the event loop, see `bot.steps`.
+
+    Requests to Telegram are awaited on the event loop, only database calls
+    and other blocking steps are run in threads.
+
+    Args:
+        workers (int, optional): Number of threads running blocking steps.
+            Defaults to 32.
+    """
+
+    def __init__(self, workers: int = 32) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="Blocking"
+        )
+        self.chat_locks = ChatLocks()
+
+    def wrap(self, callback: Callable[[Any, Any], Any]) -> Callable:
+        """Make an asynchronous handler callback from a handler of the bot.
+
+        Args:
+            callback (Callable[[Any, Any], Any]): Handler callback taking an
+                update and a context, made of steps or doing no I/O at all.
+
+        Returns:
+            Callable: Coroutine function taking an update and a context.
+        """
+        steps_fn = get_steps_function(callback)
+
+        @functools.wraps(callback)
+        async def run_callback(update, context):
+            chat = update.effective_chat
+
+            async def run():
+                if steps_fn is None:
+                    return callback(update, context)
+                return await run_steps_async(steps_fn(update, context), self.executor)
+
+            await self.chat_locks.run(chat.id if chat is not None else None, run)
+
+        return run_callback
+
+    def shutdown(self, wait: bool = True):
+        """Stop the threads running blocking steps.
+
+        Args:
+            wait (bool, optional): Whether to wait for running steps.
+                Defaults to True.
+        """
+        self.executor.shutdown(wait=wait)
+
+
+def build_application(key: str, bot: BotHandler, runner: AsyncRunner):
+    """Build the python-telegram-bot application serving all bot interactions.
+
+    Args:
+        key (str): Token of the bot.
+        bot (BotHandler): The global Bot handling users interactions.
+        runner (AsyncRunner): Runner of the handler steps.
+
+    Returns:
+        telegram.ext.Application: Application to run.
+    """
+    # pylint: disable=import-outside-toplevel
+    from telegram.ext import (
+        ApplicationBuilder,
+        CallbackQueryHandler,
+        ChatMemberHandler,
+        CommandHandler,
+        MessageHandler,
+        filters,
+    )
+
+    # No job is scheduled, the job queue would need an event loop to be built.
+    builder = (
+        ApplicationBuilder().token(key).concurrent_updates(True).job_queue(None)
+    )
+    try:
+        from telegram.ext import AIORateLimiter
+
+        builder = builder.rate_limiter(AIORateLimiter())
+    except (ImportError, RuntimeError):
+        LOGGER.warning(
+            "Install python-telegram-bot[rate-limiter] to respect flood limits"
+        )
+    application = builder.build()
+
+    text_filter = (
+        filters.TEXT & (~filters.FORWARDED) & (~filters.UpdateType.EDITED_MESSAGE)
+    )
+    application.add_handlers(
+        [
+            CommandHandler("start", runner.wrap(bot.start)),
+            CommandHandler("stop", runner.wrap(bot.stop)),
+            CommandHandler("tasks", runner.wrap(bot.load_task)),
+            CommandHandler("data", runner.wrap(bot.data_menu)),
+            MessageHandler(text_filter, runner.wrap(bot.textHandler)),
+            MessageHandler(
+                filters.Document.FileExtension("yaml"), runner.wrap(bot.yamlHandler)
+            ),
+            CallbackQueryHandler(runner.wrap(bot.queryHandler)),
+            ChatMemberHandler(
+                runner.wrap(bot.my_chat_member), ChatMemberHandler.MY_CHAT_MEMBER
+            ),
+            MessageHandler(filters.COMMAND, runner.wrap(bot.unknown)),
+        ]
+    )
+    return application
+
+
+def run_application(application, key: str):
+    """Run the application by polling or through a webhook until stopped.
+
+    Configured by the same environment variables as the threaded runtime.
+
+    Args:
+        application (telegram.ext.Application): Application to run.
+        key (str): Token of the bot, used as default secret webhook path.
+
+    Raises:
+        ValueError: If the webhook mode is enabled without WEBHOOK_URL.
+    """
+    options = get_webhook_options(key)
+    if options is None:
+        application.run_polling()
+    else:
+        application.run_webhook(**options)
+
+
+if __name__ == "__main__":
+    init_logger(logging.INFO, __package__)
+
+    key = load_environment()
+    bot = BotHandler(
+        db_path="timerbot.db",
+        durable_writes=os.environ.get("DURABLE_WRITES", "0") == "1",
+        timeline_cdn=os.environ.get("TIMELINE_CDN", "0") == "1",
+    )
+    runner = AsyncRunner(int(os.environ.get("AIO_WORKERS", "32")))
+    try:
+        run_application(build_application(key, bot, runner), key)
+    finally:
+        runner.shutdown()
+        # Flush sessions still queued for writing before exiting.
+        bot.close()
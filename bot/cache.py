@@ -0,0 +1,167 @@
+""" Module for in-process caches. """
+
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe least recently used cache counting its hits and misses.
+
+    Args:
+        maxsize (int, optional): Maximum number of entries kept. Defaults to 128.
+        maxbytes (Optional[int], optional): Maximum total length of the values
+            kept, for caches of bytes or strings. Defaults to None for no limit.
+    """
+
+    def __init__(self, maxsize: int = 128, maxbytes: Optional[int] = None) -> None:
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Bumped on invalidation so values computed meanwhile are not stored.
+        self._generation = 0
+
+    def _lookup(self, key: Hashable) -> Any:
+        # Must be called with the lock held.
+        if key not in self._entries:
+            return _MISSING
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def _size(self, entry: Any) -> int:
+        return len(entry) if self.maxbytes is not None else 0
+
+    def _pop(self, key: Hashable):
+        # Must be called with the lock held.
+        entry = self._entries.pop(key, _MISSING)
+        if entry is not _MISSING:
+            self._bytes -= self._size(entry)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get the value of a key.
+
+        Args:
+            key (Hashable): Key of the entry.
+            default (Any, optional): Value returned on a miss. Defaults to None.
+
+        Returns:
+            Any: Cached value or default.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Get the value of a key, computing and storing it on a miss.
+
+        Args:
+            key (Hashable): Key of the entry.
+            compute (Callable[[], Any]): Function computing the value on a miss.
+
+        Returns:
+            Any: Cached or computed value.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            generation = self._generation
+        value = compute()
+        with self._lock:
+            if generation == self._generation:
+                self.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store the value of a key, evicting the least recently used if full.
+
+        Values larger than maxbytes on their own are not stored.
+
+        Args:
+            key (Hashable): Key of the entry.
+            value (Any): Value to store.
+        """
+        with self._lock:
+            self._pop(key)
+            size = self._size(value)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._entries[key] = value
+            self._bytes += size
+            while len(self._entries) > self.maxsize or (
+                self.maxbytes is not None and self._bytes > self.maxbytes
+            ):
+                self._pop(next(iter(self._entries)))
+
+    def invalidate(self, key: Hashable):
+        """Remove the entry of a key if present.
+
+        Args:
+            key (Hashable): Key of the entry.
+        """
+        with self._lock:
+            self._generation += 1
+            self._pop(key)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self) -> dict:
+        """Get statistics about the cache usage.
+
+        Returns:
+            dict: Hits, misses, current size and maximum size of the cache, in
+                entries and in bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "maxbytes": self.maxbytes,
+            }
+
+
+class TTLCache(LRUCache):
+    """Least recently used cache whose entries expire after a fixed time.
+
+    Args:
+        ttl (float): Time to live of the entries in seconds.
+        maxsize (int, optional): Maximum number of entries kept. Defaults to 1024.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024) -> None:
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = super()._lookup(key)
+        if entry is _MISSING:
+            return _MISSING
+        expires, value = entry
+        if expires <= time.monotonic():
+            self._pop(key)
+            return _MISSING
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        super().set(key, (time.monotonic() + self.ttl, value))
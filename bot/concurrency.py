@@ -0,0 +1,92 @@
+""" Module for concurrent processing of telegram updates. """
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+from typing import Callable, Deque, Dict, Hashable
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from bot.logging import get_logger
+
+LOGGER = get_logger(__name__)
+
+
+class ChatOrderedExecutor:
+    """Worker pool running updates of different chats concurrently.
+
+    Updates of a same chat are queued and run one after the other in their
+    arrival order, so a slow update only delays the following ones of its
+    own chat.
+
+    Args:
+        workers (int): Number of worker threads.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="ChatWorker"
+        )
+        self._pending: Dict[Hashable, Deque[Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """Run a function after every function previously submitted with the same key.
+
+        Args:
+            key (Hashable): Ordering key, usually the chat id.
+            fn (Callable): Function to run.
+        """
+        task = functools.partial(fn, *args, **kwargs)
+        with self._lock:
+            if key in self._pending:
+                self._pending[key].append(task)
+                return
+            self._pending[key] = deque([task])
+        self._pool.submit(self._drain, key)
+
+    def _drain(self, key: Hashable):
+        while True:
+            with self._lock:
+                tasks = self._pending[key]
+                if not tasks:
+                    del self._pending[key]
+                    return
+                task = tasks[0]
+            try:
+                task()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Error while processing update of chat %s", key)
+            with self._lock:
+                tasks.popleft()
+
+    def wrap(
+        self, callback: Callable[[Update, CallbackContext], None]
+    ) -> Callable[[Update, CallbackContext], None]:
+        """Make a handler callback run in the pool, ordered by chat.
+
+        Args:
+            callback (Callable[[Update, CallbackContext], None]): Handler callback.
+
+        Returns:
+            Callable[[Update, CallbackContext], None]: Callback submitting the
+                update to the pool.
+        """
+
+        @functools.wraps(callback)
+        def submit_update(update: Update, context: CallbackContext):
+            chat = update.effective_chat
+            self.submit(chat.id if chat is not None else None, callback, update, context)
+
+        return submit_update
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting updates and wait for pending ones if asked.
+
+        Args:
+            wait (bool, optional): Whether to wait for pending updates.
+                Defaults to True.
+        """
+        self._pool.shutdown(wait=wait)
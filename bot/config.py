@@ -0,0 +1,52 @@
+""" Module for the configuration from the environment, shared by both runtimes. """
+
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+def load_environment(dotenv_path: str = ".env") -> Optional[str]:
+    """Load the environment variables of a dotenv file, if it exists.
+
+    Args:
+        dotenv_path (str, optional): Path to the dotenv file. Defaults to ".env".
+
+    Returns:
+        Optional[str]: Token of the bot, read from BOT_KEY.
+    """
+    if os.path.isfile(dotenv_path):
+        load_dotenv(dotenv_path)
+    return os.environ.get("BOT_KEY")
+
+
+def get_webhook_options(key: str) -> Optional[dict]:
+    """Read the webhook options from the environment.
+
+    The webhook mode is enabled by setting BOT_MODE to "webhook" and configured
+    by the WEBHOOK_* environment variables.
+
+    Args:
+        key (str): Token of the bot, used as default secret webhook path.
+
+    Raises:
+        ValueError: If the webhook mode is enabled without WEBHOOK_URL.
+
+    Returns:
+        Optional[dict]: Keyword arguments starting the webhook, None to poll.
+    """
+    if os.environ.get("BOT_MODE", "polling") != "webhook":
+        return None
+
+    url_path = os.environ.get("WEBHOOK_PATH", key)
+    webhook_url = os.environ.get("WEBHOOK_URL")
+    if not webhook_url:
+        # Telegram would be given the address of the local listener instead.
+        raise ValueError("WEBHOOK_URL must be set when BOT_MODE is webhook")
+    return {
+        "listen": os.environ.get("WEBHOOK_LISTEN", "0.0.0.0"),
+        "port": int(os.environ.get("WEBHOOK_PORT", "8443")),
+        "url_path": url_path,
+        "webhook_url": f"{webhook_url.rstrip('/')}/{url_path}",
+        "max_connections": int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40")),
+    }
@@ -1,15 +1,32 @@
 """ Module for handling the database requests. """
 
-import argparse
-from datetime import datetime
-import os
+from datetime import datetime, timedelta
+import json
+import threading
 
 import sqlite3
-from typing import List, Tuple
-import pandas as pd
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from bot import CompleteSession
-from bot.tasks import parse_tasks, read_tasks
+from bot.cache import LRUCache
+from bot.logging import get_logger
+from bot.tasks import TaskNavigator, parse_tasks, read_tasks
+
+if TYPE_CHECKING:
+    # Loaded on first use only, most updates never need it.
+    import pandas as pd
+
+LOGGER = get_logger(__name__)
 
 TABLES = {
     "sessions": {
@@ -33,6 +50,80 @@ TABLES = {
     },
 }
 
+# Tables derived from the others, maintained incrementally and never dumped.
+DERIVED_TABLES = {
+    "summaries": {
+        "project": {"dtype": "TINYTEXT", "optional": False},
+        "username": {"dtype": "TINYTEXT", "optional": False},
+        "duration": {"dtype": "FLOAT", "optional": False},
+    },
+    "daily_rollup": {
+        "project": {"dtype": "TINYTEXT", "optional": False},
+        "username": {"dtype": "TINYTEXT", "optional": False},
+        "task": {"dtype": "TINYTEXT", "optional": False},
+        "day": {"dtype": "DATE", "optional": False},
+        "seconds": {"dtype": "FLOAT", "optional": False},
+    },
+}
+
+# Tables holding the in-flight state of the bot, never dumped.
+STATE_TABLES = {
+    "open_sessions": {
+        "project": {"dtype": "TINYTEXT", "optional": False},
+        "username": {"dtype": "TINYTEXT", "optional": False},
+        "start": {"dtype": "DATETIME", "optional": False},
+        "start_comment": {"dtype": "TEXT", "optional": True},
+        "task": {"dtype": "TINYTEXT", "optional": True},
+    },
+    "conversation_state": {
+        "name": {"dtype": "TINYTEXT", "optional": False},
+        "project": {"dtype": "TINYTEXT", "optional": False},
+        "username": {"dtype": "TINYTEXT", "optional": False},
+        "value": {"dtype": "TEXT", "optional": True},
+    },
+}
+
+# Indexes of the latest schema version, created by the migrations.
+INDEXES = {
+    "sessions": {
+        "sessions_project_username": {
+            "columns": ("project", "username"),
+            "unique": False,
+        },
+        "sessions_project_start": {"columns": ("project", "start"), "unique": False},
+    },
+    "projects": {
+        "projects_project": {"columns": ("project",), "unique": True},
+    },
+    "tasks": {
+        "tasks_project": {"columns": ("project",), "unique": False},
+    },
+    "summaries": {
+        "summaries_project_username": {
+            "columns": ("project", "username"),
+            "unique": True,
+        },
+    },
+    "daily_rollup": {
+        "daily_rollup_project_day_username_task": {
+            "columns": ("project", "day", "username", "task"),
+            "unique": True,
+        },
+    },
+    "open_sessions": {
+        "open_sessions_project_username": {
+            "columns": ("project", "username"),
+            "unique": True,
+        },
+    },
+    "conversation_state": {
+        "conversation_state_name_project_username": {
+            "columns": ("name", "project", "username"),
+            "unique": True,
+        },
+    },
+}
+
 
 def insert_req(table: str):
     """Build a insert request based on table metadatas."""
@@ -41,11 +132,41 @@ def insert_req(table: str):
             VALUES ({','.join('?'*len(TABLES[table]))});"""
 
 
-SELECT_SUMMARY = """SELECT username, SUM(duration)
-    FROM sessions
+SELECT_SUMMARY = """SELECT username, duration
+    FROM summaries
     WHERE project = ?
-    GROUP BY username
-    ORDER BY SUM(duration) DESC;"""
+    ORDER BY duration DESC;"""
+
+UPSERT_SUMMARY = """INSERT INTO summaries (project, username, duration)
+    VALUES (?, ?, ?)
+    ON CONFLICT (project, username)
+    DO UPDATE SET duration = duration + excluded.duration;"""
+
+SELECT_SUMMARIES_FROM_SESSIONS = """SELECT project, username, SUM(duration)
+    FROM sessions
+    GROUP BY project, username;"""
+
+SELECT_SUMMARIES = """SELECT project, username, duration FROM summaries;"""
+
+DELETE_SUMMARIES = "DELETE FROM summaries;"
+
+# Sessions without task are rolled up with an empty task, NULLs are never equal.
+UPSERT_DAILY_ROLLUP = """INSERT INTO daily_rollup (project, username, task, day, seconds)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (project, day, username, task)
+    DO UPDATE SET seconds = seconds + excluded.seconds;"""
+
+SELECT_SESSIONS_TO_ROLLUP = "SELECT project, username, task, start, stop FROM sessions;"
+
+DELETE_DAILY_ROLLUP = "DELETE FROM daily_rollup;"
+
+DATE_FORMAT = "%Y-%m-%d"
+
+DEFAULT_CHUNK_SIZE = 5000
+
+SELECT_LAST_SESSION_ID = "SELECT MAX(id) FROM sessions WHERE project = ?;"
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 SELECT_PROJECTS_WITH_TASKS = """SELECT project
     FROM projects
@@ -53,20 +174,128 @@ SELECT_PROJECTS_WITH_TASKS = """SELECT project
 
 SELECT_TASKS_DICT = """SELECT tasks_dict FROM projects WHERE project = ?;"""
 
+SELECT_TASKS_SUBTREE = """SELECT json_extract(tasks_dict, ?), json_type(tasks_dict, ?)
+    FROM projects
+    WHERE project = ?;"""
+
+DELETE_COMPLETE_OPEN_SESSION = """DELETE FROM open_sessions
+    WHERE project = ? AND username = ? AND start = ?;"""
+
 DELETE_TASKS_FROM_PROJECT = "DELETE FROM tasks WHERE project = ?;"
 DELETE_PROJECT = "DELETE FROM projects WHERE project = ?;"
 
 
+# Navigators of parsed tasks structures by database path and project.
+TASKS_CACHE = LRUCache(maxsize=256)
+
+# Called with the database path and the projects of sessions once committed.
+SESSIONS_LISTENERS: List[Callable[[str, Set[str]], None]] = []
+
+
+class Database:
+    """Long-lived connections to a database file, one per thread.
+
+    Connections are opened lazily on first use in each thread and kept alive
+    until `close` is called, so requests do not pay for opening the file,
+    loading the schema and setting up locks each time.
+
+    Args:
+        db_path (str): Path to the database file.
+        cached_statements (int, optional): Size of the prepared statements cache
+            of each connection. Defaults to 128.
+
+    Attributes:
+        writer: Background writer complete sessions and conversation state are
+            queued to instead of being written synchronously, if any.
+    """
+
+    def __init__(self, db_path: str, cached_statements: int = 128) -> None:
+        self.db_path = str(db_path)
+        self.cached_statements = cached_statements
+        self.writer = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(
+            self.db_path,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        db.execute("PRAGMA journal_mode=WAL;")
+        db.execute("PRAGMA synchronous=NORMAL;")
+        return db
+
+    def connection(self) -> sqlite3.Connection:
+        """Get the connection of the current thread, opening it if needed.
+
+        Returns:
+            sqlite3.Connection: Connexion to the database.
+        """
+        db = getattr(self._local, "connection", None)
+        if db is None:
+            db = self._open()
+            self._local.connection = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def close(self):
+        """Close every connection opened by any thread."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for db in connections:
+            db.close()
+
+
+_DATABASES: Dict[str, Database] = {}
+_DATABASES_LOCK = threading.Lock()
+
+
+def get_database(db_path: str) -> Database:
+    """Get the shared connection manager of a database file.
+
+    Args:
+        db_path (str): Path to the database file.
+
+    Returns:
+        Database: Connection manager of the database.
+    """
+    db_path = str(db_path)
+    with _DATABASES_LOCK:
+        if db_path not in _DATABASES:
+            _DATABASES[db_path] = Database(db_path)
+        return _DATABASES[db_path]
+
+
+def close_database(db_path: str):
+    """Close all pooled connections to a database file.
+
+    Args:
+        db_path (str): Path to the database file.
+    """
+    with _DATABASES_LOCK:
+        database = _DATABASES.pop(str(db_path), None)
+    if database is not None:
+        database.close()
+    TASKS_CACHE.clear()
+
+
 def connect(db_path: str) -> sqlite3.Connection:
     """Connect to the database.
 
+    The connection is pooled and must not be closed by the caller, using it as
+    a context manager only scopes a transaction.
+
     Args:
         db_path (str): Path to the database file.
 
     Returns:
         sqlite3.Connection: Connexion to the database.
     """
-    return sqlite3.connect(db_path)
+    return get_database(db_path).connection()
 
 
 def get_columns_desc(columns: dict) -> str:
@@ -85,42 +314,409 @@ def get_columns_desc(columns: dict) -> str:
     return ", ".join(desc_elements)
 
 
-def create_database(db_path: str):
+# Migrations are frozen: each one creates the tables and indexes of its own
+# version with literal statements, whatever the current metadata declares.
+def _execute_all(db: sqlite3.Connection, statements: Iterable[str]):
+    for statement in statements:
+        db.execute(statement)
+
+
+# Tables of the first schema, with the columns restored from their dumps.
+_V0_TABLES = {
+    "sessions": (
+        """CREATE TABLE sessions (id INTEGER PRIMARY KEY, project TINYTEXT NOT_NULL,
+            task TINYTEXT, username TINYTEXT NOT_NULL, start DATETIME NOT_NULL,
+            stop DATETIME NOT_NULL, duration FLOAT NOT_NULL, start_comment TEXT,
+            stop_comment TEXT);""",
+        (
+            "project",
+            "task",
+            "username",
+            "start",
+            "stop",
+            "duration",
+            "start_comment",
+            "stop_comment",
+        ),
+    ),
+    "projects": (
+        """CREATE TABLE projects (id INTEGER PRIMARY KEY,
+            project TINYTEXT NOT_NULL, tasks_dict TEXT);""",
+        ("project", "tasks_dict"),
+    ),
+    "tasks": (
+        """CREATE TABLE tasks (id INTEGER PRIMARY KEY, task TINYTEXT NOT_NULL,
+            project TINYTEXT NOT_NULL, workload FLOAT NOT_NULL);""",
+        ("task", "project", "workload"),
+    ),
+}
+
+
+def _add_v0_ids(db: sqlite3.Connection):
+    # Databases restored by the first dump loader, through pandas to_sql, have
+    # an "index" column instead of the id primary key.
+    for table, (create_req, columns) in _V0_TABLES.items():
+        existing = {row[1] for row in db.execute(f"PRAGMA table_info({table});")}
+        if "id" in existing:
+            continue
+        kept = ", ".join(column for column in columns if column in existing)
+        _execute_all(
+            db,
+            (
+                f"ALTER TABLE {table} RENAME TO {table}_v0;",
+                create_req,
+                f"""INSERT INTO {table} (id, {kept})
+                    SELECT rowid, {kept} FROM {table}_v0;""",
+                f"DROP TABLE {table}_v0;",
+            ),
+        )
+
+
+def _migrate_v1_indexes(db: sqlite3.Connection):
+    """Deduplicate projects and create the secondary indexes."""
+    _add_v0_ids(db)
+    db.execute(
+        """DELETE FROM projects
+        WHERE id NOT IN (SELECT MAX(id) FROM projects GROUP BY project);"""
+    )
+    _execute_all(
+        db,
+        (
+            """CREATE INDEX IF NOT EXISTS sessions_project_username
+                ON sessions (project, username);""",
+            """CREATE INDEX IF NOT EXISTS sessions_project_start
+                ON sessions (project, start);""",
+            """CREATE UNIQUE INDEX IF NOT EXISTS projects_project
+                ON projects (project);""",
+            """CREATE INDEX IF NOT EXISTS tasks_project ON tasks (project);""",
+        ),
+    )
+
+
+def _migrate_v2_summaries(db: sqlite3.Connection):
+    """Build the summaries aggregate table from existing sessions."""
+    _execute_all(
+        db,
+        (
+            """CREATE TABLE IF NOT EXISTS summaries (id INTEGER PRIMARY KEY,
+                project TINYTEXT NOT_NULL, username TINYTEXT NOT_NULL,
+                duration FLOAT NOT_NULL);""",
+            """CREATE UNIQUE INDEX IF NOT EXISTS summaries_project_username
+                ON summaries (project, username);""",
+        ),
+    )
+    _rebuild_summaries(db)
+
+
+def _migrate_v3_state(db: sqlite3.Connection):
+    """Create the in-flight state tables and their indexes."""
+    _execute_all(
+        db,
+        (
+            """CREATE TABLE IF NOT EXISTS open_sessions (id INTEGER PRIMARY KEY,
+                project TINYTEXT NOT_NULL, username TINYTEXT NOT_NULL,
+                start DATETIME NOT_NULL, start_comment TEXT, task TINYTEXT);""",
+            """CREATE TABLE IF NOT EXISTS conversation_state (id INTEGER PRIMARY KEY,
+                name TINYTEXT NOT_NULL, project TINYTEXT NOT_NULL,
+                username TINYTEXT NOT_NULL, value TEXT);""",
+            """CREATE UNIQUE INDEX IF NOT EXISTS open_sessions_project_username
+                ON open_sessions (project, username);""",
+            """CREATE UNIQUE INDEX IF NOT EXISTS
+                conversation_state_name_project_username
+                ON conversation_state (name, project, username);""",
+        ),
+    )
+
+
+def _load_tasks_text(tasks_text: str) -> dict:
+    try:
+        return json.loads(tasks_text)
+    except ValueError:
+        # Tasks used to be stored as the python repr of their structure.
+        return read_tasks(tasks_text)
+
+
+def _migrate_v4_json_tasks(db: sqlite3.Connection):
+    """Convert stored tasks structures to json."""
+    rows = db.execute(
+        "SELECT id, tasks_dict FROM projects WHERE tasks_dict IS NOT NULL;"
+    ).fetchall()
+    db.executemany(
+        "UPDATE projects SET tasks_dict = ? WHERE id = ?;",
+        [
+            (json.dumps(_load_tasks_text(tasks_text)), project_id)
+            for project_id, tasks_text in rows
+        ],
+    )
+
+
+def _migrate_v5_daily_rollup(db: sqlite3.Connection):
+    """Build the daily rollup table from existing sessions."""
+    _execute_all(
+        db,
+        (
+            """CREATE TABLE IF NOT EXISTS daily_rollup (id INTEGER PRIMARY KEY,
+                project TINYTEXT NOT_NULL, username TINYTEXT NOT_NULL,
+                task TINYTEXT NOT_NULL, day DATE NOT_NULL, seconds FLOAT NOT_NULL);""",
+            """CREATE UNIQUE INDEX IF NOT EXISTS daily_rollup_project_day_username_task
+                ON daily_rollup (project, day, username, task);""",
+        ),
+    )
+    _rebuild_daily_rollup(db)
+
+
+# Migration at index i upgrades a database from user_version i to i + 1.
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migrate_v1_indexes,
+    _migrate_v2_summaries,
+    _migrate_v3_state,
+    _migrate_v4_json_tasks,
+    _migrate_v5_daily_rollup,
+]
+
+
+def get_schema_version(db: sqlite3.Connection) -> int:
+    """Get the schema version of a database.
+
+    Args:
+        db (sqlite3.Connection): Connexion to the database.
+
+    Returns:
+        int: Schema version stored in the database user_version.
+    """
+    return db.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate_database(db_path: str) -> int:
+    """Upgrade the schema of a database in place to the latest version.
+
+    Each migration runs in its own transaction along with the update of
+    the user_version, so an interrupted upgrade resumes where it stopped.
+
+    Args:
+        db_path (str): Path to the database file.
+
+    Returns:
+        int: Schema version of the database after the upgrade.
+    """
+    db = connect(db_path)
+    while True:
+        db.execute("BEGIN IMMEDIATE;")
+        try:
+            version = get_schema_version(db)
+            if version >= len(MIGRATIONS):
+                db.execute("COMMIT;")
+                return version
+            MIGRATIONS[version](db)
+            db.execute(f"PRAGMA user_version={version + 1};")
+            db.execute("COMMIT;")
+        except Exception:
+            db.execute("ROLLBACK;")
+            raise
+
+
+def create_database(db_path: str, migrate: bool = True):
     """Create a database using tables metadata if they do not already exist.
 
     Args:
         db_path (str): Path to the database file.
+        migrate (bool, optional): Whether to upgrade the schema to the latest
+            version, which also builds the indexes. Defaults to True.
 
     """
     with connect(db_path) as db:
-        for table, columns in TABLES.items():
+        for table, columns in {**TABLES, **DERIVED_TABLES, **STATE_TABLES}.items():
             create_req = f"""CREATE TABLE IF NOT EXISTS {table}
                 (id INTEGER PRIMARY KEY, {get_columns_desc(columns)});"""
             db.execute(create_req)
+    if migrate:
+        migrate_database(db_path)
+
+
+def _session_values(project: str, complete_task: CompleteSession) -> tuple:
+    return (
+        project,
+        complete_task.session.task,
+        complete_task.session.author,
+        complete_task.session.start.strftime(DATETIME_FORMAT),
+        complete_task.stop.strftime(DATETIME_FORMAT),
+        complete_task.duration.total_seconds(),
+        complete_task.session.start_comment,
+        complete_task.stop_comment,
+    )
+
+
+def add_sessions_listener(listener: Callable[[str, Set[str]], None]):
+    """Register a function called each time complete sessions are committed.
+
+    Args:
+        listener (Callable[[str, Set[str]], None]): Function called with the
+            database path and the projects of the added sessions.
+    """
+    SESSIONS_LISTENERS.append(listener)
+
+
+def _notify_sessions_listeners(db_path: str, projects: Set[str]):
+    for listener in SESSIONS_LISTENERS:
+        # Sessions are committed, a failing listener must not retry the write.
+        try:
+            listener(db_path, projects)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Sessions listener %s failed", listener)
+
+
+def split_by_day(start: datetime, stop: datetime) -> List[Tuple[str, float]]:
+    """Split a period of time at each midnight.
+
+    Args:
+        start (datetime): Start of the period.
+        stop (datetime): Stop of the period.
+
+    Returns:
+        List[Tuple[str, float]]: Days of the period and the seconds spent on each.
+    """
+    days = []
+    while start < stop:
+        midnight = datetime.combine(
+            start.date() + timedelta(days=1), datetime.min.time(), start.tzinfo
+        )
+        end = min(stop, midnight)
+        days.append((start.strftime(DATE_FORMAT), (end - start).total_seconds()))
+        start = end
+    return days
+
+
+def _rollup_values(
+    project: str, username: str, task: Optional[str], start: datetime, stop: datetime
+) -> List[tuple]:
+    return [
+        (project, username, task or "", day, seconds)
+        for day, seconds in split_by_day(start, stop)
+    ]
+
+
+def _rebuild_daily_rollup(db: sqlite3.Connection):
+    db.execute(DELETE_DAILY_ROLLUP)
+    cursor = db.execute(SELECT_SESSIONS_TO_ROLLUP)
+    while True:
+        rows = cursor.fetchmany(DEFAULT_CHUNK_SIZE)
+        if not rows:
+            return
+        db.executemany(
+            UPSERT_DAILY_ROLLUP,
+            [
+                value
+                for project, username, task, start, stop in rows
+                for value in _rollup_values(
+                    project,
+                    username,
+                    task,
+                    datetime.strptime(start, DATETIME_FORMAT),
+                    datetime.strptime(stop, DATETIME_FORMAT),
+                )
+            ],
+        )
+
+
+def rebuild_daily_rollup(db_path: str):
+    """Rebuild the daily rollup table from all sessions.
+
+    Args:
+        db_path (str): Path to the database file.
+    """
+    flush_writes(db_path)
+    with connect(db_path) as db:
+        _rebuild_daily_rollup(db)
+
+
+def add_complete_sessions(
+    db_path: str, complete_sessions: List[Tuple[str, CompleteSession]]
+):
+    """Add several complete sessions to the database in a single transaction.
+
+    Their open sessions are deleted in the same transaction.
+
+    Args:
+        db_path (str): Path to the database file.
+        complete_sessions (List[Tuple[str, CompleteSession]]): Names of the projects
+            and complete work sessions data.
+    """
+    with connect(db_path) as db:
+        db.executemany(
+            insert_req("sessions"),
+            [
+                _session_values(project, complete_task)
+                for project, complete_task in complete_sessions
+            ],
+        )
+        db.executemany(
+            UPSERT_SUMMARY,
+            [
+                (
+                    project,
+                    complete_task.session.author,
+                    complete_task.duration.total_seconds(),
+                )
+                for project, complete_task in complete_sessions
+            ],
+        )
+        db.executemany(
+            UPSERT_DAILY_ROLLUP,
+            [
+                value
+                for project, complete_task in complete_sessions
+                for value in _rollup_values(
+                    project,
+                    complete_task.session.author,
+                    complete_task.session.task,
+                    complete_task.session.start,
+                    complete_task.stop,
+                )
+            ],
+        )
+        db.executemany(
+            DELETE_COMPLETE_OPEN_SESSION,
+            [
+                (
+                    project,
+                    complete_task.session.author,
+                    complete_task.session.start.isoformat(),
+                )
+                for project, complete_task in complete_sessions
+            ],
+        )
+    _notify_sessions_listeners(
+        str(db_path), {project for project, _ in complete_sessions}
+    )
 
 
 def add_complete_session(db_path: str, project: str, complete_task: CompleteSession):
     """Add a complete session to the database.
 
+    If a background writer is attached to the database, the session is only
+    queued and written later in a group commit.
+
     Args:
         db_path (str): Path to the database file.
         project (str): Name of the project.
         complete_task (CompleteSession): Complete work session data.
     """
-    with connect(db_path) as db:
-        db.execute(
-            insert_req("sessions"),
-            (
-                project,
-                complete_task.session.task,
-                complete_task.session.author,
-                complete_task.session.start.strftime("%Y-%m-%d %H:%M:%S"),
-                complete_task.stop.strftime("%Y-%m-%d %H:%M:%S"),
-                complete_task.duration.total_seconds(),
-                complete_task.session.start_comment,
-                complete_task.stop_comment,
-            ),
-        )
+    writer = get_database(db_path).writer
+    if writer is not None:
+        writer.submit(project, complete_task)
+    else:
+        add_complete_sessions(db_path, [(project, complete_task)])
+
+
+def flush_writes(db_path: str):
+    """Wait for queued writes to a database to be committed, if any.
+
+    Args:
+        db_path (str): Path to the database file.
+    """
+    writer = get_database(db_path).writer
+    if writer is not None:
+        writer.flush()
 
 
 def add_tasks(db_path: str, project: str, tasks: dict):
@@ -133,15 +729,18 @@ def add_tasks(db_path: str, project: str, tasks: dict):
         tasks_dict (dict): Dictionary of the structure of tasks.
     """
     tasks_list = parse_tasks(tasks)
+    tasks_text = json.dumps(tasks)
     with connect(db_path) as db:
         db.execute(DELETE_TASKS_FROM_PROJECT, (project,))
         db.execute(DELETE_PROJECT, (project,))
-        db.execute(insert_req("projects"), (project, str(tasks)))
+        db.execute(insert_req("projects"), (project, tasks_text))
         for task_name, workload in tasks_list:
             db.execute(insert_req("tasks"), (task_name, project, workload))
+    TASKS_CACHE.invalidate((str(db_path), project))
+    TASKS_CACHE.set((str(db_path), project), TaskNavigator(json.loads(tasks_text)))
 
 
-def get_summary(db_path: str, project: str) -> pd.DataFrame:
+def get_summary(db_path: str, project: str) -> "pd.DataFrame":
     """Get the summary of time spent on tasks from the database.
 
     Args:
@@ -151,123 +750,222 @@ def get_summary(db_path: str, project: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: Summary of time spent on tasks.
     """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    flush_writes(db_path)
     with connect(db_path) as db:
         summary_list = db.execute(SELECT_SUMMARY, (project,)).fetchall()
     return pd.DataFrame(data=summary_list, columns=("username", "duration"))
 
 
-def get_project_tasks_dict(db_path: str, project: str) -> dict:
-    """Get the structure of tasks from a project.
+def _rebuild_summaries(db: sqlite3.Connection):
+    db.execute(DELETE_SUMMARIES)
+    db.execute(
+        "INSERT INTO summaries (project, username, duration) "
+        + SELECT_SUMMARIES_FROM_SESSIONS
+    )
+
+
+def rebuild_summaries(db_path: str):
+    """Rebuild the summaries aggregate table from all sessions.
 
     Args:
         db_path (str): Path to the database file.
-        project (str): Name of the project.
+    """
+    with connect(db_path) as db:
+        _rebuild_summaries(db)
+
+
+def check_summaries(db_path: str, rebuild: bool = False) -> List[Tuple[str, str]]:
+    """Check that the summaries aggregate table is consistent with sessions.
+
+    Args:
+        db_path (str): Path to the database file.
+        rebuild (bool, optional): Whether to rebuild the summaries if they are
+            inconsistent. Defaults to False.
 
     Returns:
-        dict: Structure of tasks of the given project.
+        List[Tuple[str, str]]: Projects and usernames with an inconsistent summary.
     """
+    flush_writes(db_path)
+    db = connect(db_path)
+    expected = {
+        (project, username): duration
+        for project, username, duration in db.execute(SELECT_SUMMARIES_FROM_SESSIONS)
+    }
+    stored = {
+        (project, username): duration
+        for project, username, duration in db.execute(SELECT_SUMMARIES)
+    }
+    inconsistents = [
+        key
+        for key in expected.keys() | stored.keys()
+        if abs(expected.get(key, 0) - stored.get(key, 0)) > 1e-3
+        or (key in expected) != (key in stored)
+    ]
+    if inconsistents and rebuild:
+        rebuild_summaries(db_path)
+    return sorted(inconsistents)
+
+
+def _read_project_tasks_dict(db_path: str, project: str) -> dict:
     with connect(db_path) as db:
         tasks_text = db.execute(SELECT_TASKS_DICT, (project,)).fetchall()
         if tasks_text:
-            return read_tasks(tasks_text[0][0])
+            return json.loads(tasks_text[0][0])
     return {}
 
 
-def get_all(db_path: str, table) -> pd.DataFrame:
-    """Get all data from the database as a Dataframe.
+def get_last_session_id(db_path: str, project: str) -> Optional[int]:
+    """Get the id of the last session added to a project.
 
     Args:
         db_path (str): Path to the database file.
-        table (_type_): Name of the project.
+        project (str): Name of the project.
 
     Returns:
-        pd.DataFrame: Dataframe of all data in the database.
+        Optional[int]: Id of the last session, None if the project has none.
     """
-    with connect(db_path) as db:
-        all_row = db.execute(f"SELECT * FROM {table}").fetchall()
-    columns = ["id"] + list(TABLES[table].keys())
-    return pd.DataFrame(data=all_row, columns=columns)
+    flush_writes(db_path)
+    return connect(db_path).execute(SELECT_LAST_SESSION_ID, (project,)).fetchone()[0]
+
 
+def get_project_navigator(db_path: str, project: str) -> TaskNavigator:
+    """Get the navigator of the structure of tasks from a project.
 
-def dump_database_to_xlsx(db_path: str, dirpath: str):
-    """Dump the database to a xlsx file.
+    Navigators are built once when tasks are added and cached in TASKS_CACHE,
+    so the returned navigator is shared and must not be mutated.
 
     Args:
         db_path (str): Path to the database file.
-        dirpath (str): Directory in which to dump the database.
+        project (str): Name of the project.
+
+    Returns:
+        TaskNavigator: Navigator of the structure of tasks of the given project.
     """
-    os.makedirs(dirpath, exist_ok=True)
-    filename = f"{datetime.now().strftime('%Y-%m-%d_%Hh%M')}.xlsx"
-    filepath = os.path.join(dirpath, filename)
+    return TASKS_CACHE.get_or_compute(
+        (str(db_path), project),
+        lambda: TaskNavigator(_read_project_tasks_dict(db_path, project)),
+    )
 
-    # pylint: disable=abstract-class-instantiated
-    with pd.ExcelWriter(filepath) as writer:
-        for table in TABLES:
-            get_all(db_path, table).to_excel(writer, sheet_name=table)
 
+def get_project_tasks_dict(db_path: str, project: str) -> dict:
+    """Get the structure of tasks from a project.
 
-def create_database_from_xlsx(xlsx_path: str, db_path: str):
-    """Create a database from a xlsx dump file.
+    The structure comes from the cached navigator of the project, so the
+    returned dict is shared and must not be mutated.
 
     Args:
-        xlsx_path (str): Path to the xslx dump.
-        db_path (str): Path to the created database.
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+
+    Returns:
+        dict: Structure of tasks of the given project.
     """
-    xlsx_df = pd.read_excel(xlsx_path, list(TABLES.keys()), index_col=0)
+    return get_project_navigator(db_path, project).tree
 
-    for table_name, table_ref in TABLES.items():
-        table = xlsx_df[table_name]
-        table = table.filter(table_ref.keys(), axis=1)
-        with connect(db_path) as db:
-            table.to_sql(table_name, db)
 
+def get_project_tasks_subtree(db_path: str, project: str, path: List[str]) -> Any:
+    """Get a part of the structure of tasks from a project without loading it all.
 
-def build_parser() -> argparse.ArgumentParser:
-    """Build a parser for database command line interface.
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+        path (List[str]): Successive task names leading to the subtree.
 
     Returns:
-        ArgumentParser: Parser for the database CLI.
+        Any: Structure of tasks under the given path, or the workload of a leaf
+            task. None if the path does not exist.
     """
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--path",
-        "-p",
-        help="Path to the database. Default to timerbot.db",
-        default="timerbot.db",
-    )
-    parser.add_argument(
-        "--dump-path",
-        "-o",
-        help="Path to the database dump. Default to database_dumps",
-        default="database_dumps",
-    )
-    parser.add_argument(
-        "--load-dump",
-        "-l",
-        help="Path to the database dump to load from. No loading if None given.",
-        default=None,
-    )
-    return parser
+    if any('"' in key for key in path):
+        # Such keys cannot be quoted in a json path.
+        subtree = get_project_tasks_dict(db_path, project)
+        for key in path:
+            if not isinstance(subtree, dict) or key not in subtree:
+                return None
+            subtree = subtree[key]
+        return subtree
+
+    json_path = "$" + "".join(f'."{key}"' for key in path)
+    with connect(db_path) as db:
+        row = db.execute(
+            SELECT_TASKS_SUBTREE, (json_path, json_path, project)
+        ).fetchone()
+    if row is None or row[1] is None:
+        return None
+    value, value_type = row
+    return json.loads(value) if value_type in ("object", "array") else value
 
 
-def main():
-    """Main database command line interface."""
-    parser = build_parser()
-    config = parser.parse_args()
+def get_all(db_path: str, table) -> "pd.DataFrame":
+    """Get all data from the database as a Dataframe.
 
-    db_path = config.path
-    if config.dump_path is not None and os.path.isfile(db_path):
-        dump_database_to_xlsx(db_path, config.dump_path)
+    Args:
+        db_path (str): Path to the database file.
+        table (_type_): Name of the project.
 
-    if config.load_dump is not None:
-        if os.path.isfile(db_path):
-            os.remove(db_path)
-        create_database_from_xlsx(config.load_dump, db_path)
-        for table_name in TABLES:
-            print(table_name)
-            print(get_all(db_path, table_name))
-            print()
+    Returns:
+        pd.DataFrame: Dataframe of all data in the database.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
 
+    flush_writes(db_path)
+    with connect(db_path) as db:
+        all_row = db.execute(f"SELECT * FROM {table}").fetchall()
+    columns = ["id"] + list(TABLES[table].keys())
+    return pd.DataFrame(data=all_row, columns=columns)
+
+
+def get_sessions(
+    db_path: str,
+    project: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    users: Optional[Iterable[str]] = None,
+) -> "pd.DataFrame":
+    """Get the sessions of a project as a Dataframe, filtered in the database.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+        since (Optional[datetime], optional): Only keep sessions started at or
+            after this date. Defaults to None.
+        until (Optional[datetime], optional): Only keep sessions started before
+            this date. Defaults to None.
+        users (Optional[Iterable[str]], optional): Only keep sessions of these
+            usernames. Defaults to None.
 
-if __name__ == "__main__":
-    main()
+    Returns:
+        pd.DataFrame: Dataframe of the matching sessions ordered by start,
+            with parsed start and stop dates.
+    """
+    conditions, params = ["project = ?"], [project]
+    if since is not None:
+        conditions.append("start >= ?")
+        params.append(since.strftime(DATETIME_FORMAT))
+    if until is not None:
+        conditions.append("start < ?")
+        params.append(until.strftime(DATETIME_FORMAT))
+    if users is not None:
+        users = list(users)
+        conditions.append(f"username IN ({','.join('?' * len(users))})")
+        params += users
+
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    select_req = f"""SELECT * FROM sessions
+        WHERE {' AND '.join(conditions)}
+        ORDER BY start;"""
+    flush_writes(db_path)
+    with connect(db_path) as db:
+        rows = db.execute(select_req, params).fetchall()
+    columns = ["id"] + list(TABLES["sessions"].keys())
+    sessions_df = pd.DataFrame(data=rows, columns=columns)
+    for column in ("start", "stop"):
+        sessions_df[column] = pd.to_datetime(
+            sessions_df[column], format=DATETIME_FORMAT
+        )
+    return sessions_df
@@ -0,0 +1,416 @@
+""" Module for database dumps and the database command line interface. """
+
+import argparse
+import csv
+from datetime import datetime
+import os
+from typing import Any, Iterator, List, Tuple
+
+from bot.database import (
+    DEFAULT_CHUNK_SIZE,
+    TABLES,
+    check_summaries,
+    close_database,
+    connect,
+    create_database,
+    flush_writes,
+    migrate_database,
+    rebuild_daily_rollup,
+)
+
+DUMP_FORMATS = ("xlsx", "csv", "parquet")
+
+
+def get_table_columns(table: str) -> List[str]:
+    """Get the names of all columns of a table, including its id.
+
+    Args:
+        table (str): Name of the table.
+
+    Returns:
+        List[str]: Names of the columns in storage order.
+    """
+    return ["id"] + list(TABLES[table].keys())
+
+
+def iter_table_chunks(
+    db_path: str, table: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[List[tuple]]:
+    """Iterate over all rows of a table in chunks of fixed size.
+
+    Args:
+        db_path (str): Path to the database file.
+        table (str): Name of the table.
+        chunk_size (int, optional): Maximum number of rows per chunk.
+            Defaults to DEFAULT_CHUNK_SIZE.
+
+    Yields:
+        List[tuple]: Chunk of rows ordered by id.
+    """
+    flush_writes(db_path)
+    cursor = connect(db_path).execute(
+        f"SELECT {', '.join(get_table_columns(table))} FROM {table} ORDER BY id;"
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _escape_text(value: Any) -> Any:
+    # Empty strings and NULL are both empty cells in xlsx and csv dumps.
+    # Strings made only of double quotes, the empty one included, are
+    # written with one more quote to keep them apart.
+    if isinstance(value, str) and not value.strip('"'):
+        return value + '"'
+    return value
+
+
+def _unescape_text(value: Any) -> Any:
+    if isinstance(value, str) and value and not value.strip('"'):
+        return value[:-1]
+    return value
+
+
+def _dump_xlsx(db_path: str, filepath: str, chunk_size: int):
+    # pylint: disable=import-outside-toplevel
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for table in TABLES:
+        sheet = workbook.create_sheet(table)
+        sheet.append(get_table_columns(table))
+        for rows in iter_table_chunks(db_path, table, chunk_size):
+            for row in rows:
+                sheet.append([_escape_text(value) for value in row])
+    workbook.save(filepath)
+
+
+def _dump_csv(db_path: str, dirpath: str, chunk_size: int):
+    os.makedirs(dirpath, exist_ok=True)
+    for table in TABLES:
+        filepath = os.path.join(dirpath, f"{table}.csv")
+        with open(filepath, "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(get_table_columns(table))
+            for rows in iter_table_chunks(db_path, table, chunk_size):
+                writer.writerows([_escape_text(value) for value in row] for row in rows)
+
+
+def get_arrow_schema(table: str):
+    """Get the pyarrow schema of a table based on tables metadata.
+
+    Args:
+        table (str): Name of the table.
+
+    Returns:
+        pyarrow.Schema: Schema of the table.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pyarrow as pa
+
+    arrow_types = {"FLOAT": pa.float64()}
+    fields = [pa.field("id", pa.int64(), nullable=False)]
+    for column_name, column_data in TABLES[table].items():
+        arrow_type = arrow_types.get(column_data["dtype"], pa.string())
+        fields.append(pa.field(column_name, arrow_type, column_data["optional"]))
+    return pa.schema(fields)
+
+
+def _dump_parquet(db_path: str, dirpath: str, chunk_size: int):
+    try:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise ImportError("pyarrow is required to dump to parquet") from error
+
+    os.makedirs(dirpath, exist_ok=True)
+    for table in TABLES:
+        schema = get_arrow_schema(table)
+        filepath = os.path.join(dirpath, f"{table}.parquet")
+        with pq.ParquetWriter(filepath, schema) as writer:
+            for rows in iter_table_chunks(db_path, table, chunk_size):
+                columns = list(zip(*rows))
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+
+def dump_database(
+    db_path: str,
+    dirpath: str,
+    dump_format: str = "xlsx",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> str:
+    """Dump the database by streaming rows in chunks, in constant memory.
+
+    A xlsx dump is a single file with a sheet per table, csv and parquet dumps
+    are directories with a file per table.
+
+    Args:
+        db_path (str): Path to the database file.
+        dirpath (str): Directory in which to dump the database.
+        dump_format (str, optional): One of DUMP_FORMATS. Defaults to "xlsx".
+        chunk_size (int, optional): Number of rows read from the database at once.
+            Defaults to DEFAULT_CHUNK_SIZE.
+
+    Returns:
+        str: Path to the created dump.
+    """
+    dumpers = {"xlsx": _dump_xlsx, "csv": _dump_csv, "parquet": _dump_parquet}
+    if dump_format not in dumpers:
+        raise ValueError(
+            f"Unknown dump format {dump_format}, use one of {DUMP_FORMATS}"
+        )
+
+    os.makedirs(dirpath, exist_ok=True)
+    dump_name = datetime.now().strftime("%Y-%m-%d_%Hh%M")
+    if dump_format == "xlsx":
+        dump_name += ".xlsx"
+    dump_path = os.path.join(dirpath, dump_name)
+    dumpers[dump_format](db_path, dump_path, chunk_size)
+    return dump_path
+
+
+def dump_database_to_xlsx(db_path: str, dirpath: str) -> str:
+    """Dump the database to a xlsx file.
+
+    Args:
+        db_path (str): Path to the database file.
+        dirpath (str): Directory in which to dump the database.
+
+    Returns:
+        str: Path to the created xlsx file.
+    """
+    return dump_database(db_path, dirpath, "xlsx")
+
+
+def _iter_xlsx_chunks(dump_path: str, table: str, chunk_size: int):
+    # pylint: disable=import-outside-toplevel
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(dump_path, read_only=True)
+    try:
+        rows = workbook[table].iter_rows(values_only=True)
+        yield list(next(rows, ()))
+        chunk = []
+        for row in rows:
+            chunk.append([_unescape_text(value) for value in row])
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def _iter_csv_chunks(dump_path: str, table: str, chunk_size: int):
+    filepath = os.path.join(dump_path, f"{table}.csv")
+    with open(filepath, "r", newline="", encoding="utf-8") as csv_file:
+        reader = csv.reader(csv_file)
+        yield next(reader, [])
+        chunk = []
+        for row in reader:
+            chunk.append(
+                [_unescape_text(value) if value != "" else None for value in row]
+            )
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _iter_parquet_chunks(dump_path: str, table: str, chunk_size: int):
+    try:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise ImportError("pyarrow is required to load a parquet dump") from error
+
+    parquet_file = pq.ParquetFile(os.path.join(dump_path, f"{table}.parquet"))
+    yield parquet_file.schema_arrow.names
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield list(zip(*(column.to_pylist() for column in batch.columns)))
+
+
+def _dump_values(row: tuple, columns: List[Tuple[int, str]]) -> list:
+    # Trailing empty cells may be missing from spreadsheet rows.
+    values = []
+    for position, name in columns:
+        value = row[position] if position < len(row) else None
+        if name == "id" and value is not None:
+            value = int(value)
+        values.append(value)
+    return values
+
+
+def get_dump_format(dump_path: str) -> str:
+    """Guess the format of a database dump from its path.
+
+    Args:
+        dump_path (str): Path to a xlsx dump file or a csv or parquet dump directory.
+
+    Returns:
+        str: One of DUMP_FORMATS.
+    """
+    if os.path.isfile(dump_path) and dump_path.endswith(".xlsx"):
+        return "xlsx"
+    for dump_format in ("csv", "parquet"):
+        if os.path.isfile(os.path.join(dump_path, f"sessions.{dump_format}")):
+            return dump_format
+    raise ValueError(f"Could not find a database dump at {dump_path}")
+
+
+def load_database_dump(
+    dump_path: str, db_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+):
+    """Create a database from a dump in any of DUMP_FORMATS.
+
+    The schema is created first so declared column types are kept, rows are
+    streamed in with executemany inside a single transaction and indexes
+    and derived tables are only built once everything is loaded.
+
+    Args:
+        dump_path (str): Path to a xlsx dump file or a csv or parquet dump directory.
+        db_path (str): Path to the created database.
+        chunk_size (int, optional): Number of rows inserted at once.
+            Defaults to DEFAULT_CHUNK_SIZE.
+    """
+    chunk_readers = {
+        "xlsx": _iter_xlsx_chunks,
+        "csv": _iter_csv_chunks,
+        "parquet": _iter_parquet_chunks,
+    }
+    iter_chunks = chunk_readers[get_dump_format(str(dump_path))]
+    create_database(db_path, migrate=False)
+
+    db = connect(db_path)
+    db.execute("PRAGMA synchronous=OFF;")
+    try:
+        with db:
+            for table in TABLES:
+                chunks = iter_chunks(str(dump_path), table, chunk_size)
+                header = next(chunks)
+                columns = [
+                    (position, name)
+                    for position, name in enumerate(header)
+                    if name in get_table_columns(table)
+                ]
+                insert = f"""INSERT INTO {table}
+                    ({', '.join(name for _, name in columns)})
+                    VALUES ({','.join('?' * len(columns))});"""
+                for rows in chunks:
+                    db.executemany(insert, (_dump_values(row, columns) for row in rows))
+    finally:
+        db.execute("PRAGMA synchronous=NORMAL;")
+    migrate_database(db_path)
+
+
+def create_database_from_xlsx(xlsx_path: str, db_path: str):
+    """Create a database from a xlsx dump file.
+
+    Args:
+        xlsx_path (str): Path to the xslx dump.
+        db_path (str): Path to the created database.
+    """
+    load_database_dump(xlsx_path, db_path)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build a parser for database command line interface.
+
+    Returns:
+        ArgumentParser: Parser for the database CLI.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--path",
+        "-p",
+        help="Path to the database. Default to timerbot.db",
+        default="timerbot.db",
+    )
+    parser.add_argument(
+        "--dump-path",
+        "-o",
+        help="Path to the database dump. Default to database_dumps",
+        default="database_dumps",
+    )
+    parser.add_argument(
+        "--format",
+        "-f",
+        help="Format of the database dump. Default to xlsx",
+        choices=DUMP_FORMATS,
+        default="xlsx",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        help=f"Number of rows streamed at once. Default to {DEFAULT_CHUNK_SIZE}",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+    )
+    parser.add_argument(
+        "--load-dump",
+        "-l",
+        help="Path to the xlsx file or csv/parquet directory dump to load from."
+        " No loading if None given.",
+        default=None,
+    )
+    parser.add_argument(
+        "--migrate",
+        "-m",
+        help="Upgrade the database schema in place to the latest version.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--check-summaries",
+        help="Check the summaries against sessions and rebuild them if inconsistent.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--backfill-rollup",
+        help="Rebuild the daily rollup table from all sessions.",
+        action="store_true",
+    )
+    return parser
+
+
+def main():
+    """Main database command line interface."""
+    parser = build_parser()
+    config = parser.parse_args()
+
+    db_path = config.path
+    if config.dump_path is not None and os.path.isfile(db_path):
+        dump_database(db_path, config.dump_path, config.format, config.chunk_size)
+
+    if config.migrate:
+        version = migrate_database(db_path)
+        print(f"Database schema is at version {version}")
+
+    if config.check_summaries:
+        inconsistents = check_summaries(db_path, rebuild=True)
+        for project, username in inconsistents:
+            print(f"Rebuilt inconsistent summary of {username} on {project}")
+
+    if config.backfill_rollup:
+        rebuild_daily_rollup(db_path)
+        count = connect(db_path).execute("SELECT COUNT(*) FROM daily_rollup;")
+        print(f"daily_rollup: {count.fetchone()[0]} rows built")
+
+    if config.load_dump is not None:
+        close_database(db_path)
+        if os.path.isfile(db_path):
+            os.remove(db_path)
+        load_database_dump(config.load_dump, db_path, config.chunk_size)
+        for table_name in TABLES:
+            count = connect(db_path).execute(f"SELECT COUNT(*) FROM {table_name};")
+            print(f"{table_name}: {count.fetchone()[0]} rows loaded")
+
+
+if __name__ == "__main__":
+    main()
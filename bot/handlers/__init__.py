@@ -1,5 +1,6 @@
 """ Module for telegram bot handlers. """
 
+from functools import partial
 from typing import Dict
 from telegram import (
     Chat,
@@ -12,36 +13,88 @@ from telegram import (
 
 from telegram.ext import CallbackContext
 
-from bot import ISWORKING, SUMMARY, TIMELINE
+from bot import ISWORKING, REPORTS, SUMMARY, TIMELINE, TIMELINE_WINDOWS
 from bot.dataclasses import Session
-from bot.database import create_database
-from bot.handlers.utils import get_chat_name, get_user_name, try_delete_message
+from bot.database import close_database, create_database, get_database
+from bot.state import OpenSessionsStore, ProjectsState, StateStore, UsersState
+from bot.steps import blocking, sync_steps
+from bot.writer import SessionWriter
+from bot.handlers.utils import (
+    get_chat_name,
+    get_user_name,
+    try_delete_message,
+    update_can_delete_messages,
+)
 from bot.handlers.start import (
-    handle_current_tasks_dict,
+    get_chosen_task,
+    handle_task_menu,
     send_session_start,
     handle_start,
 )
 from bot.handlers.stop import handle_stop, send_session_stop
 from bot.handlers.load_tasks import store_task, handle_load_task
+from bot.handlers.reports import handle_report
 from bot.handlers.show_data import (
     handle_is_working,
     handle_summary,
+    handle_timeline_menu,
     send_gantt,
+    shutdown_render_pool,
+    timeline_window_data,
 )
 
 
 class BotHandler:
-    """The global Bot class to handle users interactions."""
+    """The global Bot class to handle users interactions.
+
+    Handler methods are steps run synchronously when called, see `bot.steps`.
+
+    Args:
+        db_path (str): Path to the database file.
+        durable_writes (bool, optional): Whether to wait for work sessions to
+            be committed before replying. Defaults to False.
+        timeline_cdn (bool, optional): Whether sent timelines load plotly.js
+            from a CDN. Defaults to False.
+    """
 
-    def __init__(self, db_path: str) -> None:
+    def __init__(
+        self, db_path: str, durable_writes: bool = False, timeline_cdn: bool = False
+    ) -> None:
         self.db_path = db_path
+        self.durable_writes = durable_writes
+        self.timeline_cdn = timeline_cdn
+        self.database = get_database(db_path)
         create_database(db_path)
-        self.workers_in_chats: Dict[Chat, Dict[str, Session]] = {}
-        self.current_tasks_dict: Dict[Chat, Dict[User, dict]] = {}
-        self.wait_start_comment: Dict[str, bool] = {}
-        self.wait_stop_comment: Dict[str, bool] = {}
-        self.wait_tasks: Dict[str, bool] = {}
+        # State changes are queued to the writer, handlers never write to disk.
+        self.writer = SessionWriter(db_path).attach()
+        self.writer.replay_failed()
+        # Replayed sessions delete their open sessions, loaded just below.
+        self.writer.flush()
+        self.workers_in_chats: Dict[Chat, Dict[str, Session]] = ProjectsState(
+            OpenSessionsStore(db_path)
+        )
+        # Ids of the task shown in the tasks menu of each user, or chosen by them.
+        self.current_task_nodes: Dict[Chat, Dict[User, str]] = ProjectsState(
+            StateStore(db_path, "current_task_nodes")
+        )
+        self.wait_start_comment: Dict[str, bool] = UsersState(
+            StateStore(db_path, "wait_start_comment")
+        )
+        self.wait_stop_comment: Dict[str, bool] = UsersState(
+            StateStore(db_path, "wait_stop_comment")
+        )
+        self.wait_tasks: Dict[str, bool] = UsersState(StateStore(db_path, "wait_tasks"))
+
+    def close(self) -> None:
+        """Release the resources held by the handler, such as database connections.
+
+        Sessions still queued for writing are flushed first.
+        """
+        self.writer.close()
+        shutdown_render_pool()
+        close_database(self.db_path)
 
+    @sync_steps
     def start(self, update: Update, context: CallbackContext) -> None:
         """Let a user start a task.
 
@@ -51,10 +104,9 @@ class BotHandler:
         """
         username = get_user_name(update.effective_user)
         chat = get_chat_name(update.effective_chat)
-        if chat not in self.workers_in_chats:
-            self.workers_in_chats[chat] = {}
+        self.workers_in_chats.setdefault(chat, {})
 
-        task_dict = handle_start(
+        node_id = yield from handle_start.steps(
             bot_handler=self,
             user=update.effective_user,
             bot=context.bot,
@@ -63,11 +115,10 @@ class BotHandler:
             query=update.callback_query,
             db_path=self.db_path,
         )
-        if task_dict:
-            if chat not in self.current_tasks_dict:
-                self.current_tasks_dict[chat] = {}
-            self.current_tasks_dict[chat][username] = task_dict
+        if node_id is not None:
+            self.current_task_nodes.setdefault(chat, {})[username] = node_id
 
+    @sync_steps
     def start_session(
         self,
         user: User,
@@ -88,11 +139,15 @@ class BotHandler:
         chat_name = get_chat_name(chat)
         date = message.date
 
-        task = self.current_tasks_dict.get(chat_name, {}).get(author)
+        task = None
+        node_id = self.current_task_nodes.get(chat_name, {}).get(author)
+        if node_id is not None:
+            task = yield blocking(get_chosen_task, self.db_path, chat_name, node_id)
         session = Session(author, date, message.text, task)
         self.workers_in_chats[chat_name][author] = session
         return session
 
+    @sync_steps
     def stop(self, update: Update, context: CallbackContext) -> None:
         """Stop a session for the given user.
 
@@ -100,10 +155,11 @@ class BotHandler:
             update (Update): Incomming update.
             context (CallbackContext): Context of the update.
         """
-        username = handle_stop(update, context, self.workers_in_chats)
+        username = yield from handle_stop.steps(update, context, self.workers_in_chats)
         if username:
             self.wait_stop_comment[username] = True
 
+    @sync_steps
     def data_menu(self, update: Update, context: CallbackContext) -> None:
         """Display the data menu.
 
@@ -118,19 +174,26 @@ class BotHandler:
             [InlineKeyboardButton(SUMMARY, callback_data=SUMMARY)],
             [InlineKeyboardButton(TIMELINE, callback_data=TIMELINE)],
         ]
-        if not try_delete_message(
-            context.bot,
-            update.effective_chat,
-            update.message.message_id,
+        buttons += [
+            [InlineKeyboardButton(report, callback_data=report)] for report in REPORTS
+        ]
+        if not (
+            yield from try_delete_message.steps(
+                context.bot,
+                update.effective_chat,
+                update.message.message_id,
+            )
         ):
             return
 
-        context.bot.send_message(
+        yield partial(
+            context.bot.send_message,
             chat_id=update.effective_chat.id,
             text=f"What do you want to do {get_user_name(user)}?",
             reply_markup=InlineKeyboardMarkup(buttons),
         )
 
+    @sync_steps
     def load_task(self, update: Update, context: CallbackContext) -> None:
         """Load a tasks yaml file.
 
@@ -141,8 +204,9 @@ class BotHandler:
         """
         author = get_user_name(update.effective_user)
         self.wait_tasks[author] = True
-        handle_load_task(update, context)
+        yield from handle_load_task.steps(update, context)
 
+    @sync_steps
     def textHandler(self, update: Update, context: CallbackContext):
         """Handle a text input.
 
@@ -157,19 +221,25 @@ class BotHandler:
         author = get_user_name(user)
         chat_name = get_chat_name(chat)
         if author in self.wait_start_comment and self.wait_start_comment[author]:
-            session = self.start_session(user, chat, message)
+            session = yield from self.start_session.steps(self, user, chat, message)
             self.wait_start_comment[author] = False
-            current_task_dict = self.current_tasks_dict.get(chat_name, {})
-            if author in current_task_dict:
-                self.current_tasks_dict[chat_name].pop(author)
+            if author in self.current_task_nodes.get(chat_name, {}):
+                self.current_task_nodes[chat_name].pop(author)
 
-            send_session_start(context.bot, chat, message, session)
+            yield from send_session_start.steps(context.bot, chat, message, session)
         if author in self.wait_stop_comment and self.wait_stop_comment[author]:
             self.wait_stop_comment[author] = False
-            send_session_stop(
-                user, chat, context.bot, message, self.db_path, self.workers_in_chats
+            yield from send_session_stop.steps(
+                user,
+                chat,
+                context.bot,
+                message,
+                self.db_path,
+                self.workers_in_chats,
+                durable=self.durable_writes,
             )
 
+    @sync_steps
     def yamlHandler(self, update: Update, context: CallbackContext):
         """Handle a yaml file input.
 
@@ -181,8 +251,9 @@ class BotHandler:
         author = get_user_name(update.effective_user)
         if author in self.wait_tasks and self.wait_tasks[author]:
             self.wait_tasks[author] = False
-            store_task(update, context, self.db_path)
+            yield from store_task.steps(update, context, self.db_path)
 
+    @sync_steps
     def queryHandler(self, update: Update, context: CallbackContext):
         """Handle queries inputs.
 
@@ -194,31 +265,53 @@ class BotHandler:
         user: User = update.effective_user
         author = get_user_name(user)
         chat_name = get_chat_name(update.effective_chat)
-        current_tasks_dict = self.current_tasks_dict.get(chat_name, {})
-        if author in current_tasks_dict:
-            chat_tasks = self.current_tasks_dict[chat_name][author]
-            self.current_tasks_dict[chat_name][author] = handle_current_tasks_dict(
+        current_task_nodes = self.current_task_nodes.get(chat_name, {})
+        if author in current_task_nodes:
+            current_task_nodes[author] = yield from handle_task_menu.steps(
                 bot_handler=self,
                 user=user,
                 bot=context.bot,
                 chat=update.effective_chat,
                 query=update.callback_query,
-                current_tasks_dict=chat_tasks,
+                node_id=current_task_nodes[author],
+                db_path=self.db_path,
             )
         elif text == ISWORKING:
-            handle_is_working(update, context, self.workers_in_chats)
+            yield from handle_is_working.steps(update, context, self.workers_in_chats)
         elif text.startswith(SUMMARY):
-            handle_summary(update, context, self.db_path)
+            yield from handle_summary.steps(update, context, self.db_path)
+        elif text in REPORTS:
+            yield from handle_report.steps(update, context, self.db_path, REPORTS[text])
         elif text == TIMELINE:
-            send_gantt(
+            yield from handle_timeline_menu.steps(update.callback_query)
+        elif text.startswith(TIMELINE):
+            window = text[len(timeline_window_data("")) :]
+            yield from send_gantt.steps(
                 context.bot,
                 update.effective_chat,
                 update.callback_query,
                 self.db_path,
-                tmp_path=f"{chat_name.capitalize()}_timeline.html",
+                filename=f"{chat_name.capitalize()}_timeline.html",
+                days=TIMELINE_WINDOWS.get(window),
+                include_plotlyjs="cdn" if self.timeline_cdn else True,
             )
 
     @staticmethod
+    def my_chat_member(update: Update, _context: CallbackContext):
+        """Handle changes of the bot member status in a chat.
+
+        Args:
+            update (Update): Incomming update.
+            _context (CallbackContext): Context of the update, unused.
+        """
+        member = update.my_chat_member.new_chat_member
+        update_can_delete_messages(
+            update.effective_chat.id,
+            bool(getattr(member, "can_delete_messages", False)),
+        )
+
+    @staticmethod
+    @sync_steps
     def unknown(update: Update, context: CallbackContext):
         """Handle unknown commands.
 
@@ -226,7 +319,8 @@ class BotHandler:
             update (Update): Incomming update.
             context (CallbackContext): Context of the update.
         """
-        context.bot.send_message(
+        yield partial(
+            context.bot.send_message,
             chat_id=update.effective_chat.id,
             text="Sorry, I didn't understand that command.",
         )
@@ -1,5 +1,7 @@
 """ Module for tasks loaders handler. """
 
+from functools import partial
+
 from telegram import Update
 from telegram.ext import CallbackContext
 
@@ -7,29 +9,45 @@ from bot.handlers.utils import get_chat_name, get_user_name
 from bot.tasks import parse_tasks, read_tasks
 from bot.database import add_tasks
 from bot.logging import get_logger
+from bot.steps import blocking, sync_steps
 
 LOGGER = get_logger(__name__)
 
 
+@sync_steps
 def store_task(update: Update, context: CallbackContext, db_path: str):
     chat = get_chat_name(update.effective_chat)
     author = get_user_name(update.effective_user)
 
-    yaml_file = update.message.document.get_file()
-    tasks = read_tasks(yaml_file)
-    add_tasks(db_path, chat, tasks)
+    yaml_file = yield partial(update.message.document.get_file)
+    content = yield partial(yaml_file.download_as_bytearray)
+    tasks = read_tasks(bytes(content).decode("utf-8"))
+    yield blocking(add_tasks, db_path, chat, tasks)
 
-    context.bot.delete_message(update.effective_chat.id, update.message.message_id)
-    context.bot.send_message(
-        update.effective_chat.id, f"{author} has updated project tasks."
+    yield partial(
+        context.bot.delete_message,
+        update.effective_chat.id,
+        update.message.message_id,
+    )
+    yield partial(
+        context.bot.send_message,
+        update.effective_chat.id,
+        f"{author} has updated project tasks.",
     )
     tasks_str = str([task for task, _ in parse_tasks(tasks)])
     LOGGER.info("Tasks uploaded on %s: %s", chat, tasks_str)
 
 
+@sync_steps
 def handle_load_task(update: Update, context: CallbackContext):
     author = get_user_name(update.effective_user)
-    context.bot.delete_message(update.effective_chat.id, update.message.message_id)
-    context.bot.send_message(
-        update.effective_chat.id, f"Please {author} send tasks in yaml format."
+    yield partial(
+        context.bot.delete_message,
+        update.effective_chat.id,
+        update.message.message_id,
+    )
+    yield partial(
+        context.bot.send_message,
+        update.effective_chat.id,
+        f"Please {author} send tasks in yaml format.",
     )
@@ -0,0 +1,82 @@
+""" Module for in-chat analytics reports handler. """
+
+from functools import partial
+from typing import List
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from bot.handlers.utils import get_chat_name, pretty_time_delta
+from bot.reports import get_periods_report, get_tasks_report, get_workload_report
+from bot.steps import blocking, sync_steps
+
+# Telegram refuses longer messages.
+MAX_MESSAGE_LENGTH = 4096
+
+
+def format_tasks_report(db_path: str, project: str) -> List[str]:
+    lines = ["Time spent per task:"]
+    for task, duration, sessions, users in get_tasks_report(db_path, project):
+        task = task.capitalize() if task else "No task"
+        sessions_str = f"{sessions} session{'s' if sessions > 1 else ''}"
+        users_str = f"{users} user{'s' if users > 1 else ''}"
+        lines.append(
+            f"{task}: {pretty_time_delta(duration)} ({sessions_str}, {users_str})"
+        )
+    return lines
+
+
+def format_periods_report(db_path: str, project: str, period: str) -> List[str]:
+    lines = [f"Time spent per {period}:"]
+    last_period = None
+    for current, username, duration, share, _ in get_periods_report(
+        db_path, project, period
+    ):
+        if current != last_period:
+            lines.append(current)
+            last_period = current
+        lines.append(f"  {username}: {pretty_time_delta(duration)} ({share:.0%})")
+    return lines
+
+
+def format_workload_report(db_path: str, project: str) -> List[str]:
+    lines = ["Time spent against estimates:"]
+    for task, estimate, duration in get_workload_report(db_path, project):
+        progress = f" ({duration / estimate:.0%})" if estimate else ""
+        lines.append(
+            f"{task.capitalize()}: {pretty_time_delta(duration)}"
+            f" / {pretty_time_delta(estimate)}{progress}"
+        )
+    return lines
+
+
+@sync_steps
+def handle_report(update: Update, context: CallbackContext, db_path: str, report: str):
+    """Send a report of the chat project.
+
+    Args:
+        update (Update): Incomming update.
+        context (CallbackContext): Context of the update.
+        db_path (str): Path to the database file.
+        report (str): Kind of report, "tasks", "week", "month" or "workload".
+    """
+    chat = get_chat_name(update.effective_chat)
+    call = update.callback_query
+    if report == "tasks":
+        lines = yield blocking(format_tasks_report, db_path, chat)
+    elif report == "workload":
+        lines = yield blocking(format_workload_report, db_path, chat)
+    else:
+        lines = yield blocking(format_periods_report, db_path, chat, report)
+
+    if len(lines) == 1:
+        yield partial(call.answer, text="Nothing to report yet.")
+        yield partial(call.delete_message)
+        return
+
+    msg = "\n".join(lines)
+    if len(msg) > MAX_MESSAGE_LENGTH:
+        msg = msg[: MAX_MESSAGE_LENGTH - 4].rsplit("\n", 1)[0] + "\n..."
+    yield partial(context.bot.send_message, chat_id=update.effective_chat.id, text=msg)
+    yield partial(call.answer)
+    yield partial(call.delete_message)
@@ -1,24 +1,61 @@
 """ Module for in-chat data visualisation handler """
 
-from datetime import timedelta
-import os
-from typing import Dict
-import plotly
-from telegram import Bot, CallbackQuery, Chat, Update
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+import multiprocessing
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, Union
+from telegram import (
+    Bot,
+    CallbackQuery,
+    Chat,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Update,
+)
 from telegram.ext import CallbackContext
 
 
+from bot import TIMELINE, TIMELINE_WINDOWS
+from bot.cache import LRUCache
 from bot.dataclasses import Session
 from bot.handlers.utils import (
     get_chat_name,
     pretty_time_delta,
 )
-from bot.database import get_all, get_summary
+from bot.database import (
+    add_sessions_listener,
+    flush_writes,
+    get_last_session_id,
+    get_sessions,
+    get_summary,
+)
+from bot.logging import get_logger
+from bot.steps import Steps, blocking, spawn, sync_steps, wait
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import plotly
+
+LOGGER = get_logger(__name__)
+
+# Rendered summary texts by database path and project.
+SUMMARY_CACHE = LRUCache(maxsize=256)
+
+# Rendered timelines by project, window, last session id and plotly.js mode.
+# Pages inlining plotly.js weigh about 5MB, the cache is bounded in bytes.
+TIMELINE_CACHE = LRUCache(maxsize=64, maxbytes=64 * 2**20)
+RENDER_WORKERS = 2
+# Above this number of bars, sessions are summed by day, then by week.
+TIMELINE_MAX_BARS = 2000
+AGGREGATION_PERIODS = {"day": "D", "week": "W"}
 
-import pandas as pd
-import plotly.express as px
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_lock = threading.Lock()
 
 
+@sync_steps
 def handle_is_working(
     update: Update,
     context: CallbackContext,
@@ -38,74 +75,362 @@ def handle_is_working(
                 for worker, session in workers_in_chat.items()
             ]
             workers_str = "\n".join(workers_infos)
-            context.bot.send_message(
+            yield partial(
+                context.bot.send_message,
                 chat_id=update.effective_chat.id,
                 text=f"Currently working:\n{workers_str}",
             )
-            call.answer()
+            yield partial(call.answer)
         else:
-            call.answer(text="No one is working at the moment.")
+            yield partial(call.answer, text="No one is working at the moment.")
 
     # If chat is not even instanciated
     else:
-        call.answer(text="No one ever worked here since I'm alive.")
-    call.delete_message()
+        yield partial(call.answer, text="No one ever worked here since I'm alive.")
+    yield partial(call.delete_message)
+
+
+def _invalidate_summaries(db_path: str, projects: Set[str]):
+    for project in projects:
+        SUMMARY_CACHE.invalidate((db_path, project))
+
+
+add_sessions_listener(_invalidate_summaries)
+
+
+def format_summary(db_path: str, project: str) -> str:
+    """Format the summary of time spent by each user on a project.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+
+    Returns:
+        str: Text of the summary.
+    """
+    summary = get_summary(db_path, project)
+    return "Summary of time spent:\n" + "\n".join(
+        [f"{user}: {pretty_time_delta(duration)}" for user, duration in summary.values]
+    )
+
+
+def get_cached_summary(db_path: str, project: str) -> str:
+    """Get the summary of a project, formatted again only after new sessions.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+
+    Returns:
+        str: Text of the summary.
+    """
+    # Queued sessions invalidate the cached summary once written.
+    flush_writes(db_path)
+    msg = SUMMARY_CACHE.get_or_compute(
+        (str(db_path), project), lambda: format_summary(db_path, project)
+    )
+    LOGGER.debug("Summary cache: %s", SUMMARY_CACHE.info())
+    return msg
 
 
+@sync_steps
 def handle_summary(update: Update, context: CallbackContext, db_path: str):
     chat = get_chat_name(update.effective_chat)
-    summary = get_summary(db_path, chat)
+    msg = yield blocking(get_cached_summary, db_path, chat)
     call = update.callback_query
-    msg = "Summary of time spent:\n" + "\n".join(
-        [f"{user}: {pretty_time_delta(duration)}" for user, duration in summary.values]
+    yield partial(context.bot.send_message, chat_id=update.effective_chat.id, text=msg)
+    yield partial(call.answer)
+    yield partial(call.delete_message)
+
+
+def warm_up():
+    """Import the analytics stack ahead of the first data request.
+
+    Pandas and plotly take seconds to import, they are only loaded on first
+    use so the bot starts serving commands without waiting for them. Run in
+    a background thread after startup to hide that delay from users.
+    """
+    # pylint: disable=import-outside-toplevel,unused-import
+    import pandas
+    import plotly.express
+
+    LOGGER.debug("Analytics stack loaded")
+
+
+def format_durations(durations: "pd.Series") -> "pd.Series":
+    """Format durations in seconds as H:MM:SS strings.
+
+    Args:
+        durations (pd.Series): Durations in seconds.
+
+    Returns:
+        pd.Series: Formatted durations.
+    """
+    seconds = durations.fillna(0).round().astype("int64")
+    minutes = (seconds // 60 % 60).astype(str).str.zfill(2)
+    return (
+        (seconds // 3600).astype(str)
+        + ":"
+        + minutes
+        + ":"
+        + (seconds % 60).astype(str).str.zfill(2)
+    )
+
+
+def aggregate_sessions(sessions_df: "pd.DataFrame", period: str) -> "pd.DataFrame":
+    """Sum the sessions of each user by task over days or weeks.
+
+    Each bucket is drawn as consecutive bars from the beginning of the period,
+    one per task and as long as the total time spent on it.
+
+    Args:
+        sessions_df (pd.DataFrame): Sessions with parsed start dates.
+        period (str): Period of the buckets, one of AGGREGATION_PERIODS.
+
+    Returns:
+        pd.DataFrame: One row per user, period and task with the summed
+            duration, the number of sessions and the start and stop of its bar.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    freq = AGGREGATION_PERIODS[period]
+    buckets = sessions_df.assign(
+        period=sessions_df["start"].dt.to_period(freq).dt.start_time
+    )
+    aggregated_df = (
+        buckets.groupby(["username", "period", "task"], dropna=False, sort=True)
+        .agg(duration=("duration", "sum"), sessions=("duration", "size"))
+        .reset_index()
+    )
+    offsets = (
+        aggregated_df.groupby(["username", "period"])["duration"].cumsum()
+        - aggregated_df["duration"]
+    )
+    aggregated_df["start"] = aggregated_df["period"] + pd.to_timedelta(
+        offsets, unit="s"
+    )
+    aggregated_df["stop"] = aggregated_df["start"] + pd.to_timedelta(
+        aggregated_df["duration"], unit="s"
     )
-    context.bot.send_message(chat_id=update.effective_chat.id, text=msg)
-    call.answer()
-    call.delete_message()
+    return aggregated_df
 
 
-def plot_gantt(sessions_df: pd.DataFrame) -> plotly.graph_objs.Figure:
-    sessions_df.columns = [title.capitalize() for title in sessions_df.columns]
-    sessions_df["Duration"] = sessions_df["Duration"].apply(
-        lambda dt: str(timedelta(seconds=dt))
+def downsample_sessions(
+    sessions_df: "pd.DataFrame", max_bars: int = TIMELINE_MAX_BARS
+) -> Tuple["pd.DataFrame", Optional[str]]:
+    """Aggregate sessions by the finest period keeping the timeline readable.
+
+    Args:
+        sessions_df (pd.DataFrame): Sessions with parsed start dates.
+        max_bars (int, optional): Maximum number of bars to draw.
+            Defaults to TIMELINE_MAX_BARS.
+
+    Returns:
+        Tuple[pd.DataFrame, Optional[str]]: Rows to draw and their aggregation
+            period, None if sessions are drawn one by one.
+    """
+    if len(sessions_df) <= max_bars:
+        return sessions_df, None
+    for period in AGGREGATION_PERIODS:
+        aggregated_df = aggregate_sessions(sessions_df, period)
+        if len(aggregated_df) <= max_bars:
+            break
+    return aggregated_df, period
+
+
+def plot_gantt(
+    sessions_df: "pd.DataFrame", title: str = "Project timeline"
+) -> "plotly.graph_objs.Figure":
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+    import plotly.express as px
+
+    timeline_df = sessions_df.rename(columns=str.capitalize)
+    for column in ("Start", "Stop"):
+        if not pd.api.types.is_datetime64_any_dtype(timeline_df[column]):
+            timeline_df[column] = pd.to_datetime(timeline_df[column])
+    timeline_df["Duration"] = format_durations(timeline_df["Duration"])
+    # Tasks are all missing, and read as floats, in projects without tasks.
+    timeline_df["Task"] = (
+        timeline_df["Task"].astype("string").str.capitalize().fillna("No task")
     )
-    sessions_df["Task"] = sessions_df["Task"].apply(lambda task: task.capitalize())
 
+    hover_data = [
+        column
+        for column in (
+            "Period",
+            "Start",
+            "Stop",
+            "Start_comment",
+            "Stop_comment",
+            "Duration",
+            "Sessions",
+        )
+        if column in timeline_df.columns
+    ]
     # create gantt/timeline chart.
     fig = px.timeline(
-        sessions_df,
+        timeline_df,
         x_start="Start",
         x_end="Stop",
         y="Username",
         color="Task",
-        title="Project timeline",
-        hover_data=[
-            "Start",
-            "Stop",
-            "Start_comment",
-            "Stop_comment",
-            "Duration",
-        ],
+        title=title,
+        hover_data=hover_data,
     )
     # shows charts in reversed, so last row of dataframe will show at bottom
     fig.update_yaxes(autorange="reversed")
     return fig
 
 
+def timeline_window_data(window: str) -> str:
+    return f"{TIMELINE}:{window}"
+
+
+@sync_steps
+def handle_timeline_menu(query: CallbackQuery):
+    buttons = [
+        [InlineKeyboardButton(window, callback_data=timeline_window_data(window))]
+        for window in TIMELINE_WINDOWS
+    ]
+    yield partial(query.edit_message_text, "Which period do you want to see?")
+    yield partial(query.edit_message_reply_markup, InlineKeyboardMarkup(buttons))
+    yield partial(query.answer)
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Get the process pool rendering timelines, starting it if needed.
+
+    Returns:
+        ProcessPoolExecutor: Pool of rendering processes.
+    """
+    global _render_pool  # pylint: disable=global-statement
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _render_pool
+
+
+def shutdown_render_pool():
+    """Stop the process pool rendering timelines, if started."""
+    global _render_pool  # pylint: disable=global-statement
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown()
+            _render_pool = None
+
+
+def render_timeline(
+    sessions_df: "pd.DataFrame",
+    include_plotlyjs: Union[bool, str] = True,
+    max_bars: int = TIMELINE_MAX_BARS,
+) -> bytes:
+    """Render the timeline of sessions as a standalone html page.
+
+    Long histories are summed by day or week so the page stays light.
+
+    Args:
+        sessions_df (pd.DataFrame): Sessions to show.
+        include_plotlyjs (Union[bool, str], optional): True to inline plotly.js,
+            "cdn" to load it from a CDN which makes the page several megabytes
+            lighter. Defaults to True.
+        max_bars (int, optional): Maximum number of bars before aggregating
+            sessions. Defaults to TIMELINE_MAX_BARS.
+
+    Returns:
+        bytes: Html page of the timeline.
+    """
+    timeline_df, period = downsample_sessions(sessions_df, max_bars)
+    title = "Project timeline"
+    if period is not None:
+        title += f" (time spent by {period})"
+    fig = plot_gantt(timeline_df, title=title)
+    return fig.to_html(include_plotlyjs=include_plotlyjs).encode("utf-8")
+
+
+def _send_timeline(bot: Bot, chat: Chat, timeline: bytes, filename: str) -> partial:
+    # Raw bytes, unlike a stream, are sent whole again if the request is retried.
+    return partial(
+        bot.send_document, chat_id=chat.id, document=timeline, filename=filename
+    )
+
+
+def _submit_render(
+    sessions_df: "pd.DataFrame", include_plotlyjs: Union[bool, str]
+) -> Future:
+    return get_render_pool().submit(render_timeline, sessions_df, include_plotlyjs)
+
+
+def _deliver_timeline(
+    bot: Bot, chat: Chat, rendered: Future, cache_key: tuple, filename: str
+) -> Steps:
+    try:
+        timeline = yield wait(rendered)
+        TIMELINE_CACHE.set(cache_key, timeline)
+        yield _send_timeline(bot, chat, timeline, filename)
+    except Exception:  # pylint: disable=broad-except
+        LOGGER.exception("Could not render timeline of %s", get_chat_name(chat))
+        yield partial(
+            bot.send_message, chat.id, "Sorry, I could not render the timeline."
+        )
+
+
+@sync_steps
 def send_gantt(
     bot: Bot,
     chat: Chat,
     query: CallbackQuery,
     db_path: str,
-    tmp_path="tmp_gantt.html",
-):
-    sessions_df = get_all(db_path, "sessions")
-    fig = plot_gantt(sessions_df)
-    fig.write_html(tmp_path)
+    filename="timeline.html",
+    days: Optional[int] = None,
+    include_plotlyjs: Union[bool, str] = True,
+) -> Optional[Future]:
+    """Send the timeline of the chat project, rendered in the process pool.
+
+    Args:
+        bot (Bot): The telegram bot.
+        chat (Chat): Chat of the project.
+        query (CallbackQuery): Query of the click asking for the timeline.
+        db_path (str): Path to the database file.
+        filename (str, optional): Name of the sent file. Defaults to "timeline.html".
+        days (Optional[int], optional): Number of days shown, all sessions if
+            None. Defaults to None.
+        include_plotlyjs (Union[bool, str], optional): How plotly.js is included,
+            see `render_timeline`. Defaults to True.
+
+    Returns:
+        Optional[Future]: Delivery of the timeline if it is being rendered.
+    """
+    project = get_chat_name(chat)
+    since = None
+    if days is not None:
+        # The menu message may be old, windows end at the time of the click.
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    last_session_id = yield blocking(get_last_session_id, db_path, project)
+    cache_key = (str(db_path), project, since, last_session_id, include_plotlyjs)
+    cached = TIMELINE_CACHE.get(cache_key)
+    if cached is not None:
+        yield _send_timeline(bot, chat, cached, filename)
+        yield partial(query.answer)
+        yield partial(query.delete_message)
+        return None
 
-    with open(tmp_path, "rb") as tmp_file:
-        bot.send_document(chat_id=chat.id, document=tmp_file)
+    sessions_df = yield blocking(get_sessions, db_path, project, since=since)
+    if sessions_df.empty:
+        yield partial(query.answer, text="No work session to show on this period.")
+        yield partial(query.delete_message)
+        return None
 
-    os.remove(tmp_path)
-    query.answer()
-    query.delete_message()
+    # Rendering takes seconds, the handler is released meanwhile and the
+    # timeline is sent from the background once rendered.
+    rendered = yield blocking(_submit_render, sessions_df, include_plotlyjs)
+    delivered = yield spawn(_deliver_timeline(bot, chat, rendered, cache_key, filename))
+    yield partial(query.answer, text="Rendering the timeline...")
+    yield partial(query.delete_message)
+    return delivered
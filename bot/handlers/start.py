@@ -1,18 +1,20 @@
 """ Module for work session start handler. """
 
-from typing import TYPE_CHECKING, Any, Dict, Tuple, Union
+from functools import partial
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from telegram import Bot, CallbackQuery, Chat, Message, User
 
-from bot import START_CODE
+from bot import PAGE_CODE, START_CODE, TASK_CODE, TASKS_COLUMNS, TASKS_PER_PAGE
 from bot.dataclasses import Session
 from bot.handlers.utils import (
     ask_comment,
     create_reply_markup,
     get_chat_name,
     try_delete_message,
-    edit_reply_markup,
 )
-from bot.database import get_project_tasks_dict
+from bot.database import get_project_navigator
+from bot.steps import blocking, sync_steps
+from bot.tasks import TaskNavigator
 from bot.logging import get_logger
 
 if TYPE_CHECKING:
@@ -46,6 +48,7 @@ def start_msg_format(session: Session):
     return f"{START_CODE} {session_comment_txt(session)}"
 
 
+@sync_steps
 def handle_start(
     bot_handler: "BotHandler",
     user: User,
@@ -54,27 +57,29 @@ def handle_start(
     message: Message,
     query: CallbackQuery,
     db_path: str,
-) -> Tuple[dict, str]:
+) -> Optional[str]:
 
-    if not try_delete_message(bot, chat, message.message_id):
-        return {}, ""
+    if not (yield from try_delete_message.steps(bot, chat, message.message_id)):
+        return None
 
-    tasks_dict = get_project_tasks_dict(db_path, get_chat_name(chat))
-    if tasks_dict:
-        reply_markup = create_reply_markup(list(tasks_dict.keys()))
-        bot.send_message(
+    navigator = yield blocking(get_project_navigator, db_path, get_chat_name(chat))
+    if navigator.tree:
+        reply_markup = task_reply_markup(navigator)
+        yield partial(
+            bot.send_message,
             chat_id=chat.id,
             text="Choose a task:",
             reply_markup=reply_markup,
         )
-        return tasks_dict
+        return TaskNavigator.ROOT_ID
 
-    ask_comment(bot_handler, user, bot, chat, query)
+    yield from ask_comment.steps(bot_handler, user, bot, chat, query)
     if query is not None:
-        query.delete_message()
-    return {}
+        yield partial(query.delete_message)
+    return None
 
 
+@sync_steps
 def send_session_start(
     bot: Bot,
     chat: Chat,
@@ -82,37 +87,146 @@ def send_session_start(
     session: Session,
 ):
     chat_name = get_chat_name(chat)
-    bot.delete_message(chat.id, message.message_id)
+    yield partial(bot.delete_message, chat.id, message.message_id)
     msg = start_msg_format(session)
-    bot.send_message(chat.id, msg)
+    yield partial(bot.send_message, chat.id, msg)
     LOGGER.info("Update on %s: %s", chat_name, msg)
 
 
-def _get_next_task_layer(current_tasks_dict: Dict[str, Union[dict, Any]], data: str):
-    if data in current_tasks_dict:
-        return current_tasks_dict[data], data
-    for key in current_tasks_dict:
+def task_options(
+    navigator: TaskNavigator, node_id: str = TaskNavigator.ROOT_ID
+) -> Tuple[List[str], List[str]]:
+    """Get the buttons texts and callback data of the tasks under a node.
+
+    Args:
+        navigator (TaskNavigator): Navigator of the project tasks.
+        node_id (str, optional): Id of the node. Defaults to the root.
+
+    Returns:
+        Tuple[List[str], List[str]]: Names of the tasks and their callback data.
+    """
+    options = navigator.options(node_id)
+    return (
+        [key for key, _ in options],
+        [f"{TASK_CODE}{child_id}" for _, child_id in options],
+    )
+
+
+def task_reply_markup(
+    navigator: TaskNavigator, node_id: str = TaskNavigator.ROOT_ID, page: int = 0
+):
+    """Create the keyboard of a page of the tasks under a node.
+
+    Args:
+        navigator (TaskNavigator): Navigator of the project tasks.
+        node_id (str, optional): Id of the node. Defaults to the root.
+        page (int, optional): Index of the page. Defaults to 0.
+
+    Returns:
+        InlineKeyboardMarkup: Keyboard of the requested page.
+    """
+    return create_reply_markup(
+        *task_options(navigator, node_id),
+        page=page,
+        page_size=TASKS_PER_PAGE,
+        page_data=lambda page: f"{PAGE_CODE}{node_id}:{page}",
+        columns=TASKS_COLUMNS,
+    )
+
+
+def _get_next_task_layer(navigator: TaskNavigator, node_id: str, data: str) -> str:
+    if data.startswith(TASK_CODE):
+        child_id = data[len(TASK_CODE) :]
+        if child_id not in navigator.nodes:
+            # The button was sent before its task was removed or renamed.
+            raise KeyError(f"Task {child_id} no longer exists")
+        return child_id
+
+    # Buttons sent before tasks were indexed hold truncated task names.
+    if node_id not in navigator.children:
+        raise KeyError(f"Task {node_id} no longer exists")
+    options = navigator.options(node_id)
+    for key, child_id in options:
+        if key == data:
+            return child_id
+    for key, child_id in options:
         if key.startswith(data):
-            current_tasks_dict = current_tasks_dict[key]
-            return current_tasks_dict[key], key
-    raise KeyError(f"{data} not found in current_tasks_dict")
+            return child_id
+    raise KeyError(f"{data} not found under task {node_id}")
 
 
-def handle_current_tasks_dict(
+@sync_steps
+def handle_task_menu(
     bot_handler: "BotHandler",
     user: User,
     bot: Bot,
     chat: Chat,
     query: CallbackQuery,
-    current_tasks_dict: Dict[str, Union[dict, Any]],
-):
-    current_tasks_dict, key = _get_next_task_layer(current_tasks_dict, query.data)
+    node_id: str,
+    db_path: str,
+) -> str:
+    """Move in the tasks menu of a user after a click on one of its buttons.
+
+    Args:
+        bot_handler (BotHandler): The global Bot handling users interactions.
+        user (User): User who clicked.
+        bot (Bot): The telegram bot.
+        chat (Chat): Chat of the menu.
+        query (CallbackQuery): Query of the click.
+        node_id (str): Id of the task whose subtasks are shown in the menu.
+        db_path (str): Path to the database file.
 
-    if isinstance(current_tasks_dict, dict):
-        edit_reply_markup("Choose a task:", query, list(current_tasks_dict.keys()))
-        query.answer()
+    Returns:
+        str: Id of the task shown in the menu after the click, or of the task
+            chosen to work on.
+    """
+    navigator = yield blocking(get_project_navigator, db_path, get_chat_name(chat))
+
+    if query.data.startswith(PAGE_CODE):
+        page_node_id, page = query.data[len(PAGE_CODE) :].rsplit(":", 1)
+        if page_node_id in navigator.children:
+            yield partial(
+                query.edit_message_reply_markup,
+                task_reply_markup(navigator, page_node_id, int(page)),
+            )
+        yield partial(query.answer)
+        return node_id
+
+    try:
+        child_id = _get_next_task_layer(navigator, node_id, query.data)
+    except KeyError:
+        yield partial(
+            query.answer,
+            text="Tasks have changed since this menu, please /start again.",
+        )
+        yield partial(query.delete_message)
+        return node_id
+
+    if child_id in navigator.children:
+        yield partial(
+            query.edit_message_text,
+            "Choose a task:",
+            reply_markup=task_reply_markup(navigator, child_id),
+        )
+        yield partial(query.answer)
     else:
-        current_tasks_dict = key
-        ask_comment(bot_handler, user, bot, chat, query)
-        query.delete_message()
-    return current_tasks_dict
+        yield from ask_comment.steps(bot_handler, user, bot, chat, query)
+        yield partial(query.delete_message)
+    return child_id
+
+
+def get_chosen_task(db_path: str, project: str, node_id: str) -> Optional[str]:
+    """Get the name of the task chosen by a user in the tasks menu.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+        node_id (str): Id of the chosen task.
+
+    Returns:
+        Optional[str]: Name of the task, None if it no longer exists.
+    """
+    navigator = get_project_navigator(db_path, project)
+    if node_id not in navigator.nodes:
+        return None
+    return navigator.resolve(node_id)[0]
@@ -1,5 +1,6 @@
 """ Module for work session stop handler. """
 
+from functools import partial
 from typing import Dict, Optional
 from telegram import Bot, Chat, Message, Update, User
 from telegram.ext import CallbackContext
@@ -12,8 +13,9 @@ from bot.handlers.utils import (
     pretty_time_delta,
     try_delete_message,
 )
-from bot.database import add_complete_session
+from bot.database import add_complete_session, flush_writes
 from bot.logging import get_logger
+from bot.steps import blocking, sync_steps
 
 LOGGER = get_logger(__name__)
 
@@ -38,23 +40,27 @@ def stop_msg_format(complete_session: CompleteSession):
     )
 
 
+@sync_steps
 def ask_comment(update: Update, context: CallbackContext):
     author = get_user_name(update.effective_user)
     call = update.callback_query
     msg = f"Please {author} comment what you did."
     if call is not None:
-        call.answer(text=msg)
+        yield partial(call.answer, text=msg)
     else:
-        context.bot.send_message(update.effective_chat.id, msg)
+        yield partial(context.bot.send_message, update.effective_chat.id, msg)
 
 
+@sync_steps
 def handle_stop(
     update: Update,
     context: CallbackContext,
     workers_in_chats: Dict[Chat, Dict[str, Session]],
 ) -> Optional[str]:
-    if not try_delete_message(
-        context.bot, update.effective_chat, update.message.message_id
+    if not (
+        yield from try_delete_message.steps(
+            context.bot, update.effective_chat, update.message.message_id
+        )
     ):
         return ""
 
@@ -62,12 +68,13 @@ def handle_stop(
     chat = get_chat_name(update.effective_chat)
 
     if chat in workers_in_chats and author in workers_in_chats[chat]:
-        ask_comment(update, context)
+        yield from ask_comment.steps(update, context)
         return get_user_name(update.effective_user)
 
     return ""
 
 
+@sync_steps
 def send_session_stop(
     user: User,
     chat: Chat,
@@ -75,15 +82,20 @@ def send_session_stop(
     message: Message,
     db_path: str,
     workers_in_chats: Dict[Chat, Dict[str, Session]],
+    durable: bool = False,
 ):
     author = get_user_name(user)
     chat_name = get_chat_name(chat)
 
     if chat_name in workers_in_chats and author in workers_in_chats[chat_name]:
-        session = workers_in_chats[chat_name].pop(author)
+        # The open session is deleted with the insertion of the complete one.
+        session = workers_in_chats[chat_name].discard(author)
         complete_session = CompleteSession(session, message.date, message.text)
-        add_complete_session(db_path, chat_name, complete_session)
+        yield blocking(add_complete_session, db_path, chat_name, complete_session)
+        if durable:
+            # Reply only once the session is committed.
+            yield blocking(flush_writes, db_path)
         msg = stop_msg_format(complete_session)
-        bot.delete_message(chat.id, message.message_id)
-        bot.send_message(chat_id=chat.id, text=msg)
+        yield partial(bot.delete_message, chat.id, message.message_id)
+        yield partial(bot.send_message, chat_id=chat.id, text=msg)
         LOGGER.info("Update on %s: %s", chat_name, msg)
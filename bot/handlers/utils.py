@@ -1,6 +1,7 @@
 """ Module for utils functions. """
 
-from typing import TYPE_CHECKING, List
+from functools import partial
+from typing import TYPE_CHECKING, Callable, List, Optional
 from telegram import (
     Bot,
     CallbackQuery,
@@ -10,9 +11,18 @@ from telegram import (
     User,
 )
 
+from telegram.error import BadRequest
+
+from bot import NEXT_PAGE, PREVIOUS_PAGE
+from bot.cache import TTLCache
+from bot.steps import sync_steps
+
 if TYPE_CHECKING:
     from bot.handlers import BotHandler as BotHandler
 
+# Whether the bot may delete messages, by chat id.
+CAN_DELETE_CACHE = TTLCache(ttl=600)
+
 
 def pretty_time_delta(seconds, compact=False):
     seconds = int(seconds)
@@ -41,46 +51,131 @@ def get_user_name(user: User):
     return f"@{user.username}"
 
 
+@sync_steps
+def can_delete_messages(bot: Bot, chat: Chat) -> bool:
+    """Check if the bot may delete messages in a chat.
+
+    The permission is cached for each chat until it expires or is updated
+    by `update_can_delete_messages`.
+
+    Args:
+        bot (Bot): The telegram bot.
+        chat (Chat): Chat in which to delete messages.
+
+    Returns:
+        bool: True if the bot may delete messages in the chat.
+    """
+    if chat.type == "private":
+        return True
+    can_delete = CAN_DELETE_CACHE.get(chat.id)
+    if can_delete is None:
+        member = yield partial(bot.get_chat_member, chat.id, bot.id)
+        can_delete = bool(member.can_delete_messages)
+        CAN_DELETE_CACHE.set(chat.id, can_delete)
+    return can_delete
+
+
+def update_can_delete_messages(chat_id: int, can_delete: bool):
+    """Update the cached permission of the bot to delete messages in a chat.
+
+    Args:
+        chat_id (int): Id of the chat.
+        can_delete (bool): Whether the bot may delete messages in the chat.
+    """
+    CAN_DELETE_CACHE.set(chat_id, can_delete)
+
+
+@sync_steps
 def try_delete_message(bot: Bot, chat: Chat, message_id) -> bool:
-    if (
-        chat.type == "private"
-        or bot.getChatMember(chat.id, bot.bot.id).can_delete_messages
-    ):
-        bot.delete_message(chat.id, message_id)
+    if (yield from can_delete_messages.steps(bot, chat)):
+        try:
+            yield partial(bot.delete_message, chat.id, message_id)
+        except BadRequest:
+            # The cached permission may be outdated.
+            CAN_DELETE_CACHE.invalidate(chat.id)
+            raise
         return True
-    bot.send_message(chat.id, "Please allow me to delete messages!")
+    yield partial(bot.send_message, chat.id, "Please allow me to delete messages!")
     return False
 
 
-def create_reply_markup(options: List[str]):
+def create_reply_markup(
+    options: List[str],
+    callback_datas: Optional[List[str]] = None,
+    page: int = 0,
+    page_size: Optional[int] = None,
+    page_data: Optional[Callable[[int], str]] = None,
+    columns: int = 1,
+):
+    """Create an inline keyboard with a button per option.
+
+    Args:
+        options (List[str]): Texts of the buttons.
+        callback_datas (Optional[List[str]], optional): Callback data of the buttons.
+            Defaults to the texts truncated to fit in callback data.
+        page (int, optional): Index of the page to show. Defaults to 0.
+        page_size (Optional[int], optional): Maximum number of options per page,
+            requires page_data. Defaults to None for a single page.
+        page_data (Optional[Callable[[int], str]], optional): Callback data of the
+            button leading to a given page. Defaults to None.
+        columns (int, optional): Number of buttons per row. Defaults to 1.
+
+    Returns:
+        InlineKeyboardMarkup: Keyboard of the requested page.
+    """
+
     def ensure_small(key: str):
         while len(key.encode("utf-8")) > 63:
             key = key[:-1]
         return key
 
+    navigation = []
+    if page_size is not None and page_data is not None and len(options) > page_size:
+        start = page * page_size
+        if page > 0:
+            navigation.append(
+                InlineKeyboardButton(PREVIOUS_PAGE, callback_data=page_data(page - 1))
+            )
+        if start + page_size < len(options):
+            navigation.append(
+                InlineKeyboardButton(NEXT_PAGE, callback_data=page_data(page + 1))
+            )
+        options = options[start : start + page_size]
+        if callback_datas is not None:
+            callback_datas = callback_datas[start : start + page_size]
+
+    if callback_datas is None:
+        callback_datas = [ensure_small(key) for key in options]
     buttons = [
-        [InlineKeyboardButton(key, callback_data=ensure_small(key))] for key in options
+        InlineKeyboardButton(key, callback_data=callback_data)
+        for key, callback_data in zip(options, callback_datas)
     ]
-    return InlineKeyboardMarkup(buttons)
+    rows = [buttons[i : i + columns] for i in range(0, len(buttons), columns)]
+    if navigation:
+        rows.append(navigation)
+    return InlineKeyboardMarkup(rows)
 
 
+@sync_steps
 def edit_reply_markup(
     text: str,
     query: CallbackQuery,
     options: List[str],
+    callback_datas: Optional[List[str]] = None,
 ):
-    reply_markup = create_reply_markup(options)
-    query.edit_message_text(text)
-    query.edit_message_reply_markup(reply_markup)
+    reply_markup = create_reply_markup(options, callback_datas)
+    yield partial(query.edit_message_text, text)
+    yield partial(query.edit_message_reply_markup, reply_markup)
 
 
+@sync_steps
 def ask_comment(
     bot_handler: "BotHandler", user: User, bot: Bot, chat: Chat, query: CallbackQuery
 ):
     username = get_user_name(user)
     msg = f"Please {username} comment what you will work on."
     if query is not None:
-        query.answer(text=msg)
+        yield partial(query.answer, text=msg)
     else:
-        bot.send_message(chat.id, msg)
+        yield partial(bot.send_message, chat.id, msg)
     bot_handler.wait_start_comment[username] = True
@@ -0,0 +1,325 @@
+""" Module for rate limited outbound Telegram requests. """
+
+from collections import deque
+from concurrent.futures import Future
+import functools
+import threading
+import time
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import ExtBot
+
+from bot.logging import get_logger
+
+LOGGER = get_logger(__name__)
+
+# Limits documented by Telegram, groups have negative chat ids.
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+GROUP_RATE = 20 / 60
+CHAT_BURST = 3
+MAX_IDLE_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Token bucket allowing a steady rate of requests with short bursts.
+
+    Not thread-safe, callers must hold their own lock.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, the size of bursts.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def delay(self, now: float, tokens: int = 1) -> float:
+        """Get the time to wait before tokens are available.
+
+        Args:
+            now (float): Current monotonic time.
+            tokens (int, optional): Number of tokens needed, 0 to only wait for
+                the end of a block. Defaults to 1.
+
+        Returns:
+            float: Seconds to wait, 0 if the tokens are available.
+        """
+        self._refill(now)
+        wait = max(0.0, (tokens - self._tokens) / self.rate)
+        return max(wait, self._blocked_until - now)
+
+    def consume(self, now: float, tokens: int = 1):
+        """Take tokens, the caller must have checked they are available.
+
+        Args:
+            now (float): Current monotonic time.
+            tokens (int, optional): Number of tokens taken. Defaults to 1.
+        """
+        self._refill(now)
+        self._tokens -= tokens
+
+    def block(self, until: float):
+        """Give no token before a given time.
+
+        Args:
+            until (float): Monotonic time of the end of the block.
+        """
+        self._blocked_until = max(self._blocked_until, until)
+
+    def is_idle(self, now: float) -> bool:
+        """Whether the bucket is full again, so forgetting it changes nothing."""
+        self._refill(now)
+        return self._tokens >= self.capacity and self._blocked_until <= now
+
+
+class _Request:
+    __slots__ = ("call", "cost", "future", "attempts")
+
+    def __init__(self, call: Callable[[], object], cost: int) -> None:
+        self.call = call
+        self.cost = cost
+        self.future: Future = Future()
+        self.attempts = 0
+
+
+class OutboundQueue:
+    """Queue of requests to Telegram respecting global and per chat rate limits.
+
+    Requests of a same chat are sent one at a time in their submission order,
+    requests of different chats are sent concurrently by a few workers. A
+    request failing with RetryAfter pauses its chat for the asked time and is
+    sent again first.
+
+    Args:
+        global_rate (float, optional): Requests per second across all chats.
+            Defaults to GLOBAL_RATE.
+        chat_rate (float, optional): Requests per second in a private chat.
+            Defaults to CHAT_RATE.
+        group_rate (float, optional): Requests per second in a group.
+            Defaults to GROUP_RATE.
+        burst (int, optional): Requests a chat can send at once after being
+            quiet. Defaults to CHAT_BURST.
+        workers (int, optional): Number of threads sending requests.
+            Defaults to 4.
+        retries (int, optional): Number of retries after a RetryAfter.
+            Defaults to 3.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        group_rate: float = GROUP_RATE,
+        burst: int = CHAT_BURST,
+        workers: int = 4,
+        retries: int = 3,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.retries = retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._pending: Dict[Hashable, Deque[_Request]] = {}
+        self._busy: Set[Hashable] = set()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._run, name=f"Outbound{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_IDLE_BUCKETS:
+                self._prune(time.monotonic())
+            is_group = isinstance(chat_id, int) and chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, self.burst)
+        return bucket
+
+    def _prune(self, now: float):
+        for chat_id, bucket in list(self._buckets.items()):
+            if chat_id not in self._pending and bucket.is_idle(now):
+                del self._buckets[chat_id]
+
+    def submit(
+        self, chat_id: Hashable, fn: Callable, /, *args, cost: int = 1, **kwargs
+    ) -> Future:
+        """Queue a request to send once rate limits allow it.
+
+        Args:
+            chat_id (Hashable): Chat the request is sent to.
+            fn (Callable): Function sending the request.
+            cost (int, optional): Tokens taken from the budget of the chat,
+                0 for requests keeping their order in the chat without being
+                rate limited by it. Defaults to 1.
+
+        Raises:
+            RuntimeError: If the queue is closed.
+
+        Returns:
+            Future: Result of the request.
+        """
+        request = _Request(functools.partial(fn, *args, **kwargs), cost)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Outbound queue is closed")
+            self._pending.setdefault(chat_id, deque()).append(request)
+            self._condition.notify()
+        return request.future
+
+    def _next_request(self) -> Optional[Tuple[Hashable, _Request]]:
+        # Must be called with the lock held, waits until a request can be sent.
+        while True:
+            if self._closed and not self._pending:
+                return None
+            now = time.monotonic()
+            chat_id, delay = None, None
+            for pending_chat, requests in self._pending.items():
+                if pending_chat in self._busy:
+                    continue
+                chat_delay = self._bucket(pending_chat).delay(now, requests[0].cost)
+                if delay is None or chat_delay < delay:
+                    chat_id, delay = pending_chat, chat_delay
+                    if delay == 0:
+                        break
+            if delay is None:
+                self._condition.wait()
+                continue
+            delay = max(delay, self._global.delay(now))
+            if delay > 0:
+                self._condition.wait(delay)
+                continue
+
+            requests = self._pending[chat_id]
+            request = requests.popleft()
+            self._global.consume(now)
+            self._bucket(chat_id).consume(now, request.cost)
+            if not requests:
+                del self._pending[chat_id]
+            self._busy.add(chat_id)
+            return chat_id, request
+
+    def _run(self):
+        while True:
+            with self._condition:
+                next_request = self._next_request()
+            if next_request is None:
+                return
+            chat_id, request = next_request
+            try:
+                result = request.call()
+            except RetryAfter as error:
+                if request.attempts < self.retries:
+                    request.attempts += 1
+                    LOGGER.warning(
+                        "Flood limit reached in chat %s, retrying in %ss",
+                        chat_id,
+                        error.retry_after,
+                    )
+                    with self._condition:
+                        self._bucket(chat_id).block(
+                            time.monotonic() + error.retry_after
+                        )
+                        self._pending.setdefault(chat_id, deque()).appendleft(request)
+                        self._busy.discard(chat_id)
+                        self._condition.notify_all()
+                    continue
+                request.future.set_exception(error)
+            except Exception as error:  # pylint: disable=broad-except
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(result)
+            with self._condition:
+                self._busy.discard(chat_id)
+                self._condition.notify_all()
+
+    def close(self, wait: bool = True):
+        """Stop accepting requests, sending the queued ones.
+
+        Args:
+            wait (bool, optional): Whether to wait for queued requests to be
+                sent. Defaults to True.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+def _log_failure(chat_id: Hashable, name: str, future: Future):
+    error = future.exception()
+    if error is None:
+        return
+    if name == "delete_message" and isinstance(error, BadRequest):
+        # pylint: disable=import-outside-toplevel
+        from bot.handlers.utils import CAN_DELETE_CACHE
+
+        # The cached permission may be outdated.
+        CAN_DELETE_CACHE.invalidate(chat_id)
+    LOGGER.warning("Could not %s in chat %s: %s", name, chat_id, error)
+
+
+class QueuedBot(ExtBot):
+    """Bot sending messages, documents, edits and deletes through an outbound queue.
+
+    Requests are queued without waiting for the rate limits, so handlers are
+    never blocked by a busy chat. They return a future of their result and
+    their failures are only logged. Deletes keep their order in the chat but
+    do not spend its message budget. Callback query answers are not chat
+    messages and are sent directly, clients wait for them.
+
+    Args:
+        queue (OutboundQueue): Queue the requests go through.
+    """
+
+    def __init__(self, *args, queue: OutboundQueue, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.queue = queue
+
+    def _submit(
+        self, name: str, chat_id: Hashable, /, *args, cost: int = 1, **kwargs
+    ) -> Future:
+        future = self.queue.submit(
+            chat_id, getattr(super(), name), *args, cost=cost, **kwargs
+        )
+        future.add_done_callback(functools.partial(_log_failure, chat_id, name))
+        return future
+
+    def send_message(self, chat_id, *args, **kwargs):
+        return self._submit("send_message", chat_id, chat_id, *args, **kwargs)
+
+    def send_document(self, chat_id, *args, **kwargs):
+        return self._submit("send_document", chat_id, chat_id, *args, **kwargs)
+
+    def edit_message_text(self, *args, **kwargs):
+        return self._submit("edit_message_text", kwargs.get("chat_id"), *args, **kwargs)
+
+    def edit_message_reply_markup(self, *args, **kwargs):
+        return self._submit(
+            "edit_message_reply_markup", kwargs.get("chat_id"), *args, **kwargs
+        )
+
+    def delete_message(self, chat_id, message_id, *args, **kwargs) -> bool:
+        self._submit(
+            "delete_message", chat_id, chat_id, message_id, *args, cost=0, **kwargs
+        )
+        return True
@@ -0,0 +1,121 @@
+""" Module for the analytics reports of projects, aggregated in the database. """
+
+from typing import List, Optional, Tuple
+
+from bot.database import connect, flush_writes
+
+# Task workloads are estimated in JEH, a day of 8 hours of work.
+JEH_SECONDS = 8 * 3600
+
+# Labels of the period of a day, weeks are labelled by their Monday so that
+# weeks across New Year are not split in two.
+PERIOD_LABELS = {
+    "week": "date(day, '-6 days', 'weekday 1')",
+    "month": "strftime('%Y-%m', day)",
+}
+
+SELECT_TASKS_REPORT = """SELECT task, SUM(duration) AS duration,
+        COUNT(*) AS sessions, COUNT(DISTINCT username) AS users
+    FROM sessions
+    WHERE project = ?
+    GROUP BY task
+    ORDER BY duration DESC;"""
+
+# Read from the daily rollup, sessions crossing midnight are already split.
+SELECT_PERIODS_REPORT = """WITH periods AS (
+        SELECT {period} AS period, username, SUM(seconds) AS duration
+        FROM daily_rollup
+        WHERE project = :project
+            AND day >= (
+                SELECT COALESCE(MIN(day), '')
+                FROM (
+                    SELECT MIN(day) AS day
+                    FROM daily_rollup
+                    WHERE project = :project
+                    GROUP BY {period}
+                    ORDER BY day DESC
+                    LIMIT :max_periods
+                )
+            )
+        GROUP BY period, username
+    )
+    SELECT period, username, duration,
+        duration / SUM(duration) OVER (PARTITION BY period) AS share,
+        SUM(duration) OVER (
+            PARTITION BY username ORDER BY period
+            ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+        ) AS cumulated
+    FROM periods
+    ORDER BY period, duration DESC;"""
+
+SELECT_WORKLOAD_REPORT = """WITH spent AS (
+        SELECT task, SUM(duration) AS duration
+        FROM sessions
+        WHERE project = :project AND task IS NOT NULL
+        GROUP BY task
+    )
+    SELECT tasks.task, SUM(tasks.workload) * :jeh AS estimate,
+        COALESCE(MAX(spent.duration), 0) AS duration
+    FROM tasks
+    LEFT JOIN spent ON spent.task = tasks.task
+    WHERE tasks.project = :project
+    GROUP BY tasks.task
+    ORDER BY MIN(tasks.rowid);"""
+
+
+def get_tasks_report(
+    db_path: str, project: str
+) -> List[Tuple[Optional[str], float, int, int]]:
+    """Get the time spent on each task of a project.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+
+    Returns:
+        List[Tuple[Optional[str], float, int, int]]: Task, None for sessions
+            without task, time spent in seconds, number of sessions and number
+            of users, by decreasing time spent.
+    """
+    flush_writes(db_path)
+    return connect(db_path).execute(SELECT_TASKS_REPORT, (project,)).fetchall()
+
+
+def get_periods_report(
+    db_path: str, project: str, period: str = "week", max_periods: int = 12
+) -> List[Tuple[str, str, float, float, float]]:
+    """Get the time spent by each user of a project per week or month.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+        period (str, optional): "week" or "month". Defaults to "week".
+        max_periods (int, optional): Number of last worked periods to report.
+            Defaults to 12.
+
+    Returns:
+        List[Tuple[str, str, float, float, float]]: Period, labelled by its
+            first day for weeks and as YYYY-MM for months, username, time
+            spent in seconds, share of the time spent on the period, and time
+            spent since the first reported period, ordered by period.
+    """
+    request = SELECT_PERIODS_REPORT.format(period=PERIOD_LABELS[period])
+    params = {"project": project, "max_periods": max_periods}
+    flush_writes(db_path)
+    return connect(db_path).execute(request, params).fetchall()
+
+
+def get_workload_report(db_path: str, project: str) -> List[Tuple[str, float, float]]:
+    """Get the estimated and actual time spent on each task of a project.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+
+    Returns:
+        List[Tuple[str, float, float]]: Task, estimated workload and time spent
+            in seconds, in the order of the tasks file.
+    """
+    params = {"project": project, "jeh": JEH_SECONDS}
+    flush_writes(db_path)
+    return connect(db_path).execute(SELECT_WORKLOAD_REPORT, params).fetchall()
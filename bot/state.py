@@ -0,0 +1,324 @@
+""" Module for the persistent in-flight state of the bot. """
+
+from collections.abc import MutableMapping
+from datetime import datetime
+import json
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+from bot.database import connect, get_database
+from bot.dataclasses import Session
+
+UPSERT_OPEN_SESSION = """INSERT INTO open_sessions
+    (project, username, start, start_comment, task)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (project, username)
+    DO UPDATE SET start = excluded.start,
+        start_comment = excluded.start_comment,
+        task = excluded.task;"""
+
+SELECT_OPEN_SESSIONS = """SELECT project, username, start, start_comment, task
+    FROM open_sessions;"""
+
+DELETE_OPEN_SESSION = "DELETE FROM open_sessions WHERE project = ? AND username = ?;"
+DELETE_OPEN_SESSIONS_FROM_PROJECT = "DELETE FROM open_sessions WHERE project = ?;"
+
+UPSERT_STATE = """INSERT INTO conversation_state (name, project, username, value)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (name, project, username)
+    DO UPDATE SET value = excluded.value;"""
+
+SELECT_STATES = """SELECT project, username, value
+    FROM conversation_state
+    WHERE name = ?;"""
+
+DELETE_STATE = """DELETE FROM conversation_state
+    WHERE name = ? AND project = ? AND username = ?;"""
+DELETE_STATES_FROM_PROJECT = """DELETE FROM conversation_state
+    WHERE name = ? AND project = ?;"""
+
+
+def save_open_session(db_path: str, project: str, session: Session):
+    """Save a running work session so it survives restarts.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+        session (Session): Running work session.
+    """
+    with connect(db_path) as db:
+        db.execute(
+            UPSERT_OPEN_SESSION,
+            (
+                project,
+                session.author,
+                session.start.isoformat(),
+                session.start_comment,
+                session.task,
+            ),
+        )
+
+
+def delete_open_sessions(db_path: str, project: str, username: Optional[str] = None):
+    """Delete saved running work sessions of a project.
+
+    Args:
+        db_path (str): Path to the database file.
+        project (str): Name of the project.
+        username (Optional[str], optional): Only delete the session of this user.
+            Defaults to None.
+    """
+    with connect(db_path) as db:
+        if username is None:
+            db.execute(DELETE_OPEN_SESSIONS_FROM_PROJECT, (project,))
+        else:
+            db.execute(DELETE_OPEN_SESSION, (project, username))
+
+
+def get_open_sessions(db_path: str) -> Dict[str, Dict[str, Session]]:
+    """Get all saved running work sessions.
+
+    Args:
+        db_path (str): Path to the database file.
+
+    Returns:
+        Dict[str, Dict[str, Session]]: Running sessions by project and username.
+    """
+    open_sessions: Dict[str, Dict[str, Session]] = {}
+    for project, username, start, start_comment, task in connect(db_path).execute(
+        SELECT_OPEN_SESSIONS
+    ):
+        session = Session(username, datetime.fromisoformat(start), start_comment, task)
+        open_sessions.setdefault(project, {})[username] = session
+    return open_sessions
+
+
+def save_state(db_path: str, name: str, project: str, username: str, value: Any):
+    """Save a piece of conversation state so it survives restarts.
+
+    Args:
+        db_path (str): Path to the database file.
+        name (str): Name of the state.
+        project (str): Name of the project.
+        username (str): Name of the user.
+        value (Any): Json serializable value of the state.
+    """
+    with connect(db_path) as db:
+        db.execute(UPSERT_STATE, (name, project, username, json.dumps(value)))
+
+
+def delete_states(
+    db_path: str, name: str, project: str, username: Optional[str] = None
+):
+    """Delete saved conversation states of a project.
+
+    Args:
+        db_path (str): Path to the database file.
+        name (str): Name of the state.
+        project (str): Name of the project.
+        username (Optional[str], optional): Only delete the state of this user.
+            Defaults to None.
+    """
+    with connect(db_path) as db:
+        if username is None:
+            db.execute(DELETE_STATES_FROM_PROJECT, (name, project))
+        else:
+            db.execute(DELETE_STATE, (name, project, username))
+
+
+def get_states(db_path: str, name: str) -> Dict[str, Dict[str, Any]]:
+    """Get all saved conversation states of the given name.
+
+    Args:
+        db_path (str): Path to the database file.
+        name (str): Name of the state.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Values of the state by project and username.
+    """
+    states: Dict[str, Dict[str, Any]] = {}
+    for project, username, value in connect(db_path).execute(SELECT_STATES, (name,)):
+        states.setdefault(project, {})[username] = json.loads(value)
+    return states
+
+
+class StateStore:
+    """Storage of a named conversation state by project and username.
+
+    Args:
+        db_path (str): Path to the database file.
+        name (str): Name of the state.
+    """
+
+    def __init__(self, db_path: str, name: str) -> None:
+        self.db_path = db_path
+        self.name = name
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Load all stored values by project and username."""
+        return get_states(self.db_path, self.name)
+
+    def save(self, project: str, username: str, value: Any):
+        """Store the value of a user in a project."""
+        save_state(self.db_path, self.name, project, username, value)
+
+    def delete(self, project: str, username: str = None):
+        """Delete the stored value of a user, or of all users, in a project."""
+        delete_states(self.db_path, self.name, project, username)
+
+
+class OpenSessionsStore(StateStore):
+    """Storage of the running work sessions by project and username.
+
+    Args:
+        db_path (str): Path to the database file.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        super().__init__(db_path, "open_sessions")
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        return get_open_sessions(self.db_path)
+
+    def save(self, project: str, username: str, value: Any):
+        save_open_session(self.db_path, project, value)
+
+    def delete(self, project: str, username: str = None):
+        delete_open_sessions(self.db_path, project, username)
+
+
+def _persist(store: StateStore, method, *args):
+    # Writes are deferred to the background writer of the database if any,
+    # so handlers do not wait on disk I/O. Without writer, failures are raised.
+    writer = get_database(store.db_path).writer
+    if writer is not None:
+        writer.submit_state(method, *args)
+    else:
+        method(*args)
+
+
+class ProjectState(MutableMapping):
+    """Values by username in a project, written through to a store on change.
+
+    Args:
+        store (StateStore): Storage of the state.
+        project (str): Name of the project.
+        values (Dict[str, Any], optional): Initial values, assumed to be already
+            stored. Defaults to None.
+        lock (Optional[threading.RLock], optional): Lock guarding changes, shared
+            with the parent state if any. Defaults to a new lock.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        project: str,
+        values: dict = None,
+        lock: Optional[threading.RLock] = None,
+    ):
+        self.store = store
+        self.project = project
+        self._values: Dict[str, Any] = dict(values or {})
+        self._lock = lock if lock is not None else threading.RLock()
+
+    def __getitem__(self, username: str) -> Any:
+        return self._values[username]
+
+    def __setitem__(self, username: str, value: Any):
+        with self._lock:
+            self._values[username] = value
+            _persist(self.store, self.store.save, self.project, username, value)
+
+    def __delitem__(self, username: str):
+        with self._lock:
+            del self._values[username]
+            _persist(self.store, self.store.delete, self.project, username)
+
+    def discard(self, username: str) -> Any:
+        """Remove the value of a user from memory only and return it.
+
+        The stored value is left to be deleted along with another write, as
+        open sessions deleted in the transaction adding the complete session.
+
+        Args:
+            username (str): Name of the user.
+
+        Returns:
+            Any: Removed value.
+        """
+        with self._lock:
+            return self._values.pop(username)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._values))
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __repr__(self) -> str:
+        return repr(self._values)
+
+
+class ProjectsState(MutableMapping):
+    """Values by project and username, reloaded from a store at creation.
+
+    Every change is written to the store as it happens, so restoring the
+    state after a restart is a single query. Changes are guarded by a lock
+    so the state can be shared by concurrent handlers.
+
+    Args:
+        store (StateStore): Storage of the state.
+    """
+
+    def __init__(self, store: StateStore):
+        self.store = store
+        self._lock = threading.RLock()
+        self._projects: Dict[str, ProjectState] = {
+            project: ProjectState(store, project, values, self._lock)
+            for project, values in store.load().items()
+        }
+
+    def __getitem__(self, project: str) -> ProjectState:
+        return self._projects[project]
+
+    def __setitem__(self, project: str, values: dict):
+        with self._lock:
+            if project in self._projects:
+                _persist(self.store, self.store.delete, project)
+            self._projects[project] = ProjectState(
+                self.store, project, lock=self._lock
+            )
+            self._projects[project].update(values)
+
+    def __delitem__(self, project: str):
+        with self._lock:
+            del self._projects[project]
+            _persist(self.store, self.store.delete, project)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._projects))
+
+    def setdefault(self, key: str, default: dict = None) -> ProjectState:
+        with self._lock:
+            if key not in self._projects:
+                self[key] = default or {}
+            return self._projects[key]
+
+    def __len__(self) -> int:
+        return len(self._projects)
+
+    def __repr__(self) -> str:
+        return repr(self._projects)
+
+
+class UsersState(ProjectState):
+    """Values by username shared across projects, written through to a store.
+
+    Args:
+        store (StateStore): Storage of the state.
+    """
+
+    def __init__(self, store: StateStore):
+        super().__init__(store, "", store.load().get("", {}))
@@ -0,0 +1,188 @@
+""" Module for handler logic shared by the threaded and asyncio runtimes.
+
+Handlers are written as generators yielding the calls they make, called
+steps, and receiving their results. Requests to Telegram are yielded as
+callables, calls blocking on disk I/O such as database queries are wrapped
+with `blocking`. The threaded runtime runs steps in the calling thread with
+`run_steps`, the asyncio runtime awaits requests on the event loop and only
+sends blocking calls to a thread pool with `run_steps_async`.
+"""
+
+import asyncio
+from concurrent.futures import Executor, Future
+import functools
+import inspect
+import threading
+from typing import Any, Callable, Generator, Optional, Set
+
+from bot.logging import get_logger
+
+LOGGER = get_logger(__name__)
+
+Steps = Generator[Any, Any, Any]
+
+# Tasks of spawned steps, kept referenced until they are done.
+_TASKS: Set[asyncio.Task] = set()
+
+
+class Blocking(functools.partial):
+    """Call blocking on disk I/O, run outside of the event loop."""
+
+
+class Wait:
+    """Wait for the result of a concurrent future.
+
+    Args:
+        future (Future): Future to wait for.
+    """
+
+    def __init__(self, future: Future) -> None:
+        self.future = future
+
+
+class Spawn:
+    """Run steps in the background, the result of the step is their future.
+
+    Args:
+        steps (Steps): Steps to run.
+    """
+
+    def __init__(self, steps: Steps) -> None:
+        self.steps = steps
+
+
+def blocking(fn: Callable, *args, **kwargs) -> Blocking:
+    """Make a step of a call blocking on disk I/O."""
+    return Blocking(fn, *args, **kwargs)
+
+
+def wait(future: Future) -> Wait:
+    """Make a step waiting for the result of a concurrent future."""
+    return Wait(future)
+
+
+def spawn(steps: Steps) -> Spawn:
+    """Make a step running other steps in the background."""
+    return Spawn(steps)
+
+
+def run_steps(steps: Steps) -> Any:
+    """Run steps in the calling thread, waiting for each of them.
+
+    Spawned steps are run in a new thread.
+
+    Args:
+        steps (Steps): Steps to run.
+
+    Returns:
+        Any: Value returned by the steps.
+    """
+    send, value = steps.send, None
+    while True:
+        try:
+            step = send(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, send = _run_step(step), steps.send
+        except Exception as error:  # pylint: disable=broad-except
+            value, send = error, steps.throw
+
+
+def _run_step(step: Any) -> Any:
+    if isinstance(step, Wait):
+        return step.future.result()
+    if isinstance(step, Spawn):
+        future: Future = Future()
+
+        def run():
+            try:
+                future.set_result(run_steps(step.steps))
+            except Exception as error:  # pylint: disable=broad-except
+                LOGGER.exception("Error in background steps")
+                future.set_exception(error)
+
+        threading.Thread(target=run, name="Steps").start()
+        return future
+    return step()
+
+
+async def run_steps_async(steps: Steps, executor: Optional[Executor] = None) -> Any:
+    """Run steps on the event loop, only blocking calls are sent to threads.
+
+    Spawned steps are run in a new task.
+
+    Args:
+        steps (Steps): Steps to run.
+        executor (Optional[Executor], optional): Executor of blocking calls.
+            Defaults to the executor of the event loop.
+
+    Returns:
+        Any: Value returned by the steps.
+    """
+    send, value = steps.send, None
+    while True:
+        try:
+            step = send(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, send = await _run_step_async(step, executor), steps.send
+        except Exception as error:  # pylint: disable=broad-except
+            value, send = error, steps.throw
+
+
+async def _run_step_async(step: Any, executor: Optional[Executor]) -> Any:
+    loop = asyncio.get_running_loop()
+    if isinstance(step, Blocking):
+        return await loop.run_in_executor(executor, step)
+    if isinstance(step, Wait):
+        return await asyncio.wrap_future(step.future)
+    if isinstance(step, Spawn):
+        task = loop.create_task(run_steps_async(step.steps, executor))
+        _TASKS.add(task)
+        task.add_done_callback(_TASKS.discard)
+        return task
+    result = step()
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+def sync_steps(steps_fn: Callable[..., Steps]) -> Callable[..., Any]:
+    """Make a function of steps run them synchronously when called.
+
+    The function of steps stays available as the `steps` attribute, for
+    other steps to use with `yield from` and for the asyncio runtime.
+
+    Args:
+        steps_fn (Callable[..., Steps]): Generator function of the steps.
+
+    Returns:
+        Callable[..., Any]: Function running the steps and returning their value.
+    """
+
+    @functools.wraps(steps_fn)
+    def run(*args, **kwargs):
+        return run_steps(steps_fn(*args, **kwargs))
+
+    run.steps = steps_fn
+    return run
+
+
+def get_steps_function(callback: Callable) -> Optional[Callable[..., Steps]]:
+    """Get the function of steps of a callback made with `sync_steps`.
+
+    Args:
+        callback (Callable): Function or bound method.
+
+    Returns:
+        Optional[Callable[..., Steps]]: Function of steps, bound to the instance
+            of a method. None if the callback has no steps.
+    """
+    steps_fn = getattr(callback, "steps", None)
+    if steps_fn is None:
+        return None
+    if inspect.ismethod(callback):
+        return functools.partial(steps_fn, callback.__self__)
+    return steps_fn
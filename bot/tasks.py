@@ -1,6 +1,7 @@
 """ Module for tasks management. """
 
-from typing import List, Tuple, Union
+import hashlib
+from typing import Any, Dict, List, Tuple, Union
 from telegram import File
 import yaml
 
@@ -54,3 +55,77 @@ def print_tasks(d: dict, level=0):
             print_tasks(v, level + 1)
         else:
             print("  " * level + f"{k}: {v}")
+
+
+def _base36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = digits[number % 36]
+    while number >= 36:
+        number //= 36
+        encoded = digits[number % 36] + encoded
+    return encoded
+
+
+def _path_id(path: Tuple[str, ...], salt: int = 0) -> str:
+    digest = hashlib.sha1("\x1f".join(path + (str(salt),)).encode("utf-8")).digest()
+    return _base36(int.from_bytes(digest[:8], "big") % 36**TaskNavigator.ID_LENGTH)
+
+
+class TaskNavigator:
+    """Index of a structure of tasks giving each task a compact stable id.
+
+    Ids are hashes of the names leading to each task, so a task keeps its id
+    when other tasks are added, removed or moved, and buttons sent before an
+    upload either find the same task or none. They are used as buttons
+    callback data to find a task in constant time, whatever the length of
+    its name.
+
+    Args:
+        tasks (dict): Structure of tasks as a dict.
+    """
+
+    ROOT_ID = "0"
+    ID_LENGTH = 8
+
+    def __init__(self, tasks: dict) -> None:
+        self.tree = tasks
+        self.nodes: Dict[str, Tuple[str, Any]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self._index(self.ROOT_ID, tasks, path=())
+
+    def _index(self, node_id: str, layer: dict, path: Tuple[str, ...]):
+        self.children[node_id] = []
+        for key, value in layer.items():
+            child_path = path + (str(key),)
+            child_id, salt = _path_id(child_path), 0
+            while child_id in self.nodes or child_id == self.ROOT_ID:
+                salt += 1
+                child_id = _path_id(child_path, salt)
+            self.nodes[child_id] = (key, value)
+            self.children[node_id].append(child_id)
+            if isinstance(value, dict):
+                self._index(child_id, value, child_path)
+
+    def options(self, node_id: str = ROOT_ID) -> List[Tuple[str, str]]:
+        """Get the tasks directly under a node.
+
+        Args:
+            node_id (str, optional): Id of the node. Defaults to the root.
+
+        Returns:
+            List[Tuple[str, str]]: Names and ids of the tasks under the node.
+        """
+        return [
+            (self.nodes[child_id][0], child_id) for child_id in self.children[node_id]
+        ]
+
+    def resolve(self, node_id: str) -> Tuple[str, Any]:
+        """Get a task from its id.
+
+        Args:
+            node_id (str): Id of the task.
+
+        Returns:
+            Tuple[str, Any]: Name of the task and its subtasks or workload.
+        """
+        return self.nodes[node_id]
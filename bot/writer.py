@@ -0,0 +1,254 @@
+""" Module for the background writer of work sessions. """
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple
+
+from bot.dataclasses import CompleteSession, Session
+from bot.database import add_complete_sessions, get_database
+from bot.logging import get_logger
+
+LOGGER = get_logger(__name__)
+
+_STOP = object()
+
+
+class _StateWrite:
+    __slots__ = ("method", "args")
+
+    def __init__(self, method: Callable[..., Any], args: tuple) -> None:
+        self.method = method
+        self.args = args
+
+
+class SessionWriter:
+    """Write-behind queue persisting complete sessions from a background thread.
+
+    Sessions submitted while the previous batch is being committed are grouped
+    in the same transaction, so handlers never wait on disk I/O unless the
+    queue is full. Writes of conversation state go through the same queue, so
+    they are applied in order with the sessions.
+
+    Args:
+        db_path (str): Path to the database file.
+        max_queue_size (int, optional): Maximum number of pending sessions before
+            `submit` blocks. Defaults to 1000.
+        max_batch_size (int, optional): Maximum number of sessions per group commit.
+            Defaults to 100.
+        retries (int, optional): Number of retries of a failed group commit.
+            Defaults to 3.
+        spill_path (str, optional): File where sessions that could not be written
+            are kept until replayed. Defaults to the database path suffixed with
+            ".failed.jsonl".
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_queue_size: int = 1000,
+        max_batch_size: int = 100,
+        retries: int = 3,
+        spill_path: Optional[str] = None,
+    ) -> None:
+        self.db_path = db_path
+        self.max_batch_size = max_batch_size
+        self.retries = retries
+        self.spill_path = spill_path or f"{db_path}.failed.jsonl"
+        self.failed: List[Tuple[str, CompleteSession]] = []
+        self.failed_states: List[_StateWrite] = []
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        # Numbers of items queued and processed, flush waits on their progress.
+        self._progress = threading.Condition()
+        self._submitted = 0
+        self._processed = 0
+        self._thread = threading.Thread(
+            target=self._run, name="SessionWriter", daemon=True
+        )
+        self._thread.start()
+
+    def attach(self) -> "SessionWriter":
+        """Route complete sessions added to the database through this writer.
+
+        Returns:
+            SessionWriter: The writer itself.
+        """
+        get_database(self.db_path).writer = self
+        return self
+
+    def submit(self, project: str, complete_session: CompleteSession):
+        """Queue a complete session to be written.
+
+        Args:
+            project (str): Name of the project.
+            complete_session (CompleteSession): Complete work session data.
+        """
+        self._put((project, complete_session))
+
+    def submit_state(self, method: Callable[..., Any], *args):
+        """Queue a write of conversation state.
+
+        Args:
+            method (Callable[..., Any]): Function writing the state.
+            *args: Arguments of the function.
+        """
+        self._put(_StateWrite(method, args))
+
+    def _put(self, item: Any):
+        # Counted before being queued, so a flush waits for every item queued
+        # before it started.
+        with self._progress:
+            self._submitted += 1
+        self._queue.put(item)
+
+    def replay_failed(self) -> int:
+        """Queue again the sessions spilled after failed group commits.
+
+        Returns:
+            int: Number of sessions queued again.
+        """
+        if not os.path.exists(self.spill_path):
+            return 0
+        replay_path = f"{self.spill_path}.replay"
+        os.replace(self.spill_path, replay_path)
+        with open(replay_path, encoding="utf-8") as spill:
+            sessions = [_load_session(line) for line in spill if line.strip()]
+        for project, complete_session in sessions:
+            self.submit(project, complete_session)
+        os.remove(replay_path)
+        LOGGER.warning("Replaying %d sessions of %s", len(sessions), self.spill_path)
+        return len(sessions)
+
+    def flush(self):
+        """Wait until the sessions and state queued before the call are written.
+
+        Items queued meanwhile are not waited for, so a flush returns even
+        under steady traffic.
+        """
+        with self._progress:
+            target = self._submitted
+            while self._processed < target and self._thread.is_alive():
+                self._progress.wait(0.1)
+
+    def close(self):
+        """Flush queued sessions, stop the writer thread and detach it."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        database = get_database(self.db_path)
+        if database.writer is self:
+            database.writer = None
+
+    def _next_batch(self) -> Tuple[list, bool]:
+        batch, stop = [], False
+        item: Optional[tuple] = self._queue.get()
+        while True:
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+            if stop or len(batch) >= self.max_batch_size:
+                break
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+        return batch, stop
+
+    def _write_all(self, batch: list):
+        sessions: List[Tuple[str, CompleteSession]] = []
+        for item in batch:
+            if isinstance(item, _StateWrite):
+                if sessions:
+                    self._write(sessions)
+                    sessions = []
+                self._write_state(item)
+            else:
+                sessions.append(item)
+        if sessions:
+            self._write(sessions)
+
+    def _write_state(self, write: _StateWrite):
+        for attempt in range(self.retries + 1):
+            try:
+                write.method(*write.args)
+                return
+            except Exception:  # pylint: disable=broad-except
+                if attempt == self.retries:
+                    self.failed_states.append(write)
+                    LOGGER.critical(
+                        "Could not persist state %s", write.args, exc_info=True
+                    )
+                else:
+                    time.sleep(0.1 * 2**attempt)
+
+    def _write(self, batch: List[Tuple[str, CompleteSession]]):
+        for attempt in range(self.retries + 1):
+            try:
+                add_complete_sessions(self.db_path, batch)
+                return
+            except Exception:  # pylint: disable=broad-except
+                if attempt == self.retries:
+                    LOGGER.exception("Could not write %d sessions", len(batch))
+                    self._spill(batch)
+                else:
+                    time.sleep(0.1 * 2**attempt)
+
+    def _spill(self, batch: List[Tuple[str, CompleteSession]]):
+        try:
+            with open(self.spill_path, "a", encoding="utf-8") as spill:
+                for project, complete_session in batch:
+                    spill.write(_dump_session(project, complete_session) + "\n")
+        except OSError:
+            self.failed.extend(batch)
+            LOGGER.critical(
+                "Could not spill %d sessions, kept in memory: %s", len(batch), batch
+            )
+            return
+        LOGGER.critical(
+            "%d sessions could not be written and were spilled to %s",
+            len(batch),
+            self.spill_path,
+        )
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._write_all(batch)
+            with self._progress:
+                self._processed += len(batch)
+                self._progress.notify_all()
+
+
+def _dump_session(project: str, complete_session: CompleteSession) -> str:
+    session = complete_session.session
+    return json.dumps(
+        {
+            "project": project,
+            "author": session.author,
+            "start": session.start.isoformat(),
+            "start_comment": session.start_comment,
+            "task": session.task,
+            "stop": complete_session.stop.isoformat(),
+            "stop_comment": complete_session.stop_comment,
+        }
+    )
+
+
+def _load_session(line: str) -> Tuple[str, CompleteSession]:
+    values = json.loads(line)
+    session = Session(
+        values["author"],
+        datetime.fromisoformat(values["start"]),
+        values["start_comment"],
+        values["task"],
+    )
+    complete_session = CompleteSession(
+        session, datetime.fromisoformat(values["stop"]), values["stop_comment"]
+    )
+    return values["project"], complete_session
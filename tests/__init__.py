@@ -8,7 +8,9 @@ from bot.handlers import BotHandler
 def bot(mocker: MockerFixture, tmpdir):
     mocker.patch("bot.handlers.send_session_start")
     db_path = tmpdir.mkdir("sub").join("tmp.db")
-    return BotHandler(db_path)
+    bot_handler = BotHandler(db_path)
+    yield bot_handler
+    bot_handler.close()
 
 
 @pytest.fixture
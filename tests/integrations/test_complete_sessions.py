@@ -1,14 +1,24 @@
 """ Test for starting a work session from the user perspective. """
 
+from datetime import datetime, timedelta, timezone
 import pytest_check as check
 from pytest_mock import MockerFixture
 
 from telegram import Chat, User
-from bot.database import add_tasks, get_project_tasks_dict
-from bot.dataclasses import CompleteSession
+from bot.database import (
+    add_tasks,
+    flush_writes,
+    get_project_navigator,
+    get_project_tasks_dict,
+    get_summary,
+)
+from bot.dataclasses import CompleteSession, Session
 
 from bot.handlers import BotHandler
 from bot.handlers.utils import get_chat_name, get_user_name
+from bot.state import get_states
+from bot.tasks import TaskNavigator
+from bot.writer import _dump_session
 from tests import bot, user0 as user, chat  # pylint: disable=unused-import
 
 
@@ -78,7 +88,9 @@ def test_complete_session_with_tasks(
     context = mocker.MagicMock()
     bot.start(update, context)
     check.is_false(bot.wait_start_comment.get(username))
-    check.equal(bot.current_tasks_dict.get(chat_name, {}).get(username), tasks)
+    node_id = bot.current_task_nodes.get(chat_name, {}).get(username)
+    check.equal(node_id, TaskNavigator.ROOT_ID)
+    navigator = get_project_navigator(bot.db_path, chat_name)
 
     # --- Choose "manger" task in querry
     query = mocker.MagicMock(data="manger")
@@ -88,8 +100,11 @@ def test_complete_session_with_tasks(
     context = mocker.MagicMock()
     bot.queryHandler(update, context)
     check.is_false(bot.wait_start_comment.get(username))
+    node_id = bot.current_task_nodes.get(chat_name, {}).get(username)
+    check.equal(navigator.resolve(node_id), ("manger", tasks["manger"]))
+    flush_writes(bot.db_path)
     check.equal(
-        bot.current_tasks_dict.get(chat_name, {}).get(username), tasks["manger"]
+        get_states(bot.db_path, "current_task_nodes"), {chat_name: {username: node_id}}
     )
 
     # --- Choose "poulet" task in querry
@@ -100,7 +115,8 @@ def test_complete_session_with_tasks(
     context = mocker.MagicMock()
     bot.queryHandler(update, context)
     check.is_true(bot.wait_start_comment.get(username))
-    check.equal(bot.current_tasks_dict.get(chat_name, {}).get(username), "poulet")
+    node_id = bot.current_task_nodes.get(chat_name, {}).get(username)
+    check.equal(navigator.resolve(node_id), ("poulet", 1))
 
     # --- start comment
     msg = mocker.MagicMock(text="test start")
@@ -132,3 +148,63 @@ def test_complete_session_with_tasks(
         complete_session: CompleteSession = add_complete_session.call_args.args[-1]
         check.equal(complete_session.stop_comment, msg.text)
         check.equal(complete_session.session, session)
+
+
+def test_running_session_survives_restart(
+    mocker: MockerFixture, bot: BotHandler, chat: Chat, user: User
+):
+    """should restore running sessions and pending comments after a restart"""
+    username = get_user_name(user)
+    chat_name = get_chat_name(chat)
+
+    # --- \start and start comment
+    update = mocker.MagicMock(effective_chat=chat, effective_user=user)
+    bot.start(update, mocker.MagicMock())
+    start = datetime(2022, 7, 1, 9, 30, tzinfo=timezone.utc)
+    msg = mocker.MagicMock(text="test start", date=start)
+    update = mocker.MagicMock(effective_chat=chat, effective_user=user, message=msg)
+    bot.textHandler(update, mocker.MagicMock())
+
+    # --- /stop
+    update = mocker.MagicMock(effective_chat=chat, effective_user=user)
+    bot.stop(update, mocker.MagicMock())
+
+    # --- restart
+    bot.close()
+    restarted_bot = BotHandler(bot.db_path)
+    session = restarted_bot.workers_in_chats.get(chat_name, {}).get(username)
+    check.equal(session, Session(username, start, "test start"))
+    check.is_true(restarted_bot.wait_stop_comment.get(username))
+    check.is_false(restarted_bot.wait_start_comment.get(username))
+
+    # --- stop comment
+    msg = mocker.MagicMock(text="test stop", date=start + timedelta(hours=1))
+    update = mocker.MagicMock(effective_chat=chat, effective_user=user, message=msg)
+    restarted_bot.textHandler(update, mocker.MagicMock())
+    check.equal(restarted_bot.workers_in_chats.get(chat_name), {})
+    restarted_bot.close()
+    restarted_bot = BotHandler(bot.db_path)
+    check.is_none(restarted_bot.workers_in_chats.get(chat_name))
+    restarted_bot.close()
+
+
+def test_spilled_session_replayed_before_restore(
+    bot: BotHandler, chat: Chat, user: User
+):
+    """should not restore as running a session completed in a spilled batch"""
+    username = get_user_name(user)
+    chat_name = get_chat_name(chat)
+    start = datetime(2022, 7, 1, 9, 30, tzinfo=timezone.utc)
+    session = Session(username, start, "test start")
+    bot.workers_in_chats.setdefault(chat_name, {})[username] = session
+    bot.close()
+
+    # --- the group commit of the complete session failed and was spilled
+    complete_session = CompleteSession(session, start + timedelta(hours=1))
+    with open(f"{bot.db_path}.failed.jsonl", "w", encoding="utf-8") as spill:
+        spill.write(_dump_session(chat_name, complete_session) + "\n")
+
+    restarted_bot = BotHandler(bot.db_path)
+    check.is_none(restarted_bot.workers_in_chats.get(chat_name, {}).get(username))
+    check.equal(len(get_summary(bot.db_path, chat_name)), 1)
+    restarted_bot.close()
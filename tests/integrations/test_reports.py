@@ -0,0 +1,127 @@
+""" Integration tests for analytics reports. """
+
+from datetime import datetime, timedelta
+import pytest
+import pytest_check as check
+from pytest_mock import MockerFixture
+from telegram import Chat, User
+from bot.dataclasses import CompleteSession, Session
+from tests import bot, user0, user1, chat  # pylint: disable=unused-import
+
+from bot.handlers import BotHandler
+from bot.handlers.reports import handle_report
+from bot.handlers.utils import get_chat_name, get_user_name
+from bot.database import add_complete_session, add_tasks
+from bot.reports import (
+    JEH_SECONDS,
+    get_periods_report,
+    get_tasks_report,
+    get_workload_report,
+)
+
+
+class TestReports:
+    @pytest.fixture(autouse=True)
+    def setup(
+        self,
+        bot: BotHandler,
+        chat: Chat,
+        user0: User,
+        user1: User,
+    ):
+        tasks = {
+            "manger": {"poulet": 1, "pates": 2},
+            "boire": {"eau": 0.5},
+        }
+        self.bot = bot
+        self.chat = chat
+        self.project = get_chat_name(chat)
+        self.author0 = get_user_name(user0)
+        self.author1 = get_user_name(user1)
+        add_tasks(bot.db_path, self.project, tasks)
+
+        # Friday 1st and Monday 4th of July 2022, on two different weeks.
+        day1 = datetime(2022, 7, 1, 9)
+        day2 = datetime(2022, 7, 4, 9)
+        sessions = (
+            (self.author0, day1, timedelta(hours=4), "poulet"),
+            (self.author1, day1, timedelta(hours=2), "poulet"),
+            (self.author0, day2, timedelta(hours=3), "pates"),
+            (self.author1, day2, timedelta(hours=1), None),
+        )
+        for username, start, duration, task in sessions:
+            complete_session = CompleteSession(
+                Session(username, start, "Work", task=task), start + duration
+            )
+            add_complete_session(bot.db_path, self.project, complete_session)
+
+    def test_tasks_report(self):
+        report = get_tasks_report(self.bot.db_path, self.project)
+        check.equal(
+            report,
+            [
+                ("poulet", 6 * 3600, 2, 2),
+                ("pates", 3 * 3600, 1, 1),
+                (None, 3600, 1, 1),
+            ],
+        )
+
+    def test_periods_report(self):
+        report = get_periods_report(self.bot.db_path, self.project, "week")
+        check.equal([row[0] for row in report], ["2022-06-27"] * 2 + ["2022-07-04"] * 2)
+        period, username, duration, share, cumulated = report[0]
+        check.equal((username, duration), (self.author0, 4 * 3600))
+        check.almost_equal(share, 4 / 6)
+        check.equal(cumulated, 4 * 3600)
+        check.equal(report[2][4], 7 * 3600)
+
+        report = get_periods_report(self.bot.db_path, self.project, "month")
+        check.equal({row[0] for row in report}, {"2022-07"})
+
+        report = get_periods_report(
+            self.bot.db_path, self.project, "week", max_periods=1
+        )
+        check.equal({row[0] for row in report}, {"2022-07-04"})
+
+    def test_week_across_new_year(self):
+        # Monday 30th of December 2024 and Wednesday 1st of January 2025.
+        for day in (datetime(2024, 12, 30, 9), datetime(2025, 1, 1, 9)):
+            complete_session = CompleteSession(
+                Session(self.author0, day, "Work"), day + timedelta(hours=1)
+            )
+            add_complete_session(self.bot.db_path, self.project, complete_session)
+        report = get_periods_report(
+            self.bot.db_path, self.project, "week", max_periods=1
+        )
+        check.equal(report[0][:3], ("2024-12-30", self.author0, 2 * 3600))
+        check.equal(len(report), 1)
+
+    def test_workload_report(self):
+        report = get_workload_report(self.bot.db_path, self.project)
+        check.equal(
+            report,
+            [
+                ("poulet", JEH_SECONDS, 6 * 3600),
+                ("pates", 2 * JEH_SECONDS, 3 * 3600),
+                ("eau", 0.5 * JEH_SECONDS, 0),
+            ],
+        )
+
+    def test_handle_report(self, mocker: MockerFixture):
+        update = mocker.MagicMock()
+        update.effective_chat = self.chat
+        context = mocker.MagicMock()
+        handle_report(update, context, self.bot.db_path, "workload")
+        text = context.bot.send_message.call_args.kwargs["text"]
+        check.is_in("Poulet:  6h  0s / 1JEH   0s (75%)", text)
+        update.callback_query.delete_message.assert_called_once()
+
+    def test_handle_empty_report(self, mocker: MockerFixture):
+        update = mocker.MagicMock()
+        update.effective_chat = Chat(1, "group", title="Empty")
+        context = mocker.MagicMock()
+        handle_report(update, context, self.bot.db_path, "month")
+        context.bot.send_message.assert_not_called()
+        update.callback_query.answer.assert_called_once_with(
+            text="Nothing to report yet."
+        )
@@ -1,7 +1,9 @@
 """ Integration tests for data showing. """
 # pylint: disable=unused-import, attribute-defined-outside-init
 
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import pandas as pd
 import pytest
 import pytest_check as check
 from pytest_mock import MockerFixture
@@ -10,12 +12,23 @@ from bot.dataclasses import CompleteSession, Session
 from tests import bot, user0, user1, chat
 
 from bot.handlers import BotHandler
+from bot.handlers import show_data
 from bot.handlers.utils import get_chat_name, get_user_name
-from bot.handlers.show_data import handle_summary, plot_gantt
+from bot.handlers.show_data import (
+    SUMMARY_CACHE,
+    aggregate_sessions,
+    downsample_sessions,
+    format_durations,
+    handle_summary,
+    plot_gantt,
+    render_timeline,
+    send_gantt,
+)
 from bot.database import (
     add_complete_session,
     add_tasks,
     get_all,
+    get_sessions,
     get_summary,
 )
 
@@ -73,7 +86,137 @@ class TestShowData:
         for user, time in df.to_numpy():
             check.equal(time, expected_times[user])
 
+    def test_summary_cached(self, mocker: MockerFixture):
+        get_summary_spy = mocker.spy(show_data, "get_summary")
+        update = mocker.MagicMock()
+        update.effective_chat = self.chat
+        context = mocker.MagicMock()
+
+        hits = SUMMARY_CACHE.hits
+        handle_summary(update, context, self.bot.db_path)
+        handle_summary(update, context, self.bot.db_path)
+        check.equal(get_summary_spy.call_count, 1)
+        check.equal(SUMMARY_CACHE.hits, hits + 1)
+        first_text = context.bot.send_message.call_args.kwargs["text"]
+        check.is_in("@user0:  1h 24m 0s", first_text)
+
+        complete_session = CompleteSession(
+            Session(self.author0, self.day1 + timedelta(days=1), "Another one"),
+            self.day1 + timedelta(days=1, hours=1),
+        )
+        add_complete_session(self.bot.db_path, self.project, complete_session)
+        handle_summary(update, context, self.bot.db_path)
+        check.equal(get_summary_spy.call_count, 2)
+        text = context.bot.send_message.call_args.kwargs["text"]
+        check.is_in("@user0:  2h 24m 0s", text)
+
     def test_gantt(self):
         sessions_df = get_all(self.bot.db_path, "sessions")
         plot_gantt(sessions_df)
         assert True
+
+    def test_gantt_without_task(self):
+        complete_session = CompleteSession(
+            Session(self.author0, self.day1 + timedelta(days=1), "No task session"),
+            self.day1 + timedelta(days=1, hours=26),
+        )
+        add_complete_session(self.bot.db_path, self.project, complete_session)
+        sessions_df = get_sessions(self.bot.db_path, self.project)
+        columns = list(sessions_df.columns)
+        plot_gantt(sessions_df)
+        check.equal(list(sessions_df.columns), columns)
+        check.is_true(pd.isna(sessions_df["task"].iloc[-1]))
+
+    def test_format_durations(self):
+        durations = get_sessions(self.bot.db_path, self.project)["duration"]
+        check.equal(list(format_durations(durations)), ["1:24:00", "0:53:00"])
+
+    def test_aggregate_sessions(self):
+        complete_session = CompleteSession(
+            Session(
+                self.author0, self.day1 + timedelta(hours=3), "Back", task="poulet"
+            ),
+            self.day1 + timedelta(hours=4),
+        )
+        add_complete_session(self.bot.db_path, self.project, complete_session)
+        sessions_df = get_sessions(self.bot.db_path, self.project)
+
+        daily_df = aggregate_sessions(sessions_df, "day")
+        check.equal(len(daily_df), 2)
+        user0_row = daily_df[daily_df["username"] == self.author0].iloc[0]
+        check.equal(user0_row["duration"], (84 + 60) * 60)
+        check.equal(user0_row["sessions"], 2)
+        check.equal(user0_row["start"], datetime(2022, 7, 1))
+        check.equal(user0_row["stop"], datetime(2022, 7, 1, 2, 24))
+
+        weekly_df = aggregate_sessions(sessions_df, "week")
+        check.equal(set(weekly_df["period"]), {datetime(2022, 6, 27)})
+
+    def test_downsample_sessions(self):
+        sessions_df = get_sessions(self.bot.db_path, self.project)
+        timeline_df, period = downsample_sessions(sessions_df)
+        check.is_none(period)
+        check.equal(len(timeline_df), 2)
+
+        timeline_df, period = downsample_sessions(sessions_df, max_bars=1)
+        check.equal(period, "week")
+        check.equal(len(timeline_df), 2)
+        plot_gantt(timeline_df)
+
+    def test_render_aggregated_without_tasks(self):
+        project = "NoTasksProject"
+        for day in range(3):
+            complete_session = CompleteSession(
+                Session(self.author0, self.day1 + timedelta(days=day), "No task"),
+                self.day1 + timedelta(days=day, hours=1),
+            )
+            add_complete_session(self.bot.db_path, project, complete_session)
+        sessions_df = get_sessions(self.bot.db_path, project)
+        check.is_true(sessions_df["task"].isna().all())
+        page = render_timeline(sessions_df, "cdn", max_bars=2)
+        check.is_in(b"No task", page)
+
+    def test_get_sessions(self):
+        other_session = CompleteSession(
+            Session(self.author0, self.day1 + timedelta(days=3), "Other project"),
+            self.day1 + timedelta(days=3, hours=1),
+        )
+        add_complete_session(self.bot.db_path, "OtherProject", other_session)
+
+        sessions_df = get_sessions(self.bot.db_path, self.project)
+        check.equal(len(sessions_df), 2)
+        check.equal(set(sessions_df["project"]), {self.project})
+
+        sessions_df = get_sessions(
+            self.bot.db_path, self.project, since=self.day1 + timedelta(minutes=5)
+        )
+        check.equal(list(sessions_df["username"]), [self.author1])
+
+        sessions_df = get_sessions(self.bot.db_path, self.project, users=[self.author0])
+        check.equal(list(sessions_df["username"]), [self.author0])
+
+    def test_send_gantt_cached(self, mocker: MockerFixture):
+        pool = ThreadPoolExecutor(max_workers=1)
+        mocker.patch("bot.handlers.show_data.get_render_pool", return_value=pool)
+        render = mocker.spy(pool, "submit")
+
+        bot = mocker.MagicMock()
+        send_gantt(bot, self.chat, mocker.MagicMock(), self.bot.db_path).result(30)
+        pool.shutdown(wait=True)
+        check.equal(render.call_count, 1)
+        check.equal(bot.send_document.call_count, 1)
+        document = bot.send_document.call_args.kwargs["document"]
+        check.is_in(b"<html>", document)
+
+        send_gantt(bot, self.chat, mocker.MagicMock(), self.bot.db_path)
+        check.equal(render.call_count, 1)
+        check.equal(bot.send_document.call_count, 2)
+
+    def test_send_gantt_window_from_now(self, mocker: MockerFixture):
+        """Should end the window at the time of the click, not of the menu."""
+        get_sessions_spy = mocker.spy(show_data, "get_sessions")
+        query = mocker.MagicMock()
+        query.message.date = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        send_gantt(mocker.MagicMock(), self.chat, query, self.bot.db_path, days=7)
+        since = get_sessions_spy.call_args.kwargs["since"]
+        check.greater(since, datetime.now(timezone.utc) - timedelta(days=8))
@@ -0,0 +1,79 @@
+""" Integration tests for the webhook serving mode. """
+
+import json
+import socket
+import threading
+import urllib.request
+
+import pytest
+import pytest_check as check
+from pytest_mock import MockerFixture
+from telegram import Update, User
+from telegram.ext import TypeHandler, Updater
+
+from bot.__main__ import start_updater
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_webhook_receives_updates(mocker: MockerFixture, monkeypatch):
+    """should dispatch updates posted to the webhook listener"""
+    set_webhook = mocker.patch("telegram.Bot.set_webhook")
+    mocker.patch("telegram.Bot.delete_webhook")
+    mocker.patch(
+        "telegram.Bot.get_me",
+        return_value=User(123, "bot", is_bot=True, username="bot"),
+    )
+    port = _free_port()
+    monkeypatch.setenv("BOT_MODE", "webhook")
+    monkeypatch.setenv("WEBHOOK_LISTEN", "127.0.0.1")
+    monkeypatch.setenv("WEBHOOK_PORT", str(port))
+    monkeypatch.setenv("WEBHOOK_PATH", "hook")
+    monkeypatch.setenv("WEBHOOK_URL", "https://example.com/")
+
+    received = []
+    update_received = threading.Event()
+    updater = Updater("123:secret")
+    updater.dispatcher.add_handler(
+        TypeHandler(
+            Update,
+            lambda update, context: (received.append(update), update_received.set()),
+        )
+    )
+    start_updater(updater, "123:secret")
+    try:
+        check.equal(set_webhook.call_args.kwargs["url"], "https://example.com/hook")
+        update = {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": 0, "type": "private", "first_name": "user0"},
+                "text": "/start",
+            },
+        }
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/hook",
+            data=json.dumps(update).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            check.equal(response.status, 200)
+        check.is_true(update_received.wait(5))
+        check.equal(received[0].update_id, 1)
+    finally:
+        updater.stop()
+
+
+def test_webhook_requires_url(mocker: MockerFixture, monkeypatch):
+    """should refuse to register a webhook without public url"""
+    start_webhook = mocker.patch.object(Updater, "start_webhook")
+    monkeypatch.setenv("BOT_MODE", "webhook")
+    monkeypatch.delenv("WEBHOOK_URL", raising=False)
+    with pytest.raises(ValueError, match="WEBHOOK_URL"):
+        start_updater(Updater("123:secret"), "123:secret")
+    start_webhook.assert_not_called()
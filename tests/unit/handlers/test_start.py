@@ -1,10 +1,18 @@
 """ Module for work session start handler. """
 
+import pytest
 import pytest_check as check
 from pytest_mock import MockerFixture
 
+from bot import NEXT_PAGE, PREVIOUS_PAGE, TASKS_PER_PAGE
 from bot.dataclasses import Session
-from bot.handlers.start import session_comment_txt
+from bot.handlers.start import (
+    _get_next_task_layer,
+    session_comment_txt,
+    task_options,
+    task_reply_markup,
+)
+from bot.tasks import TaskNavigator
 
 
 class TestSessionComment:
@@ -44,3 +52,60 @@ class TestSessionComment:
         expected_txt = "author started working on task (session_comment)"
         txt = session_comment_txt(session)
         check.equal(txt, expected_txt)
+
+
+class TestNextTaskLayer:
+    """_get_next_task_layer"""
+
+    prefix = "x" * 70
+    tasks = {prefix + "a": {"poulet": 1}, prefix + "b": {"eau": 1.5}}
+
+    def test_ids_disambiguate_long_names(self):
+        """Should find tasks sharing a long prefix from their callback data."""
+        navigator = TaskNavigator(self.tasks)
+        keys, callback_datas = task_options(navigator)
+        for key, callback_data in zip(keys, callback_datas):
+            check.less_equal(len(callback_data.encode("utf-8")), 64)
+            node_id = _get_next_task_layer(
+                navigator, TaskNavigator.ROOT_ID, callback_data
+            )
+            check.equal(navigator.resolve(node_id), (key, self.tasks[key]))
+
+    def test_stale_id(self):
+        """Should refuse ids of tasks missing from the current tasks."""
+        navigator = TaskNavigator(self.tasks)
+        stale_data = task_options(TaskNavigator({"removed": 1}))[1][0]
+        with pytest.raises(KeyError):
+            _get_next_task_layer(navigator, TaskNavigator.ROOT_ID, stale_data)
+
+    def test_truncated_names(self):
+        """Should still resolve truncated task names from older buttons."""
+        navigator = TaskNavigator(self.tasks)
+        node_id = _get_next_task_layer(
+            navigator, TaskNavigator.ROOT_ID, self.prefix[:63]
+        )
+        check.equal(navigator.resolve(node_id), (self.prefix + "a", {"poulet": 1}))
+
+
+class TestTaskReplyMarkup:
+    """task_reply_markup"""
+
+    navigator = TaskNavigator({f"task{i}": 1 for i in range(2 * TASKS_PER_PAGE + 1)})
+
+    def _texts(self, page: int):
+        keyboard = task_reply_markup(self.navigator, page=page).inline_keyboard
+        return [button.text for row in keyboard for button in row]
+
+    def test_first_page(self):
+        """Should only show the first tasks and a next page button."""
+        texts = self._texts(0)
+        check.equal(texts[:-1], [f"task{i}" for i in range(TASKS_PER_PAGE)])
+        check.equal(texts[-1], NEXT_PAGE)
+
+    def test_middle_page(self):
+        """Should show both previous and next page buttons."""
+        check.equal(self._texts(1)[-2:], [PREVIOUS_PAGE, NEXT_PAGE])
+
+    def test_last_page(self):
+        """Should show the remaining tasks and a previous page button."""
+        check.equal(self._texts(2), [f"task{2 * TASKS_PER_PAGE}", PREVIOUS_PAGE])
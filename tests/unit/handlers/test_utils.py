@@ -0,0 +1,35 @@
+""" Unit tests for handlers utils. """
+
+import pytest_check as check
+from pytest_mock import MockerFixture
+from telegram import Chat
+
+from bot.handlers.utils import (
+    CAN_DELETE_CACHE,
+    try_delete_message,
+    update_can_delete_messages,
+)
+
+
+class TestTryDeleteMessage:
+    """try_delete_message"""
+
+    def test_permission_cached(self, mocker: MockerFixture):
+        """Should only ask telegram once for the bot permissions in a chat."""
+        CAN_DELETE_CACHE.clear()
+        bot = mocker.MagicMock()
+        chat = Chat(1, "supergroup", title="SuperGroupChat")
+        check.is_true(try_delete_message(bot, chat, 0))
+        check.is_true(try_delete_message(bot, chat, 1))
+        check.equal(bot.get_chat_member.call_count, 1)
+        check.equal(bot.delete_message.call_count, 2)
+
+    def test_permission_updated(self, mocker: MockerFixture):
+        """Should use the permission given by member status updates."""
+        CAN_DELETE_CACHE.clear()
+        bot = mocker.MagicMock()
+        chat = Chat(2, "supergroup", title="SuperGroupChat")
+        update_can_delete_messages(chat.id, False)
+        check.is_false(try_delete_message(bot, chat, 0))
+        check.is_false(bot.get_chat_member.called)
+        check.is_false(bot.delete_message.called)
@@ -0,0 +1,206 @@
+""" Unit tests for the asyncio runtime. """
+
+import asyncio
+from functools import partial
+import json
+import threading
+
+import pytest
+import pytest_check as check
+from pytest_mock import MockerFixture
+import telegram.ext
+
+from bot.aio import AsyncRunner, ChatLocks, build_application, run_application
+from bot.database import flush_writes, get_sessions
+from bot.handlers import BotHandler
+from bot.steps import blocking, sync_steps
+
+requires_ptb20 = pytest.mark.skipif(
+    not hasattr(telegram.ext, "Application"),
+    reason="requires python-telegram-bot 20 or later",
+)
+
+
+class AsyncBot:
+    """Bot with coroutine methods, as in python-telegram-bot 20."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(0)
+        self.sent.append((chat_id, text, threading.current_thread().name))
+        return len(self.sent)
+
+
+class TestChatLocks:
+    """ChatLocks"""
+
+    def test_ordered_within_chat(self):
+        """Should run coroutines of a same chat one after the other."""
+        locks = ChatLocks()
+        events = []
+
+        async def work(name: str, delay: float):
+            events.append(f"start {name}")
+            await asyncio.sleep(delay)
+            events.append(f"end {name}")
+
+        async def main():
+            await asyncio.gather(
+                locks.run(1, lambda: work("a", 0.02)),
+                locks.run(1, lambda: work("b", 0)),
+                locks.run(2, lambda: work("c", 0)),
+            )
+
+        asyncio.run(main())
+        check.less(events.index("end a"), events.index("start b"))
+        check.less(events.index("end c"), events.index("end a"))
+        check.equal(locks._locks, {})  # pylint: disable=protected-access
+
+
+class TestAsyncRunner:
+    """AsyncRunner"""
+
+    def test_runs_steps(self):
+        """Should await requests on the loop and run blocking steps in threads."""
+        runner = AsyncRunner(workers=2)
+        bot = AsyncBot()
+
+        class Chat:
+            id = 42
+
+        class Update:
+            effective_chat = Chat()
+
+        class Context:
+            pass
+
+        context = Context()
+        context.bot = bot
+
+        @sync_steps
+        def callback(update, context):
+            thread = yield blocking(lambda: threading.current_thread().name)
+            yield partial(context.bot.send_message, update.effective_chat.id, thread)
+
+        asyncio.run(runner.wrap(callback)(Update(), context))
+        runner.shutdown()
+        check.equal(len(bot.sent), 1)
+        chat_id, thread, loop_thread = bot.sent[0]
+        check.equal(chat_id, 42)
+        check.is_true(thread.startswith("Blocking"))
+        check.equal(loop_thread, threading.current_thread().name)
+
+
+def _message(message_id: int, date: int, text: str, command: bool = False) -> dict:
+    message = {
+        "message_id": message_id,
+        "date": date,
+        "chat": {"id": 7, "type": "private", "first_name": "user0"},
+        "from": {"id": 7, "is_bot": False, "first_name": "user0", "username": "user0"},
+        "text": text,
+    }
+    if command:
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(text)}
+        ]
+    return message
+
+
+@requires_ptb20
+class TestApplication:
+    """build_application"""
+
+    def test_work_session(self, mocker: MockerFixture, tmpdir):
+        """Should serve a whole work session with asynchronous handlers."""
+        calls = []
+
+        async def do_request(_, url, method, request_data=None, **kwargs):
+            name = url.rsplit("/", 1)[-1]
+            parameters = request_data.parameters if request_data else {}
+            calls.append((name, parameters))
+            result = True
+            if name == "getMe":
+                result = {
+                    "id": 1,
+                    "is_bot": True,
+                    "first_name": "bot",
+                    "username": "bot",
+                }
+            elif name == "sendMessage":
+                result = _message(100 + len(calls), 0, parameters["text"])
+            return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+        mocker.patch("telegram.request.HTTPXRequest.do_request", do_request)
+        bot = BotHandler(tmpdir.join("tmp.db"))
+        runner = AsyncRunner(workers=2)
+        messages = [
+            _message(1, 0, "/start", command=True),
+            _message(2, 60, "coding"),
+            _message(3, 3600, "/stop", command=True),
+            _message(4, 3660, "done"),
+        ]
+
+        async def main():
+            # Built on the running loop, as by run_application.
+            application = build_application("123:secret", bot, runner)
+            async with application:
+                for update_id, message in enumerate(messages):
+                    update = telegram.Update.de_json(
+                        {"update_id": update_id, "message": message}, application.bot
+                    )
+                    await application.process_update(update)
+
+        try:
+            asyncio.run(main())
+            flush_writes(bot.db_path)
+            sessions = get_sessions(bot.db_path, "user0")
+        finally:
+            runner.shutdown()
+            bot.close()
+
+        sent = [params["text"] for name, params in calls if name == "sendMessage"]
+        check.equal(len(sent), 4)
+        check.is_in("user0 comment what you will work on", sent[0])
+        check.is_in("started working on coding", sent[1])
+        check.is_in("stopped working (done)", sent[3])
+        check.is_in("[1:00:00]", sent[3])
+        deleted = [
+            params["message_id"] for name, params in calls if name == "deleteMessage"
+        ]
+        check.equal(deleted, [1, 2, 3, 4])
+        check.equal(list(sessions["start_comment"]), ["coding"])
+        check.equal(list(sessions["stop_comment"]), ["done"])
+
+
+class TestRunApplication:
+    """run_application"""
+
+    def test_polling(self, mocker: MockerFixture, monkeypatch):
+        """Should poll updates by default."""
+        monkeypatch.delenv("BOT_MODE", raising=False)
+        application = mocker.MagicMock()
+        run_application(application, "123:secret")
+        application.run_polling.assert_called_once_with()
+        application.run_webhook.assert_not_called()
+
+    def test_webhook(self, mocker: MockerFixture, monkeypatch):
+        """Should serve the webhook configured as for the threaded runtime."""
+        monkeypatch.setenv("BOT_MODE", "webhook")
+        monkeypatch.setenv("WEBHOOK_URL", "https://example.com/")
+        monkeypatch.setenv("WEBHOOK_PATH", "hook")
+        application = mocker.MagicMock()
+        run_application(application, "123:secret")
+        kwargs = application.run_webhook.call_args.kwargs
+        check.equal(kwargs["url_path"], "hook")
+        check.equal(kwargs["webhook_url"], "https://example.com/hook")
+
+    def test_webhook_requires_url(self, mocker: MockerFixture, monkeypatch):
+        """Should refuse to register a webhook without public url."""
+        monkeypatch.setenv("BOT_MODE", "webhook")
+        monkeypatch.delenv("WEBHOOK_URL", raising=False)
+        application = mocker.MagicMock()
+        with pytest.raises(ValueError, match="WEBHOOK_URL"):
+            run_application(application, "123:secret")
+        application.run_webhook.assert_not_called()
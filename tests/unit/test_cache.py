@@ -0,0 +1,92 @@
+""" Unit tests for in-process caches. """
+
+import pytest_check as check
+from pytest_mock import MockerFixture
+
+from bot.cache import LRUCache, TTLCache
+from bot.database import (
+    TASKS_CACHE,
+    add_tasks,
+    close_database,
+    create_database,
+    get_project_tasks_dict,
+)
+
+
+class TestLRUCache:
+    """LRUCache"""
+
+    def test_hits_and_misses(self, mocker: MockerFixture):
+        """Should only compute values on misses and count them."""
+        cache = LRUCache()
+        compute = mocker.Mock(return_value="value")
+        check.equal(cache.get_or_compute("key", compute), "value")
+        check.equal(cache.get_or_compute("key", compute), "value")
+        check.equal(compute.call_count, 1)
+        check.equal(cache.info()["hits"], 1)
+        check.equal(cache.info()["misses"], 1)
+
+    def test_eviction(self):
+        """Should evict the least recently used entry when full."""
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get_or_compute("a", lambda: 0)
+        cache.set("c", 3)
+        check.equal(cache.get_or_compute("a", lambda: 0), 1)
+        check.equal(cache.get_or_compute("b", lambda: 0), 0)
+
+    def test_eviction_by_bytes(self):
+        """Should evict least recently used values beyond the total length."""
+        cache = LRUCache(maxbytes=10)
+        cache.set("a", b"x" * 4)
+        cache.set("b", b"x" * 4)
+        cache.get("a")
+        cache.set("c", b"x" * 4)
+        check.is_none(cache.get("b"))
+        check.equal(cache.info()["bytes"], 8)
+        cache.set("d", b"x" * 11)
+        check.is_none(cache.get("d"))
+        check.equal(cache.get("a"), b"x" * 4)
+        cache.invalidate("a")
+        check.equal(cache.info()["bytes"], 4)
+
+    def test_invalidate_during_compute(self):
+        """Should not store a value computed while its key was invalidated."""
+        cache = LRUCache()
+
+        def compute():
+            cache.invalidate("key")
+            return "stale"
+
+        cache.get_or_compute("key", compute)
+        check.equal(cache.get_or_compute("key", lambda: "fresh"), "fresh")
+
+
+def test_tasks_cache_invalidated_on_upload(tmpdir):
+    """Should serve cached tasks until new tasks are uploaded."""
+    db_path = tmpdir.join("tmp.db")
+    create_database(db_path)
+    add_tasks(db_path, "project", {"manger": {"poulet": 1}})
+    get_project_tasks_dict(db_path, "project")
+    hits = TASKS_CACHE.info()["hits"]
+    check.equal(get_project_tasks_dict(db_path, "project"), {"manger": {"poulet": 1}})
+    check.equal(TASKS_CACHE.info()["hits"], hits + 1)
+
+    add_tasks(db_path, "project", {"boire": {"eau": 1.5}})
+    check.equal(get_project_tasks_dict(db_path, "project"), {"boire": {"eau": 1.5}})
+    close_database(db_path)
+
+
+class TestTTLCache:
+    """TTLCache"""
+
+    def test_expiry(self, mocker: MockerFixture):
+        """Should compute values again once expired."""
+        monotonic = mocker.patch("bot.cache.time.monotonic", return_value=0)
+        cache = TTLCache(ttl=10)
+        check.equal(cache.get_or_compute("key", lambda: 1), 1)
+        monotonic.return_value = 5
+        check.equal(cache.get_or_compute("key", lambda: 2), 1)
+        monotonic.return_value = 11
+        check.equal(cache.get_or_compute("key", lambda: 3), 3)
@@ -0,0 +1,40 @@
+""" Unit tests for concurrent processing of updates. """
+
+import threading
+
+import pytest_check as check
+
+from bot.concurrency import ChatOrderedExecutor
+
+
+class TestChatOrderedExecutor:
+    """ChatOrderedExecutor"""
+
+    def test_ordered_within_chat(self):
+        """Should run updates of a same chat in their arrival order."""
+        executor = ChatOrderedExecutor(workers=4)
+        processed = []
+        for i in range(50):
+            executor.submit("chat", processed.append, i)
+        executor.shutdown()
+        check.equal(processed, list(range(50)))
+
+    def test_chats_not_blocked(self):
+        """Should process other chats while a chat is busy."""
+        executor = ChatOrderedExecutor(workers=2)
+        release = threading.Event()
+        other_done = threading.Event()
+        executor.submit("slow_chat", release.wait, 5)
+        executor.submit("other_chat", other_done.set)
+        check.is_true(other_done.wait(5))
+        release.set()
+        executor.shutdown()
+
+    def test_errors_do_not_stop_chat(self):
+        """Should keep processing a chat after an update failed."""
+        executor = ChatOrderedExecutor(workers=1)
+        processed = []
+        executor.submit("chat", lambda: 1 / 0)
+        executor.submit("chat", processed.append, "next")
+        executor.shutdown()
+        check.equal(processed, ["next"])
@@ -0,0 +1,325 @@
+""" Unit tests for the database module. """
+
+from datetime import datetime, timedelta
+import sqlite3
+import sys
+import threading
+
+import pandas as pd
+import pytest
+import pytest_check as check
+
+from bot.dataclasses import CompleteSession, Session
+from bot.database import (
+    INDEXES,
+    MIGRATIONS,
+    SELECT_SUMMARY,
+    Database,
+    add_complete_session,
+    add_tasks,
+    check_summaries,
+    close_database,
+    connect,
+    create_database,
+    get_project_tasks_subtree,
+    get_schema_version,
+    get_summary,
+    insert_req,
+    migrate_database,
+    rebuild_daily_rollup,
+    split_by_day,
+)
+from bot.dumps import get_table_columns, main as database_main
+
+# Schema of the databases created before versioned migrations.
+BASELINE_SCHEMA = (
+    """CREATE TABLE sessions (id INTEGER PRIMARY KEY, project TINYTEXT NOT_NULL,
+        task TINYTEXT, username TINYTEXT NOT_NULL, start DATETIME NOT_NULL,
+        stop DATETIME NOT_NULL, duration FLOAT NOT_NULL, start_comment TEXT,
+        stop_comment TEXT);""",
+    """CREATE TABLE projects (id INTEGER PRIMARY KEY, project TINYTEXT NOT_NULL,
+        tasks_dict TEXT);""",
+    """CREATE TABLE tasks (id INTEGER PRIMARY KEY, task TINYTEXT NOT_NULL,
+        project TINYTEXT NOT_NULL, workload FLOAT NOT_NULL);""",
+)
+
+
+class TestDatabase:
+    """Database"""
+
+    def test_connection_reused_in_thread(self, tmpdir):
+        """Should keep the same connection alive within a thread."""
+        database = Database(tmpdir.join("tmp.db"))
+        check.is_true(database.connection() is database.connection())
+        database.close()
+
+    def test_connection_per_thread(self, tmpdir):
+        """Should give each thread its own connection."""
+        database = Database(tmpdir.join("tmp.db"))
+        connections = []
+        thread = threading.Thread(
+            target=lambda: connections.append(database.connection())
+        )
+        thread.start()
+        thread.join()
+        check.is_false(connections[0] is database.connection())
+        database.close()
+
+    def test_wal_journal_mode(self, tmpdir):
+        """Should configure the connections in WAL journal mode."""
+        database = Database(tmpdir.join("tmp.db"))
+        mode = database.connection().execute("PRAGMA journal_mode;").fetchone()[0]
+        check.equal(mode, "wal")
+        database.close()
+
+
+class TestMigrations:
+    """create_database and migrate_database"""
+
+    def test_new_database_is_up_to_date(self, tmpdir):
+        """Should create a database at the latest schema version."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path)
+        check.equal(get_schema_version(connect(db_path)), len(MIGRATIONS))
+        close_database(db_path)
+
+    def test_summary_uses_index(self, tmpdir):
+        """Should not full-scan sessions to build a project summary."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path)
+        plan = connect(db_path).execute(
+            "EXPLAIN QUERY PLAN " + SELECT_SUMMARY, ("project",)
+        )
+        details = " ".join(row[-1] for row in plan)
+        check.is_in("USING", details)
+        check.is_not_in("SCAN sessions", details)
+        close_database(db_path)
+
+    def test_upgrade_legacy_database(self, tmpdir):
+        """Should upgrade in place a database created without indexes."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path, migrate=False)
+        with connect(db_path) as db:
+            db.execute(insert_req("projects"), ("project", "{'old': 1}"))
+            db.execute(insert_req("projects"), ("project", "{'new': 1}"))
+
+        migrate_database(db_path)
+        db = connect(db_path)
+        check.equal(get_schema_version(db), len(MIGRATIONS))
+        rows = db.execute("SELECT tasks_dict FROM projects;").fetchall()
+        check.equal(rows, [('{"new": 1}',)])
+        indexes = {
+            row[0]
+            for row in db.execute("SELECT name FROM sqlite_master WHERE type='index';")
+        }
+        for table_indexes in INDEXES.values():
+            for index in table_indexes:
+                check.is_in(index, indexes)
+        close_database(db_path)
+
+    def test_upgrade_baseline_database_cli(self, tmpdir, monkeypatch):
+        """Should upgrade a database of the first schema from the command line."""
+        db_path = str(tmpdir.join("legacy.db"))
+        db = sqlite3.connect(db_path)
+        with db:
+            for statement in BASELINE_SCHEMA:
+                db.execute(statement)
+            db.execute(
+                insert_req("sessions"),
+                (
+                    "project",
+                    None,
+                    "@user0",
+                    "2022-07-01 23:00:00",
+                    "2022-07-02 01:00:00",
+                    7200.0,
+                    None,
+                    None,
+                ),
+            )
+        db.close()
+
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            [
+                "bot.dumps",
+                "--path",
+                db_path,
+                "--dump-path",
+                str(tmpdir.join("dumps")),
+                "--migrate",
+            ],
+        )
+        database_main()
+        db = connect(db_path)
+        check.equal(get_schema_version(db), len(MIGRATIONS))
+        check.equal(
+            db.execute("SELECT project, username, duration FROM summaries;").fetchall(),
+            [("project", "@user0", 7200.0)],
+        )
+        check.equal(
+            db.execute(
+                "SELECT day, seconds FROM daily_rollup ORDER BY day;"
+            ).fetchall(),
+            [("2022-07-01", 3600.0), ("2022-07-02", 3600.0)],
+        )
+        close_database(db_path)
+
+    def test_upgrade_database_restored_by_pandas(self, tmpdir):
+        """Should upgrade a database restored from a dump by pandas to_sql."""
+        db_path = str(tmpdir.join("restored.db"))
+        tables = {
+            "sessions": pd.DataFrame(
+                {
+                    "project": ["project"],
+                    "task": [None],
+                    "username": ["@user0"],
+                    "start": ["2022-07-01 09:00:00"],
+                    "stop": ["2022-07-01 10:00:00"],
+                    "duration": [3600.0],
+                    "start_comment": ["start"],
+                    "stop_comment": ["stop"],
+                }
+            ),
+            "projects": pd.DataFrame(
+                {"project": ["project", "project"], "tasks_dict": ["{}", '{"new": 1}']}
+            ),
+            "tasks": pd.DataFrame(
+                {"task": ["new"], "project": ["project"], "workload": [1.0]}
+            ),
+        }
+        db = sqlite3.connect(db_path)
+        with db:
+            for table, table_df in tables.items():
+                table_df.to_sql(table, db)
+        db.close()
+
+        create_database(db_path)
+        db = connect(db_path)
+        check.equal(get_schema_version(db), len(MIGRATIONS))
+        check.equal(
+            db.execute("SELECT id, tasks_dict FROM projects;").fetchall(),
+            [(2, '{"new": 1}')],
+        )
+        check.equal(
+            db.execute("SELECT id, username, duration FROM sessions;").fetchall(),
+            [(1, "@user0", 3600.0)],
+        )
+        check.equal(
+            [row[1] for row in db.execute("PRAGMA table_info(tasks);")],
+            get_table_columns("tasks"),
+        )
+        check.equal(
+            get_summary(db_path, "project").values.tolist(), [["@user0", 3600.0]]
+        )
+        close_database(db_path)
+
+
+class TestSummaries:
+    """summaries aggregate table"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmpdir):
+        self.db_path = tmpdir.join("tmp.db")
+        create_database(self.db_path)
+        start = datetime(2022, 7, 1, 9)
+        for author, hours in (("@user0", 1), ("@user1", 2), ("@user0", 3)):
+            complete_session = CompleteSession(
+                Session(author, start), start + timedelta(hours=hours)
+            )
+            add_complete_session(self.db_path, "project", complete_session)
+        yield
+        close_database(self.db_path)
+
+    def test_summary_incremental(self):
+        """Should keep summaries up to date when adding sessions."""
+        summary = get_summary(self.db_path, "project")
+        check.equal(
+            [tuple(row) for row in summary.values],
+            [("@user0", 4 * 3600), ("@user1", 2 * 3600)],
+        )
+        check.equal(check_summaries(self.db_path), [])
+
+    def test_check_summaries_rebuild(self):
+        """Should detect and rebuild inconsistent summaries."""
+        with connect(self.db_path) as db:
+            db.execute("UPDATE summaries SET duration = 0 WHERE username = '@user1';")
+        check.equal(
+            check_summaries(self.db_path, rebuild=True), [("project", "@user1")]
+        )
+        check.equal(check_summaries(self.db_path), [])
+
+
+class TestDailyRollup:
+    """daily_rollup aggregate table"""
+
+    SELECT_ROLLUP = """SELECT username, task, day, seconds
+        FROM daily_rollup ORDER BY day, username;"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmpdir):
+        self.db_path = tmpdir.join("tmp.db")
+        create_database(self.db_path)
+        start = datetime(2022, 7, 1, 22)
+        sessions = (
+            ("@user0", start, 4, "poulet"),
+            ("@user0", start - timedelta(hours=12), 1, "poulet"),
+            ("@user1", start + timedelta(hours=10), 2, None),
+        )
+        for author, session_start, hours, task in sessions:
+            complete_session = CompleteSession(
+                Session(author, session_start, task=task),
+                session_start + timedelta(hours=hours),
+            )
+            add_complete_session(self.db_path, "project", complete_session)
+        yield
+        close_database(self.db_path)
+
+    def test_split_by_day(self):
+        """Should split periods at each midnight."""
+        start = datetime(2022, 7, 1, 23)
+        check.equal(
+            split_by_day(start, start + timedelta(hours=26)),
+            [("2022-07-01", 3600), ("2022-07-02", 86400), ("2022-07-03", 3600)],
+        )
+        check.equal(split_by_day(start, start), [])
+
+    def test_rollup_incremental(self):
+        """Should split sessions crossing midnight and sum those of a same day."""
+        rows = connect(self.db_path).execute(self.SELECT_ROLLUP).fetchall()
+        check.equal(
+            rows,
+            [
+                ("@user0", "poulet", "2022-07-01", 3 * 3600),
+                ("@user0", "poulet", "2022-07-02", 2 * 3600),
+                ("@user1", "", "2022-07-02", 2 * 3600),
+            ],
+        )
+
+    def test_rebuild_daily_rollup(self):
+        """Should rebuild the same rollup from sessions."""
+        db = connect(self.db_path)
+        rows = db.execute(self.SELECT_ROLLUP).fetchall()
+        with db:
+            db.execute("DELETE FROM daily_rollup;")
+        rebuild_daily_rollup(self.db_path)
+        check.equal(db.execute(self.SELECT_ROLLUP).fetchall(), rows)
+
+
+def test_get_project_tasks_subtree(tmpdir):
+    """Should fetch parts of a tasks structure."""
+    db_path = tmpdir.join("tmp.db")
+    create_database(db_path)
+    tasks = {"manger": {"poulet": 1, 'le "gateau"': 3}, "boire": {"eau": 1.5}}
+    add_tasks(db_path, "project", tasks)
+    check.equal(get_project_tasks_subtree(db_path, "project", []), tasks)
+    check.equal(
+        get_project_tasks_subtree(db_path, "project", ["manger"]), tasks["manger"]
+    )
+    check.equal(get_project_tasks_subtree(db_path, "project", ["boire", "eau"]), 1.5)
+    check.equal(
+        get_project_tasks_subtree(db_path, "project", ["manger", 'le "gateau"']), 3
+    )
+    check.is_none(get_project_tasks_subtree(db_path, "project", ["dormir"]))
+    close_database(db_path)
@@ -0,0 +1,98 @@
+""" Unit tests for the database dumps module. """
+
+import csv
+from datetime import datetime, timedelta
+import os
+
+import pytest
+import pytest_check as check
+
+from bot.dataclasses import CompleteSession, Session
+from bot.database import (
+    MIGRATIONS,
+    add_complete_session,
+    close_database,
+    connect,
+    create_database,
+    get_all,
+    get_schema_version,
+    get_summary,
+)
+from bot.dumps import (
+    create_database_from_xlsx,
+    dump_database,
+    get_table_columns,
+    load_database_dump,
+)
+
+
+class TestDump:
+    """dump_database"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmpdir):
+        self.tmpdir = tmpdir
+        self.db_path = tmpdir.join("tmp.db")
+        create_database(self.db_path)
+        start = datetime(2022, 7, 1, 9)
+        for hours in range(1, 8):
+            complete_session = CompleteSession(
+                Session("@user0", start, task="task"), start + timedelta(hours=hours)
+            )
+            add_complete_session(self.db_path, "project", complete_session)
+        yield
+        close_database(self.db_path)
+
+    def test_dump_csv(self):
+        """Should stream every row of every table to csv files."""
+        dump_path = dump_database(
+            self.db_path, self.tmpdir.join("dumps"), "csv", chunk_size=2
+        )
+        with open(os.path.join(dump_path, "sessions.csv"), encoding="utf-8") as file:
+            rows = list(csv.reader(file))
+        check.equal(rows[0], get_table_columns("sessions"))
+        check.equal(len(rows), 8)
+
+    def test_dump_xlsx_roundtrip(self):
+        """Should be able to load back a xlsx dump."""
+        dump_path = dump_database(
+            self.db_path, self.tmpdir.join("dumps"), "xlsx", chunk_size=2
+        )
+        loaded_path = self.tmpdir.join("loaded.db")
+        create_database_from_xlsx(dump_path, loaded_path)
+        check.equal(len(get_all(loaded_path, "sessions")), 7)
+        close_database(loaded_path)
+
+    def test_load_csv_dump(self):
+        """Should restore a csv dump with ids, column types and summaries."""
+        dump_path = dump_database(self.db_path, self.tmpdir.join("dumps"), "csv")
+        loaded_path = self.tmpdir.join("loaded.db")
+        load_database_dump(dump_path, loaded_path, chunk_size=3)
+        check.equal(
+            get_all(loaded_path, "sessions").values.tolist(),
+            get_all(self.db_path, "sessions").values.tolist(),
+        )
+        check.equal(
+            get_summary(loaded_path, "project").values.tolist(),
+            get_summary(self.db_path, "project").values.tolist(),
+        )
+        check.equal(get_schema_version(connect(loaded_path)), len(MIGRATIONS))
+        close_database(loaded_path)
+
+    @pytest.mark.parametrize("dump_format", ["xlsx", "csv"])
+    def test_empty_strings_kept(self, dump_format: str):
+        """Should restore empty strings and NULL as they were."""
+        start = datetime(2022, 7, 2, 9)
+        for comment in ("", '"', None):
+            complete_session = CompleteSession(
+                Session("@user1", start), start + timedelta(hours=1), comment
+            )
+            add_complete_session(self.db_path, "project", complete_session)
+        dump_path = dump_database(self.db_path, self.tmpdir.join("dumps"), dump_format)
+        loaded_path = self.tmpdir.join("loaded.db")
+        load_database_dump(dump_path, loaded_path)
+        comments = connect(loaded_path).execute(
+            "SELECT stop_comment FROM sessions ORDER BY id DESC LIMIT 3;"
+        )
+        check.equal([comment for comment, in comments], [None, '"', ""])
+        close_database(loaded_path)
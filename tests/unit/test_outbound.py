@@ -0,0 +1,178 @@
+""" Unit tests for rate limited outbound requests. """
+
+import time
+
+import pytest
+import pytest_check as check
+from pytest_mock import MockerFixture
+from telegram import Chat, InputFile
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import ExtBot
+
+from bot.handlers.show_data import _send_timeline
+from bot.handlers.utils import CAN_DELETE_CACHE
+from bot.outbound import OutboundQueue, QueuedBot, TokenBucket
+
+
+class TestTokenBucket:
+    """TokenBucket"""
+
+    def test_burst_then_rate(self):
+        """Should allow a burst, then one request per period."""
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = time.monotonic()
+        for _ in range(2):
+            check.equal(bucket.delay(now), 0)
+            bucket.consume(now)
+        check.almost_equal(bucket.delay(now), 0.5, abs=0.01)
+        check.equal(bucket.delay(now + 0.5), 0)
+
+    def test_block(self):
+        """Should give no token while blocked."""
+        bucket = TokenBucket(rate=10, capacity=1)
+        now = time.monotonic()
+        bucket.block(now + 3)
+        check.almost_equal(bucket.delay(now), 3, abs=0.01)
+        check.is_false(bucket.is_idle(now))
+        check.is_true(bucket.is_idle(now + 3))
+
+
+class TestOutboundQueue:
+    """OutboundQueue"""
+
+    def test_ordered_within_chat(self):
+        """Should send requests of a same chat in their submission order."""
+        queue = OutboundQueue(global_rate=1000, chat_rate=1000, burst=100)
+        sent = []
+        futures = [queue.submit(1, sent.append, i) for i in range(20)]
+        queue.close()
+        check.equal(sent, list(range(20)))
+        check.is_true(all(future.done() for future in futures))
+
+    def test_chat_rate(self):
+        """Should not send more than the burst at once in a chat."""
+        queue = OutboundQueue(global_rate=1000, chat_rate=10, burst=2)
+        start = time.monotonic()
+        futures = [queue.submit(1, time.monotonic) for _ in range(4)]
+        sent_at = [future.result(5) - start for future in futures]
+        queue.close()
+        check.less(sent_at[1], 0.05)
+        check.greater(sent_at[3], 0.15)
+
+    def test_chats_not_blocked(self):
+        """Should send to other chats while a chat is rate limited."""
+        queue = OutboundQueue(global_rate=1000, chat_rate=1, burst=1)
+        queue.submit(1, lambda: None).result(5)
+        start = time.monotonic()
+        queue.submit(1, lambda: None)
+        queue.submit(2, lambda: None).result(5)
+        check.less(time.monotonic() - start, 0.5)
+        queue.close(wait=False)
+
+    def test_retry_after(self):
+        """Should send again a request after the asked delay."""
+        queue = OutboundQueue(global_rate=1000, chat_rate=1000, burst=10)
+        calls = []
+
+        def flood():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter(0.2)
+            return "sent"
+
+        check.equal(queue.submit(1, flood).result(5), "sent")
+        check.greater_equal(calls[1] - calls[0], 0.2)
+        queue.close()
+
+    def test_retry_after_exhausted(self):
+        """Should give up after the maximum number of retries."""
+        queue = OutboundQueue(global_rate=1000, chat_rate=1000, retries=1)
+
+        def flood():
+            raise RetryAfter(0)
+
+        with pytest.raises(RetryAfter):
+            queue.submit(1, flood).result(5)
+        queue.close()
+
+    def test_closed(self):
+        """Should refuse requests once closed."""
+        queue = OutboundQueue()
+        queue.close()
+        with pytest.raises(RuntimeError):
+            queue.submit(1, print)
+
+
+class TestQueuedBot:
+    """QueuedBot"""
+
+    def test_delete_fire_and_forget(self, mocker: MockerFixture):
+        """Should not raise on failed deletes and forget the cached permission."""
+        mocker.patch.object(ExtBot, "delete_message", side_effect=BadRequest("Nope"))
+        queue = OutboundQueue()
+        bot = QueuedBot("123:token", queue=queue)
+        CAN_DELETE_CACHE.set(-42, True)
+        check.is_true(bot.delete_message(-42, 1))
+        queue.close()
+        check.is_none(CAN_DELETE_CACHE.get(-42))
+
+    def test_send_message(self, mocker: MockerFixture):
+        """Should return a future of the sent message."""
+        send = mocker.patch.object(ExtBot, "send_message", return_value="message")
+        queue = OutboundQueue()
+        bot = QueuedBot("123:token", queue=queue)
+        check.equal(bot.send_message(42, text="Hello").result(5), "message")
+        send.assert_called_once_with(42, text="Hello")
+        queue.close()
+
+    def test_send_not_blocking(self, mocker: MockerFixture):
+        """Should return at once even when the chat is rate limited."""
+        send = mocker.patch.object(ExtBot, "send_message")
+        queue = OutboundQueue(group_rate=1 / 60, burst=1)
+        bot = QueuedBot("123:token", queue=queue)
+        start = time.monotonic()
+        futures = [bot.send_message(-42, text=str(i)) for i in range(3)]
+        check.less(time.monotonic() - start, 0.5)
+        futures[0].result(5)
+        check.equal(send.call_count, 1)
+        queue.close(wait=False)
+
+    def test_delete_not_charged(self, mocker: MockerFixture):
+        """Should not spend the message budget of the chat on deletes."""
+        mocker.patch.object(ExtBot, "delete_message")
+        mocker.patch.object(ExtBot, "send_message", return_value="message")
+        queue = OutboundQueue(group_rate=1 / 60, burst=1)
+        bot = QueuedBot("123:token", queue=queue)
+        for message_id in range(3):
+            bot.delete_message(-42, message_id)
+        check.equal(bot.send_message(-42, text="Hello").result(5), "message")
+        queue.close()
+
+    def test_edits_queued(self, mocker: MockerFixture):
+        """Should send message edits through the queue of their chat."""
+        edit = mocker.patch.object(ExtBot, "edit_message_text", return_value="edited")
+        queue = OutboundQueue()
+        bot = QueuedBot("123:token", queue=queue)
+        future = bot.edit_message_text("Hi", chat_id=42, message_id=1)
+        check.equal(future.result(5), "edited")
+        edit.assert_called_once_with("Hi", chat_id=42, message_id=1)
+        queue.close()
+
+    def test_document_retried_whole(self, mocker: MockerFixture):
+        """Should send the whole timeline again after a flood limit."""
+        contents = []
+
+        def send_document(chat_id, document, filename):
+            contents.append(InputFile(document, filename=filename).input_file_content)
+            if len(contents) == 1:
+                raise RetryAfter(0)
+            return "document"
+
+        mocker.patch.object(ExtBot, "send_document", side_effect=send_document)
+        queue = OutboundQueue()
+        bot = QueuedBot("123:token", queue=queue)
+        chat = Chat(42, "private")
+        future = _send_timeline(bot, chat, b"<html></html>", "timeline.html")()
+        check.equal(future.result(5), "document")
+        check.equal(contents, [b"<html></html>", b"<html></html>"])
+        queue.close()
@@ -0,0 +1,52 @@
+""" Unit tests for the startup time of the bot. """
+
+import json
+import subprocess
+import sys
+
+import pytest_check as check
+
+HEAVY_MODULES = ("pandas", "plotly", "openpyxl")
+
+MEASURE_IMPORT = """
+import json, sys, time
+start = time.perf_counter()
+{statements}
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(*statements: str) -> dict:
+    """Run statements in a fresh interpreter and report time and heavy modules."""
+    code = MEASURE_IMPORT.format(statements="\n".join(statements), heavy=HEAVY_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class TestStartup:
+    """Startup"""
+
+    def test_handlers_import_lightweight(self):
+        """Should serve commands without loading the analytics stack."""
+        startup = measure("import bot.handlers", "import bot.concurrency")
+        print(f"bot.handlers imported in {startup['seconds']:.3f}s")
+        check.equal(startup["loaded"], [])
+
+    def test_handlers_import_faster_than_analytics(self):
+        """Should start faster than it takes to load the analytics stack."""
+        startup = measure("import bot.handlers")
+        analytics = measure(
+            "import bot.handlers", "import pandas", "import plotly.express"
+        )
+        check.less(startup["seconds"], analytics["seconds"])
+
+    def test_warm_up(self):
+        """Should load the analytics stack once warmed up."""
+        warm = measure("from bot.handlers.show_data import warm_up", "warm_up()")
+        check.is_in("pandas", warm["loaded"])
+        check.is_in("plotly", warm["loaded"])
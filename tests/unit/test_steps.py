@@ -0,0 +1,103 @@
+""" Unit tests for the steps shared by both runtimes. """
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+import threading
+
+import pytest_check as check
+
+from bot.steps import blocking, run_steps, run_steps_async, spawn, sync_steps, wait
+
+
+class Failure(Exception):
+    """Error raised by a fake request."""
+
+
+def fail():
+    raise Failure()
+
+
+def thread_name() -> str:
+    return threading.current_thread().name
+
+
+@sync_steps
+def greet(name: str):
+    try:
+        yield fail
+    except Failure:
+        name = name.upper()
+    thread = yield blocking(thread_name)
+    return f"Hello {name} from {thread}"
+
+
+class TestRunSteps:
+    """run_steps"""
+
+    def test_errors_thrown_back(self):
+        """Should throw errors of steps back into the handler and return its value."""
+        check.equal(greet("user0"), f"Hello USER0 from {thread_name()}")
+
+    def test_spawn(self):
+        """Should run spawned steps in the background and give their future."""
+        rendered: Future = Future()
+
+        def deliver():
+            timeline = yield wait(rendered)
+            return timeline
+
+        def handle():
+            delivered = yield spawn(deliver())
+            return delivered
+
+        delivered = run_steps(handle())
+        check.is_false(delivered.done())
+        rendered.set_result("timeline")
+        check.equal(delivered.result(5), "timeline")
+
+
+class TestRunStepsAsync:
+    """run_steps_async"""
+
+    def test_blocking_steps_in_executor(self):
+        """Should await requests on the loop and only run blocking steps in threads."""
+        executor = ThreadPoolExecutor(1, thread_name_prefix="Blocking")
+        threads = []
+
+        async def request():
+            threads.append(thread_name())
+            return "sent"
+
+        def handle():
+            yield from greet.steps("user0")
+            sent = yield request
+            threads.append((yield blocking(thread_name)))
+            answer = yield partial(str, "answered")
+            return sent, answer
+
+        result = asyncio.run(run_steps_async(handle(), executor))
+        executor.shutdown()
+        check.equal(result, ("sent", "answered"))
+        check.equal(threads[0], thread_name())
+        check.is_true(threads[1].startswith("Blocking"))
+
+    def test_spawn(self):
+        """Should run spawned steps in a task and wait for futures on the loop."""
+        rendered: Future = Future()
+
+        def deliver():
+            timeline = yield wait(rendered)
+            return timeline
+
+        def handle():
+            delivered = yield spawn(deliver())
+            return delivered
+
+        async def main():
+            delivered = await run_steps_async(handle())
+            check.is_false(delivered.done())
+            rendered.set_result("timeline")
+            return await delivered
+
+        check.equal(asyncio.run(main()), "timeline")
@@ -0,0 +1,45 @@
+""" Unit tests for tasks management. """
+
+import pytest_check as check
+
+from bot.tasks import TaskNavigator
+
+
+class TestTaskNavigator:
+    """TaskNavigator"""
+
+    tasks = {
+        "manger": {"poulet": 1, "pates": 2},
+        "boire": {"eau": 1.5, "alcools": {"rhum": 7.5}},
+    }
+
+    def test_unique_ids(self):
+        """Should give a distinct id to every task."""
+        navigator = TaskNavigator(self.tasks)
+        check.equal(len(navigator.nodes), 7)
+        names = [name for name, _ in navigator.nodes.values()]
+        check.equal(sorted(names), sorted(set(names)))
+
+    def test_stable_ids(self):
+        """Should give the same ids to the same structure of tasks."""
+        check.equal(
+            TaskNavigator(self.tasks).nodes, TaskNavigator(dict(self.tasks)).nodes
+        )
+
+    def test_ids_kept_on_insertion(self):
+        """Should keep the ids of tasks when other tasks are added before them."""
+        navigator = TaskNavigator(self.tasks)
+        updated = TaskNavigator({"dormir": 8, **self.tasks})
+        for node_id, (name, _) in navigator.nodes.items():
+            check.equal(updated.resolve(node_id)[0], name)
+        check.equal(len(updated.nodes), len(navigator.nodes) + 1)
+
+    def test_navigation(self):
+        """Should resolve the tasks of each layer from their ids."""
+        navigator = TaskNavigator(self.tasks)
+        options = dict(navigator.options())
+        check.equal(list(options), ["manger", "boire"])
+        name, subtasks = navigator.resolve(options["boire"])
+        check.equal((name, subtasks), ("boire", self.tasks["boire"]))
+        options = dict(navigator.options(options["boire"]))
+        check.equal(navigator.resolve(options["eau"]), ("eau", 1.5))
@@ -0,0 +1,130 @@
+""" Unit tests for the background session writer. """
+
+from datetime import datetime, timedelta
+import threading
+
+import pytest_check as check
+from pytest_mock import MockerFixture
+
+from bot.dataclasses import CompleteSession, Session
+from bot.database import (
+    add_complete_session,
+    close_database,
+    create_database,
+    get_summary,
+)
+from bot.state import OpenSessionsStore, ProjectsState, get_open_sessions
+from bot.writer import SessionWriter
+
+
+def _complete_session(hours: int) -> CompleteSession:
+    start = datetime(2022, 7, 1, 9)
+    return CompleteSession(Session("@user0", start), start + timedelta(hours=hours))
+
+
+class TestSessionWriter:
+    """SessionWriter"""
+
+    def test_group_commit(self, mocker: MockerFixture, tmpdir):
+        """Should write queued sessions in group commits once flushed."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path)
+        writer = SessionWriter(db_path, max_batch_size=10)
+        write = mocker.patch("bot.writer.add_complete_sessions")
+        for hours in range(1, 4):
+            writer.submit("project", _complete_session(hours))
+        writer.flush()
+        written = [session for call in write.call_args_list for session in call.args[1]]
+        check.equal(len(written), 3)
+        check.less_equal(write.call_count, 3)
+        writer.close()
+        close_database(db_path)
+
+    def test_flush_ignores_later_writes(self, mocker: MockerFixture, tmpdir):
+        """Should only wait for the sessions queued before the flush."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path)
+        writer = SessionWriter(db_path, max_batch_size=1)
+        gate, release = threading.Event(), threading.Event()
+        waits, written = {"gate": gate, "later": release}, []
+
+        def write(_, batch):
+            project = batch[0][0]
+            if project in waits:
+                waits[project].wait(5)
+            written.append(project)
+
+        mocker.patch("bot.writer.add_complete_sessions", side_effect=write)
+        writer.submit("gate", _complete_session(1))
+        writer.submit("first", _complete_session(1))
+
+        def submit_later():
+            writer.submit("later", _complete_session(1))
+            gate.set()
+
+        threading.Timer(0.05, submit_later).start()
+        writer.flush()
+        check.equal(written, ["gate", "first"])
+        release.set()
+        writer.close()
+        check.equal(written, ["gate", "first", "later"])
+        close_database(db_path)
+
+    def test_attached_writer(self, tmpdir):
+        """Should route added sessions through the writer and flush before reads."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path)
+        writer = SessionWriter(db_path).attach()
+        add_complete_session(db_path, "project", _complete_session(2))
+        summary = get_summary(db_path, "project")
+        check.equal(summary.values.tolist(), [["@user0", 2 * 3600]])
+        writer.close()
+        close_database(db_path)
+
+    def test_close_flushes(self, tmpdir):
+        """Should commit queued sessions when closed."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path)
+        writer = SessionWriter(db_path).attach()
+        add_complete_session(db_path, "project", _complete_session(1))
+        writer.close()
+        check.equal(len(get_summary(db_path, "project")), 1)
+        close_database(db_path)
+
+    def test_failed_batch_spilled(self, mocker: MockerFixture, tmpdir):
+        """Should keep sessions that could not be written and replay them."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path)
+        writer = SessionWriter(db_path, retries=0)
+        mocker.patch("bot.writer.add_complete_sessions", side_effect=OSError)
+        critical = mocker.patch("bot.writer.LOGGER.critical")
+        writer.submit("project", _complete_session(3))
+        writer.close()
+        critical.assert_called_once()
+        check.equal(len(tmpdir.join("tmp.db.failed.jsonl").readlines()), 1)
+
+        mocker.stopall()
+        writer = SessionWriter(db_path).attach()
+        check.equal(writer.replay_failed(), 1)
+        summary = get_summary(db_path, "project")
+        check.equal(summary.values.tolist(), [["@user0", 3 * 3600]])
+        check.is_false(tmpdir.join("tmp.db.failed.jsonl").exists())
+        writer.close()
+        close_database(db_path)
+
+    def test_open_session_deleted_with_complete(self, tmpdir):
+        """Should delete the open session when its complete session is written."""
+        db_path = tmpdir.join("tmp.db")
+        create_database(db_path)
+        writer = SessionWriter(db_path).attach()
+        workers = ProjectsState(OpenSessionsStore(db_path))
+        complete_session = _complete_session(1)
+        workers["project"] = {"@user0": complete_session.session}
+        session = workers["project"].discard("@user0")
+        add_complete_session(
+            db_path, "project", CompleteSession(session, complete_session.stop)
+        )
+        writer.close()
+        check.equal(get_open_sessions(db_path), {})
+        check.equal(len(get_summary(db_path, "project")), 1)
+        close_database(db_path)